@@ -13,6 +13,18 @@
 
 '''
 import secrets
+from functools import lru_cache
+import batch
+import bitslice
+import block_modes
+import engines
+import instrumentation
+import key_check
+import nonces
+import numpy_backend
+import pipeline
+import prefetch
+import progress as progress_reports
 PAD_BYTE = bytearray(1)[0]
 ROUND_KEY_LENGTHS = {
     128 : (4, 11),
@@ -333,7 +345,9 @@ MODES = {
     "OFB" : do_OFB
 }
 
-def aes_encrypt(plaintext, key=None, mode="ECB", IV=None, ransom=False):
+@key_check.checked("aes")
+@instrumentation.instrumented("aes", "encrypt")
+def aes_encrypt(plaintext, key=None, mode="ECB", IV=None, ransom=False, engine=None, progress=None):
     '''
         Function which encrypts a plaintext using the AES algorithm.
 
@@ -347,12 +361,22 @@ def aes_encrypt(plaintext, key=None, mode="ECB", IV=None, ransom=False):
                                     ECB
             IV          (str)    - 128-bit hexadecimal string that must be given if
                                     mode is CBC or CTR
+            engine      (str)    - Name of the engine to use (see ENGINES).
+                                    Defaults to ENGINE
+            check       (bool)   - Whether the ciphertext carries a key check
+                                    header (see key_check). Default is False
+            progress    (callable) - Optional callback called with the bytes
+                                    done, the bytes in total and the current and
+                                    average MB/s (see progress)
         Returns:
             cipher_hex  (str)    - The ciphertext in a hexadecimal string
             key         (str)    - The key used as a hexadecimal string
             IV          (str)    - The initialisation vector used, as a hexadecimal
                                     string. Is None if no IV given
     '''
+    engine = engines.resolve("aes", engine, ENGINE, mode, instrumentation.payload_size(plaintext, False))
+    if engine != "reference":
+        return engine_encrypt(ENGINES[engine], plaintext, key, mode, IV, ransom, progress)
     if ransom:
         plaintext_bytes = plaintext
     else:
@@ -362,7 +386,7 @@ def aes_encrypt(plaintext, key=None, mode="ECB", IV=None, ransom=False):
 
     # Handle key generation
     if not key:
-        key = bytearray(secrets.token_bytes(16))    # 128-bits
+        key = bytearray(nonces.token_bytes(16))    # 128-bits
         key_length = 32
     else:
         key_length = len(key)
@@ -371,7 +395,7 @@ def aes_encrypt(plaintext, key=None, mode="ECB", IV=None, ransom=False):
     key = bytearray_to_bitarray(key)
 
     if not IV:
-        IV = bytearray(secrets.token_bytes(16))     # 128-bits
+        IV = bytearray(nonces.token_bytes(16))     # 128-bits
     else:
         # Convert IV hexadeimal to binary bytes
         IV = bytearray.fromhex(IV)
@@ -387,6 +411,7 @@ def aes_encrypt(plaintext, key=None, mode="ECB", IV=None, ransom=False):
         plaintext_bytes.append(PAD_BYTE)
     plaintext_bytes.append(to_pad // 8)
     plaintext_bytes = bytearray_to_bitarray(plaintext_bytes)
+    tracker = progress_reports.tracker(progress, len(plaintext_bytes) // 8, 16)
     
     # Encrypt plaintext in 128-bit blocks
     ciphertext = ""
@@ -394,6 +419,8 @@ def aes_encrypt(plaintext, key=None, mode="ECB", IV=None, ransom=False):
         plaintext_block = plaintext_bytes[i * 128 : (i + 1) * 128]
         cipherblock, IV = MODES[mode](plaintext_block, key, IV, i, decrypt=False)
         ciphertext += cipherblock
+        if tracker is not None:
+            tracker.advance(16)
     key = f"{bitarray_to_int(key):02x}"
     if len(key) != key_length:
         key = (key_length - len(key)) * "0" + key
@@ -403,7 +430,9 @@ def aes_encrypt(plaintext, key=None, mode="ECB", IV=None, ransom=False):
         initial_IV = (32 - len(initial_IV)) * "0" + initial_IV
     return ciphertext, key, initial_IV
 
-def aes_decrypt(ciphertext, key, mode="ECB", IV=None, ransom=False):
+@key_check.checked("aes", decrypt=True)
+@instrumentation.instrumented("aes", "decrypt")
+def aes_decrypt(ciphertext, key, mode="ECB", IV=None, ransom=False, engine=None, progress=None):
     '''
         Function which decrypts a ciphertext using the AES algorithm.
 
@@ -416,9 +445,20 @@ def aes_decrypt(ciphertext, key, mode="ECB", IV=None, ransom=False):
                                     ECB
             IV          (str)    - 64-bit hexadecimal string that must be given if
                                     mode is CBC or CTR.
+            engine      (str)    - Name of the engine to use (see ENGINES).
+                                    Defaults to ENGINE
+            check       (bool)   - Whether the ciphertext carries a key check
+                                    header (see key_check). Default is False
+            progress    (callable) - Optional callback called with the bytes
+                                    done, the bytes in total and the current and
+                                    average MB/s (see progress)
         Returns:
             plaintext   (str)    - The plaintext in unicode
     '''
+    engine = engines.resolve("aes", engine, ENGINE, mode, instrumentation.payload_size(ciphertext, not ransom),
+                             decrypt=True)
+    if engine != "reference":
+        return engine_decrypt(ENGINES[engine], ciphertext, key, mode, IV, ransom, progress)
     plaintext = ""
 
     # Unpack output data
@@ -430,11 +470,14 @@ def aes_decrypt(ciphertext, key, mode="ECB", IV=None, ransom=False):
     key = bytearray_to_bitarray(bytearray.fromhex(key))
     if IV:
         IV = bytearray_to_bitarray(bytearray.fromhex(IV))
+    tracker = progress_reports.tracker(progress, len(cipher_bytes), 16)
 
     for i in range(len(cipher_bits) // 128):
         cipher_block = cipher_bits[i * 128 : (i + 1) * 128]
         plainblock, IV = MODES[mode](cipher_block, key, IV, i, decrypt=True)
         plaintext += plainblock
+        if tracker is not None:
+            tracker.advance(16)
 
     # Strip padding
     to_remove = int(plaintext[-2:], 16) * 2
@@ -729,6 +772,411 @@ def undo_aes(ciphertext, key, *args):
     #     print()
     return matrix_to_hexstring(state)
 
+# ------------------------------------------------------------------------------
+#   Table engine
+#
+#   Works on 32-bit words rather than bit lists: SubBytes, ShiftRows and
+#   MixColumns are folded into four 256-entry lookup tables (T-tables) and the
+#   key schedule is expanded once per key. verify.py checks it against the
+#   bit-list do_aes and undo_aes above.
+# ------------------------------------------------------------------------------
+
+SBOX_FLAT = [S_BOX[i >> 4][i & 15] for i in range(256)]
+INV_SBOX_FLAT = [INV_S_BOX[i >> 4][i & 15] for i in range(256)]
+
+def xtime(byte):
+    '''
+        Function which multiplies a byte by 2 in GF(2^8)
+    '''
+    byte <<= 1
+    return byte ^ 0x11b if byte & 0x100 else byte
+
+def rotate_word(word, n):
+    '''
+        Function which circularly rotates a 32-bit word to the right <n> bits
+    '''
+    return ((word >> n) | (word << (32 - n))) & 0xffffffff
+
+T0 = [(xtime(s) << 24) | (s << 16) | (s << 8) | (xtime(s) ^ s) for s in SBOX_FLAT]
+T1 = [rotate_word(t, 8) for t in T0]
+T2 = [rotate_word(t, 16) for t in T0]
+T3 = [rotate_word(t, 24) for t in T0]
+# Inverse T-tables: InvSubBytes followed by InvMixColumns of a single byte
+TD0 = [(MULT_TABLE_14[s] << 24) | (MULT_TABLE_9[s] << 16) | (MULT_TABLE_13[s] << 8) | MULT_TABLE_11[s]
+       for s in INV_SBOX_FLAT]
+TD1 = [rotate_word(t, 8) for t in TD0]
+TD2 = [rotate_word(t, 16) for t in TD0]
+TD3 = [rotate_word(t, 24) for t in TD0]
+
+def inv_mix_word(word):
+    '''
+        Function which applies InvMixColumns to a single 32-bit column
+    '''
+    a0, a1, a2, a3 = word >> 24, (word >> 16) & 0xff, (word >> 8) & 0xff, word & 0xff
+    return  ((MULT_TABLE_14[a0] ^ MULT_TABLE_11[a1] ^ MULT_TABLE_13[a2] ^ MULT_TABLE_9[a3]) << 24) | \
+            ((MULT_TABLE_9[a0] ^ MULT_TABLE_14[a1] ^ MULT_TABLE_11[a2] ^ MULT_TABLE_13[a3]) << 16) | \
+            ((MULT_TABLE_13[a0] ^ MULT_TABLE_9[a1] ^ MULT_TABLE_14[a2] ^ MULT_TABLE_11[a3]) << 8) | \
+            (MULT_TABLE_11[a0] ^ MULT_TABLE_13[a1] ^ MULT_TABLE_9[a2] ^ MULT_TABLE_14[a3])
+
+def decryption_keys(round_keys):
+    '''
+        Function which derives the round key words of the equivalent inverse
+        cipher: the round keys in reverse order, with InvMixColumns applied to
+        all but the first and last
+    '''
+    rounds = len(round_keys) // 4 - 1
+    keys = []
+    for r in range(rounds, -1, -1):
+        words = round_keys[4 * r : 4 * (r + 1)]
+        keys += words if r in (0, rounds) else [inv_mix_word(word) for word in words]
+    return keys
+
+def expand_key(key):
+    '''
+        Function which expands a 16/24/32 byte key into the flat list of 32-bit
+        round key words
+    '''
+    key_words, rounds = ROUND_KEY_LENGTHS[len(key) * 8]
+    words = [int.from_bytes(key[4 * i : 4 * (i + 1)], 'big') for i in range(key_words)]
+    for i in range(key_words, 4 * rounds):
+        word = words[i - 1]
+        if i % key_words == 0:
+            word = rotate_word(word, 24)
+            word = (SBOX_FLAT[word >> 24] << 24) | (SBOX_FLAT[(word >> 16) & 0xff] << 16) | \
+                   (SBOX_FLAT[(word >> 8) & 0xff] << 8) | SBOX_FLAT[word & 0xff]
+            word ^= ROUND_CONSTANTS[i // key_words - 1] << 24
+        elif key_words > 6 and i % key_words == 4:
+            word = (SBOX_FLAT[word >> 24] << 24) | (SBOX_FLAT[(word >> 16) & 0xff] << 16) | \
+                   (SBOX_FLAT[(word >> 8) & 0xff] << 8) | SBOX_FLAT[word & 0xff]
+        words.append(words[i - key_words] ^ word)
+    return words
+
+class AESContext:
+    '''
+        Class which holds an expanded AES key and encrypts/decrypts single
+        128-bit blocks given as integers
+    '''
+    def __init__(self, key):
+        self.key = bytes(key)
+        self.round_keys = expand_key(self.key)
+        self.rounds = len(self.round_keys) // 4 - 1
+        self.decrypt_keys = decryption_keys(self.round_keys)
+
+    def encrypt_block(self, block):
+        '''
+            Function which encrypts a 128-bit integer block
+        '''
+        rk = self.round_keys
+        s0 = (block >> 96) ^ rk[0]
+        s1 = ((block >> 64) & 0xffffffff) ^ rk[1]
+        s2 = ((block >> 32) & 0xffffffff) ^ rk[2]
+        s3 = (block & 0xffffffff) ^ rk[3]
+        for k in range(4, 4 * self.rounds, 4):
+            s0, s1, s2, s3 = \
+                T0[s0 >> 24] ^ T1[(s1 >> 16) & 0xff] ^ T2[(s2 >> 8) & 0xff] ^ T3[s3 & 0xff] ^ rk[k], \
+                T0[s1 >> 24] ^ T1[(s2 >> 16) & 0xff] ^ T2[(s3 >> 8) & 0xff] ^ T3[s0 & 0xff] ^ rk[k + 1], \
+                T0[s2 >> 24] ^ T1[(s3 >> 16) & 0xff] ^ T2[(s0 >> 8) & 0xff] ^ T3[s1 & 0xff] ^ rk[k + 2], \
+                T0[s3 >> 24] ^ T1[(s0 >> 16) & 0xff] ^ T2[(s1 >> 8) & 0xff] ^ T3[s2 & 0xff] ^ rk[k + 3]
+
+        # Final round has no MixColumns
+        k = 4 * self.rounds
+        s = SBOX_FLAT
+        return  (((s[s0 >> 24] << 24) | (s[(s1 >> 16) & 0xff] << 16) | (s[(s2 >> 8) & 0xff] << 8) | s[s3 & 0xff]) ^ rk[k]) << 96 | \
+                (((s[s1 >> 24] << 24) | (s[(s2 >> 16) & 0xff] << 16) | (s[(s3 >> 8) & 0xff] << 8) | s[s0 & 0xff]) ^ rk[k + 1]) << 64 | \
+                (((s[s2 >> 24] << 24) | (s[(s3 >> 16) & 0xff] << 16) | (s[(s0 >> 8) & 0xff] << 8) | s[s1 & 0xff]) ^ rk[k + 2]) << 32 | \
+                (((s[s3 >> 24] << 24) | (s[(s0 >> 16) & 0xff] << 16) | (s[(s1 >> 8) & 0xff] << 8) | s[s2 & 0xff]) ^ rk[k + 3])
+
+    def decrypt_block(self, block):
+        '''
+            Function which decrypts a 128-bit integer block using the
+            equivalent inverse cipher (FIPS-197 section 5.3.5)
+        '''
+        dk = self.decrypt_keys
+        s0 = (block >> 96) ^ dk[0]
+        s1 = ((block >> 64) & 0xffffffff) ^ dk[1]
+        s2 = ((block >> 32) & 0xffffffff) ^ dk[2]
+        s3 = (block & 0xffffffff) ^ dk[3]
+        for k in range(4, 4 * self.rounds, 4):
+            s0, s1, s2, s3 = \
+                TD0[s0 >> 24] ^ TD1[(s3 >> 16) & 0xff] ^ TD2[(s2 >> 8) & 0xff] ^ TD3[s1 & 0xff] ^ dk[k], \
+                TD0[s1 >> 24] ^ TD1[(s0 >> 16) & 0xff] ^ TD2[(s3 >> 8) & 0xff] ^ TD3[s2 & 0xff] ^ dk[k + 1], \
+                TD0[s2 >> 24] ^ TD1[(s1 >> 16) & 0xff] ^ TD2[(s0 >> 8) & 0xff] ^ TD3[s3 & 0xff] ^ dk[k + 2], \
+                TD0[s3 >> 24] ^ TD1[(s2 >> 16) & 0xff] ^ TD2[(s1 >> 8) & 0xff] ^ TD3[s0 & 0xff] ^ dk[k + 3]
+
+        # Final round has no InvMixColumns
+        k = 4 * self.rounds
+        s = INV_SBOX_FLAT
+        return  (((s[s0 >> 24] << 24) | (s[(s3 >> 16) & 0xff] << 16) | (s[(s2 >> 8) & 0xff] << 8) | s[s1 & 0xff]) ^ dk[k]) << 96 | \
+                (((s[s1 >> 24] << 24) | (s[(s0 >> 16) & 0xff] << 16) | (s[(s3 >> 8) & 0xff] << 8) | s[s2 & 0xff]) ^ dk[k + 1]) << 64 | \
+                (((s[s2 >> 24] << 24) | (s[(s1 >> 16) & 0xff] << 16) | (s[(s0 >> 8) & 0xff] << 8) | s[s3 & 0xff]) ^ dk[k + 2]) << 32 | \
+                (((s[s3 >> 24] << 24) | (s[(s2 >> 16) & 0xff] << 16) | (s[(s1 >> 8) & 0xff] << 8) | s[s0 & 0xff]) ^ dk[k + 3])
+
+    def encrypt_into(self, source, destination, mode="ECB", IV=None):
+        '''
+            Function which encrypts the buffer <source> into the writable
+            buffer <destination> (which may be <source> itself) and returns
+            the number of bytes written. See block_modes.run_mode_into.
+        '''
+        return block_modes.run_mode_into(self, mode, source, destination, IV, 16)
+
+    def decrypt_into(self, source, destination, mode="ECB", IV=None):
+        '''
+            Function which decrypts the buffer <source> into the writable
+            buffer <destination> (which may be <source> itself) and returns
+            the number of bytes written. See block_modes.run_mode_into.
+        '''
+        return block_modes.run_mode_into(self, mode, source, destination, IV, 16, decrypt=True)
+
+@lru_cache(maxsize=64)
+def aes_context(key):
+    '''
+        Function which returns the (cached) AESContext for a key given as bytes
+    '''
+    return AESContext(key)
+
+@lru_cache(maxsize=16)
+def aes_bitsliced(key):
+    '''
+        Function which returns the (cached) bitsliced cipher for a key given
+        as bytes
+    '''
+    return bitslice.BitslicedAES(aes_context(key).round_keys)
+
+@lru_cache(maxsize=16)
+def aes_numpy(key):
+    '''
+        Function which returns the (cached) NumPy cipher for a key given as
+        bytes
+    '''
+    return numpy_backend.NumpyAES(aes_context(key).round_keys, SBOX_FLAT, INV_SBOX_FLAT)
+
+def table_cipher(key, mode, IV, data, decrypt=False):
+    '''
+        Function which runs the given mode over <data> using the T-table cipher
+    '''
+    with instrumentation.timed("aes", "key_setup"):
+        context = aes_context(key)
+    with instrumentation.timed("aes", "cipher", len(data) // 16):
+        return block_modes.run_mode(context, mode, data, IV, 16, decrypt=decrypt)
+
+def batch_cipher(batch, key, mode, IV, data, decrypt=False):
+    '''
+        Function which runs the parallelisable modes over <data> using the
+        batch cipher returned by <batch>(key), and the other modes using the
+        T-table cipher
+    '''
+    if not block_modes.is_parallel(mode, decrypt):
+        return table_cipher(key, mode, IV, data, decrypt=decrypt)
+    with instrumentation.timed("aes", "key_setup"):
+        cipher = batch(bytes(key))
+    with instrumentation.timed("aes", "cipher", len(data) // 16):
+        return block_modes.run_parallel(cipher, mode, data, IV, 16, decrypt=decrypt)
+
+def bitslice_engine(key, mode, IV, data, decrypt=False):
+    '''
+        Engine which runs the parallelisable modes using the bitsliced cipher
+    '''
+    return batch_cipher(aes_bitsliced, key, mode, IV, data, decrypt=decrypt)
+
+def numpy_engine(key, mode, IV, data, decrypt=False):
+    '''
+        Engine which runs the parallelisable modes using the NumPy cipher
+    '''
+    return batch_cipher(aes_numpy, key, mode, IV, data, decrypt=decrypt)
+
+def table_engine(key, mode, IV, data, decrypt=False):
+    '''
+        Engine which runs the given mode over <data> using the T-table cipher
+    '''
+    return table_cipher(key, mode, IV, data, decrypt=decrypt)
+
+def prepare_encrypt(plaintext, key, IV, ransom):
+    '''
+        Function which handles key/IV generation and padding before an
+        engine, mirroring aes_encrypt. Returns the padded plaintext, key and
+        IV as bytes.
+    '''
+    with instrumentation.timed("aes", "encode", len(plaintext)):
+        plaintext_bytes = bytes(plaintext) if ransom else plaintext.encode('utf-8')
+    key = nonces.token_bytes(16) if not key else bytes.fromhex(key)
+    IV = nonces.token_bytes(16) if not IV else bytes.fromhex(IV)
+    with instrumentation.timed("aes", "padding"):
+        plaintext_bytes = block_modes.pad(plaintext_bytes, 16)
+    return plaintext_bytes, key, IV
+
+def finish_decrypt(plaintext, ransom):
+    '''
+        Function which removes the padding of a decrypted message and decodes
+        it, mirroring aes_decrypt
+    '''
+    with instrumentation.timed("aes", "padding"):
+        plaintext = block_modes.unpad(plaintext)
+    if not ransom:
+        with instrumentation.timed("aes", "decode", len(plaintext)):
+            return plaintext.decode('utf-8').rstrip('\x00')
+    return plaintext
+
+def engine_encrypt(engine, plaintext, key, mode, IV, ransom, progress=None):
+    '''
+        Function which handles key/IV generation, padding and output
+        formatting around an engine, mirroring aes_encrypt
+    '''
+    plaintext_bytes, key, IV = prepare_encrypt(plaintext, key, IV, ransom)
+    if progress is None:
+        ciphertext = engine(key, mode, IV, plaintext_bytes)
+    else:
+        ciphertext = progress_reports.transform(engine, key, mode, IV, plaintext_bytes, 16, progress)
+    with instrumentation.timed("aes", "encode", len(ciphertext)):
+        ciphertext = ciphertext.hex()
+    return ciphertext, key.hex(), IV.hex()
+
+def engine_decrypt(engine, ciphertext, key, mode, IV, ransom, progress=None):
+    '''
+        Function which handles input parsing and padding removal around an
+        engine, mirroring aes_decrypt
+    '''
+    with instrumentation.timed("aes", "decode", len(ciphertext)):
+        cipher_bytes = bytes(ciphertext) if ransom else bytes.fromhex(ciphertext)
+    IV = bytes.fromhex(IV) if IV else None
+    if progress is None:
+        plaintext = engine(bytes.fromhex(key), mode, IV, cipher_bytes, decrypt=True)
+    else:
+        plaintext = progress_reports.transform(engine, bytes.fromhex(key), mode, IV, cipher_bytes, 16,
+                                               progress, decrypt=True)
+    return finish_decrypt(plaintext, ransom)
+
+def lane_cipher(engine, key):
+    '''
+        Function which returns the batch cipher used by the named engine to
+        transform many blocks at a time
+    '''
+    with instrumentation.timed("aes", "key_setup"):
+        if engine == "numpy":
+            return aes_numpy(key)
+        if engine == "bitslice":
+            return aes_bitsliced(key)
+        return block_modes.BlockBatch(aes_context(key), 16)
+
+def encrypt_chunk(items, key, mode, ransom, engine):
+    '''
+        Function which encrypts a list of (plaintext, IV) items under one key
+        with the named engine, for encrypt_many. Block i of every message is
+        encrypted in the same batch call (see block_modes.run_interleaved).
+    '''
+    if engine == "reference":
+        results = []
+        for plaintext, IV in items:
+            ciphertext, key, IV = aes_encrypt(plaintext, key, mode, IV, ransom, engine)
+            results.append((ciphertext, IV))
+        return results
+    prepared = [prepare_encrypt(plaintext, key, IV, ransom) for plaintext, IV in items]
+    cipher = lane_cipher(engine, bytes.fromhex(key))
+    with instrumentation.timed("aes", "cipher", sum(len(message) for message, *rest in prepared) // 16):
+        ciphertexts = block_modes.run_interleaved(cipher, mode, [message for message, *rest in prepared],
+                                                  [IV for *rest, IV in prepared], 16)
+    with instrumentation.timed("aes", "encode", sum(len(ciphertext) for ciphertext in ciphertexts)):
+        return [(ciphertext.hex(), IV.hex()) for ciphertext, (*rest, IV) in zip(ciphertexts, prepared)]
+
+def decrypt_chunk(items, key, mode, ransom, engine):
+    '''
+        Function which decrypts a list of (ciphertext, IV) items under one key
+        with the named engine, for decrypt_many
+    '''
+    if engine == "reference":
+        return [aes_decrypt(ciphertext, key, mode, IV, ransom, engine) for ciphertext, IV in items]
+    with instrumentation.timed("aes", "decode", sum(len(ciphertext) for ciphertext, IV in items)):
+        messages = [bytes(ciphertext) if ransom else bytes.fromhex(ciphertext) for ciphertext, IV in items]
+    IVs = [bytes.fromhex(IV) if IV else None for ciphertext, IV in items]
+    cipher = lane_cipher(engine, bytes.fromhex(key))
+    with instrumentation.timed("aes", "cipher", sum(len(message) for message in messages) // 16):
+        plaintexts = block_modes.run_interleaved(cipher, mode, messages, IVs, 16, decrypt=True)
+    return [finish_decrypt(plaintext, ransom) for plaintext in plaintexts]
+
+def encrypt_many(items, key, mode="ECB", ransom=False, engine=None, executor=None, workers=None):
+    '''
+        Function which encrypts many messages under one key. The engine is
+        picked and the key schedule built once per chunk of messages, and
+        the messages of a chunk are encrypted side by side, so short
+        messages cost microseconds each instead of a full call.
+
+        Inputs:
+            items       (iterable) - (plaintext, IV) pairs, with the IV as a
+                                      hexadecimal string or None to generate one
+            key         (str)      - Hexadecimal key shared by every message
+            mode        (str)      - Mode of operation. Default is ECB
+            ransom      (bool)     - Whether the plaintexts are bytes
+            engine      (str)      - Engine name. Defaults to ENGINE
+            executor    (Executor) - Optional pool to fan the chunks out to
+            workers     (int)      - Optional number of processes to fan out to
+        Returns:
+            results     (list)     - (ciphertext, IV) hexadecimal pairs, in
+                                      order, as aes_encrypt returns them
+    '''
+    return batch.cipher_many("aes", encrypt_chunk, items, key, mode, ransom, default=ENGINE, mode=mode,
+                             ransom=ransom, engine=engine, executor=executor, workers=workers)
+
+def decrypt_many(items, key, mode="ECB", ransom=False, engine=None, executor=None, workers=None):
+    '''
+        Function which decrypts many messages under one key. Takes
+        (ciphertext, IV) pairs and the same options as encrypt_many, and
+        returns the plaintexts in order. A message with invalid padding
+        fails the whole call, as it would fail aes_decrypt.
+    '''
+    return batch.cipher_many("aes", decrypt_chunk, items, key, mode, ransom, default=ENGINE, mode=mode,
+                             ransom=ransom, engine=engine, decrypt=True, executor=executor, workers=workers)
+
+def stream_chunk(stream, offset, chunk, final):
+    '''
+        Function which encrypts the chunk of a message starting at <offset>,
+        padding it if it is the final chunk, for stream_encrypt
+    '''
+    if final:
+        with instrumentation.timed("aes", "padding"):
+            chunk = block_modes.pad(chunk, 16)
+    return stream.update(offset, chunk)
+
+def stream_encrypt(key=None, mode="ECB", IV=None, engine=None, chunk_size=pipeline.CHUNK_SIZE):
+    '''
+        Function which prepares the encryption of a message in consecutive
+        chunks (see pipeline.run_pipeline), producing the same ciphertext as
+        aes_encrypt with ransom=True.
+
+        Returns (transform, key, IV) with the key and IV as hexadecimal
+        strings, or None if the engine (eg. "reference") cannot work in chunks
+    '''
+    engine = engines.engine_function("aes", engine, ENGINE, mode, chunk_size)
+    if engine is None:
+        return None
+    key = nonces.token_bytes(16) if not key else bytes.fromhex(key)
+    IV = nonces.token_bytes(16) if not IV else bytes.fromhex(IV)
+    stream = block_modes.ModeStream(engine, key, mode, IV, 16)
+    return pipeline.ChunkTransform(stream_chunk, stream, parallel=stream.parallel), key.hex(), IV.hex()
+
+def keystream_prefetcher(key, mode, IV, engine=None, depth=prefetch.DEPTH, decrypt=False):
+    '''
+        Function which returns a prefetch.KeystreamPrefetcher generating the
+        CTR or OFB keystream of <key> and <IV> (given as bytes) in the background.
+        Its xor() then encrypts/decrypts unpadded data as it arrives; <decrypt>
+        picks the engine tuned for decryption.
+    '''
+    return prefetch.block_prefetcher("aes", engine, ENGINE, key, mode, IV, 16, depth=depth, decrypt=decrypt)
+
+# Engine used when none is given to aes_encrypt/aes_decrypt. "auto" lets
+# engines.select() pick the fastest engine for the mode and payload size.
+ENGINE = "auto"
+ENGINES = {
+    "table" : table_engine,
+    "bitslice" : bitslice_engine
+}
+if numpy_backend.AVAILABLE:
+    ENGINES["numpy"] = numpy_engine
+TRIAL_KEY = secrets.token_bytes(16)
+TRIAL_IV = secrets.token_bytes(16)
+engines.register_cipher("aes", ENGINES, engines.block_trial(TRIAL_KEY, TRIAL_IV), MODES)
+instrumentation.register_cache("aes key schedule", aes_context.cache_info)
+instrumentation.register_cache("aes bitsliced key schedule", aes_bitsliced.cache_info)
+instrumentation.register_cache("aes numpy key schedule", aes_numpy.cache_info)
+
 
 if __name__ == "__main__":
     # Testing ECB
@@ -0,0 +1,206 @@
+'''
+    Module which analyses ciphertext statistically, to sanity-check the
+    output of the ciphers at scale.
+
+    Good ciphertext looks like random bytes: a flat byte histogram, close to
+    8 bits of entropy per byte, and no repeated blocks. Deviations point at
+    misuse, for example ECB over repetitive plaintext (repeated 16-byte AES
+    or 8-byte DES blocks) or ArcFour, whose keystream here repeats every 256
+    bytes (bytes 256 apart match far more often than 1 in 256).
+
+    CiphertextStats is fed the data in chunks of any size and keeps fixed
+    memory whatever the amount of data:
+        - the histogram is 256 counters updated with collections.Counter
+          (or NumPy's bincount when it is installed)
+        - repeated blocks are counted against a set of at most MAX_TRACKED
+          distinct blocks per block size, so once it is full only repeats of
+          the blocks already tracked are counted (the report says so)
+        - the lag coincidence keeps the last LAG bytes between chunks
+
+    analyse() runs it over a file, a path or bytes in CHUNK_SIZE reads.
+'''
+import math
+import os
+from array import array
+from collections import Counter
+
+import numpy_backend
+
+CHUNK_SIZE = 1024 * 1024
+# Block sizes checked for repeats (AES and DES)
+BLOCK_SIZES = [16, 8]
+# Distinct blocks remembered per block size
+MAX_TRACKED = 1 << 18
+# Distance between the bytes compared by the lag coincidence (the period of
+# the ArcFour keystream)
+LAG = 256
+
+class CiphertextStats:
+    '''
+        Class which accumulates the statistics of data fed to it in chunks.
+        Blocks are aligned on the start of the data.
+
+        Inputs:
+            block_sizes (list)   - Block sizes to count repeated blocks of
+            lag         (int)    - Distance of the bytes compared by the lag
+                                    coincidence
+            max_tracked (int)    - Distinct blocks remembered per block size
+    '''
+    def __init__(self, block_sizes=BLOCK_SIZES, lag=LAG, max_tracked=MAX_TRACKED):
+        self.size = 0
+        self.counts = Counter()
+        self.block_sizes = list(block_sizes)
+        self.blocks = {size : 0 for size in self.block_sizes}
+        self.repeated = {size : 0 for size in self.block_sizes}
+        self._seen = {size : set() for size in self.block_sizes}
+        self.max_tracked = max_tracked
+        self.lag = lag
+        self.coincidences = 0
+        self._previous = b''
+        # Bytes not yet making up a whole block of the largest block size
+        self._pending = b''
+
+    def update(self, data):
+        '''
+            Function which adds the next chunk of data to the statistics
+        '''
+        data = bytes(data)
+        if not data:
+            return
+        self.size += len(data)
+        if numpy_backend.AVAILABLE:
+            self.counts.update({byte : count for byte, count in enumerate(numpy_backend.byte_counts(data)) if count})
+        else:
+            self.counts.update(data)
+        self._update_coincidences(data)
+        data = self._pending + data
+        whole = len(data) - len(data) % math.lcm(*self.block_sizes) if self.block_sizes else 0
+        self._pending = data[whole:]
+        for size in self.block_sizes:
+            self._update_blocks(size, data[:whole])
+
+    def _update_coincidences(self, data):
+        # Compare every byte with the byte <lag> before it, which may be in
+        # the previous chunk
+        window = self._previous + data
+        if len(window) > self.lag:
+            matches = int.from_bytes(window[self.lag:], 'big') ^ int.from_bytes(window[:-self.lag], 'big')
+            self.coincidences += matches.to_bytes(len(window) - self.lag, 'big').count(0)
+        self._previous = window[-self.lag:]
+
+    def _update_blocks(self, size, data):
+        if size == 8:
+            # 8-byte blocks are held as integers, which are smaller than bytes
+            blocks = array('Q', data).tolist()
+        else:
+            blocks = [data[i : i + size] for i in range(0, len(data), size)]
+        seen = self._seen[size]
+        distinct = set(blocks)
+        self.blocks[size] += len(blocks)
+        self.repeated[size] += len(blocks) - len(distinct) + len(distinct & seen)
+        room = self.max_tracked - len(seen)
+        if room > 0:
+            new = distinct - seen
+            seen.update(new if len(new) <= room else list(new)[:room])
+
+    def finish(self):
+        '''
+            Function which counts the blocks of a trailing partial chunk that
+            are whole for the smaller block sizes. Called by analyse() once
+            all the data has been fed.
+        '''
+        pending, self._pending = self._pending, b''
+        for size in self.block_sizes:
+            self._update_blocks(size, pending[: len(pending) - len(pending) % size])
+        return self
+
+    @property
+    def histogram(self):
+        '''
+            The number of occurrences of every byte value, as a list of 256
+            integers
+        '''
+        return [self.counts[byte] for byte in range(256)]
+
+    @property
+    def entropy(self):
+        '''
+            The Shannon entropy of the bytes, in bits per byte (8 for
+            uniformly random data)
+        '''
+        return -sum(count / self.size * math.log2(count / self.size) for count in self.counts.values() if count)
+
+    @property
+    def chi_squared(self):
+        '''
+            The chi-squared statistic of the histogram against the uniform
+            distribution (255 degrees of freedom, so about 255 for random
+            data and above 330 in less than 0.1% of random samples)
+        '''
+        expected = self.size / 256
+        if not expected:
+            return 0.0
+        return sum((count - expected) ** 2 / expected for count in self.histogram)
+
+    @property
+    def coincidence_rate(self):
+        '''
+            The fraction of bytes equal to the byte <lag> before them (about
+            1/256 for random data)
+        '''
+        compared = self.size - self.lag
+        return self.coincidences / compared if compared > 0 else 0.0
+
+    @property
+    def saturated(self):
+        '''
+            The block sizes whose set of tracked blocks is full, so that their
+            repeat counts only cover the blocks tracked
+        '''
+        return [size for size in self.block_sizes if len(self._seen[size]) >= self.max_tracked]
+
+    def report(self):
+        '''
+            Function which formats the statistics as a list of lines
+        '''
+        lines = [f"Size: {self.size:,} bytes",
+                 f"Entropy: {self.entropy:.4f} bits/byte",
+                 f"Chi-squared (uniform, 255 d.f.): {self.chi_squared:.1f}",
+                 f"Byte coincidence at lag {self.lag}: {self.coincidence_rate * 100:.3f}% (random: {100 / 256:.3f}%)"]
+        for size in self.block_sizes:
+            line = f"Repeated {size}-byte blocks: {self.repeated[size]:,} of {self.blocks[size]:,}"
+            if size in self.saturated:
+                line += f" (first {self.max_tracked:,} distinct blocks tracked)"
+            lines.append(line)
+        return lines
+
+def analyse(source, chunk_size=CHUNK_SIZE, **options):
+    '''
+        Function which computes the statistics of a file in fixed memory.
+
+        Inputs:
+            source      (str/file/bytes) - Path, binary file object or data
+            chunk_size  (int)            - Bytes read at a time
+            options                      - Passed on to CiphertextStats
+        Returns:
+            stats       (CiphertextStats)
+    '''
+    stats = CiphertextStats(**options)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for i in range(0, len(view), chunk_size):
+            stats.update(view[i : i + chunk_size])
+        return stats.finish()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as file:
+            return analyse(file, chunk_size, **options)
+    while chunk := source.read(chunk_size):
+        stats.update(chunk)
+    return stats.finish()
+
+if "__main__" == __name__:
+    import sys
+    for path in sys.argv[1:]:
+        print(f"===== {path} =====")
+        for line in analyse(path).report():
+            print(line)
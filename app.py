@@ -3,14 +3,24 @@
 
 '''
 from encodings import utf_8
-from caesar_encryptor import caesar_encrypt, caesar_decrypt
+from analysis import analyse
+from caesar_encryptor import caesar_encrypt, caesar_decrypt, caesar_crack
 from piecewise_encryptor import piecewise_encrypt, piecewise_decrypt
-from des import encrypt_des, decrypt_des
-from aes import aes_encrypt, aes_decrypt
-from arcfour import arcfour_parse, arcfour_encrypt, arcfour_decrypt
-from chacha import chacha_parse, chacha_encrypt, chacha_decrypt
+from des import encrypt_des, decrypt_des, stream_encrypt as des_stream_encrypt
+from aes import aes_encrypt, aes_decrypt, stream_encrypt as aes_stream_encrypt
+from arcfour import arcfour_parse, arcfour_encrypt, arcfour_decrypt, stream_encrypt as arcfour_stream_encrypt
+from chacha import chacha_parse, chacha_encrypt, chacha_decrypt, stream_encrypt as chacha_stream_encrypt
+from chacha import check_rounds, records_rounds, DEFAULT_ROUNDS, ROUND_TIERS
+from text_encoding import ENCODINGS, encode, decode
+from key_check import make_header, WrongKeyError
+from envelope import seal, unseal, rewrap_files, generate_master_key, REWRAPPED, CURRENT
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from progress import ProgressBar
+import instrumentation
+import pipeline
+import sys
 
 class Colours:
     '''
@@ -28,6 +38,21 @@ class Colours:
 
 ALPHABET = "abcdefghijklmnopqrstuvwxyz"
 MODES = ["ECB", "CBC", "CTR", "PCBC", "CFB", "OFB"]
+# Length in bytes of generated DES keys for each 'triple' option
+TRIPLE_DES_KEYS = {"off" : 8, "2" : 16, "3" : 24}
+# Chunked encryptors used to encrypt files through the read/encrypt/write pipeline
+STREAM_ENCRYPTORS = {
+    aes_encrypt : aes_stream_encrypt,
+    encrypt_des : des_stream_encrypt,
+    arcfour_encrypt : arcfour_stream_encrypt,
+    chacha_encrypt : chacha_stream_encrypt
+}
+ENVELOPE_SUFFIX = ".env"
+# Algorithms whose ciphertext can carry a key check header
+CHECKED_ALGORITHMS = ["/aes", "/des", "/chacha"]
+# Algorithms whose whole-file encryptors report progress (any algorithm does
+# through the file pipeline)
+PROGRESS_ALGORITHMS = ["/aes", "/des", "/chacha", "/arcfour"]
 CRITICAL_FILES = [  "__init__.py", "aes.py", "des.py", "app.py", "arcfour.py",
                     'caesar_encryptor.py', 'chacha.py', 'main.py', "u",
                     'piecewise_encryptor.py']
@@ -56,6 +81,13 @@ Basic Commands:
     - ransom    <no args>   :   Sets output mode to encrypt files
     - encrypt   <no args>   :   Sets mode to encrypt inputs
     - decrypt   <no args>   :   Sets mode to decrypt inputs
+    - stats     <reset>     :   Outputs statistics (bytes processed, operations,
+                                cache hit rates and throughput) for this session.
+                                'stats reset' clears them
+    - analyse   <file>      :   Outputs the byte histogram, entropy, chi-squared
+                                uniformity, repeated 16/8-byte blocks and lag-256
+                                byte coincidences of <file> (or every file inside
+                                a directory), to spot ECB or keystream reuse
 
 [ Page 1 ] ===========================================
 """
@@ -87,6 +119,33 @@ Configuration Commands:
                                 [ only used for 'caesar' ]
     - offset    <offset>    :   Offset encryptor should use. 
                                 [ only used for 'caesar' and 'piecewise' ]
+    - rounds    <rounds>    :   Number of ChaCha rounds, as an even number or one of
+                                chacha20 (10 rounds, default), chacha12 (6 rounds) or
+                                chacha8 (4 rounds). Fewer rounds are faster but only
+                                suitable for non-adversarial obfuscation. Reduced
+                                round counts are recorded in the ciphertext, and
+                                used to decrypt it if no round count is set
+                                [ only used for 'chacha' ]
+    - triple    <keys>      :   Generates triple DES (EDE) keys with 2 or 3 independent
+                                DES keys, or single DES keys for 'off' (default). A
+                                given key is used as DES or triple DES by its length
+                                [ only used for 'des' ]
+    - check     <check>     :   Indicates whether ciphertext should carry a key check
+                                header, so decryption rejects a wrong key, IV or round
+                                count before touching the data. Default is False.
+                                Ciphertext must be decrypted with the same setting
+                                [ only used for 'aes', 'des' and 'chacha' ]
+    - progress  <progress>  :   Indicates whether a progress bar with the throughput and
+                                time left is shown while encrypting/decrypting files.
+                                Default is True when running in a terminal
+                                [ only used in ransom mode ]
+    - encoding  <encoding>  :   Text encoding of ciphertext in text mode: hex (default),
+                                base64 (25% shorter) or base85 (37% shorter)
+                                [ only used for 'aes', 'des', 'arcfour' and 'chacha' ]
+    - workers   <n>         :   Number of processes encrypting files in ransom mode.
+                                Default is 1 (encrypt in this process). Only used
+                                for ECB, CTR, 'arcfour' and 'chacha', whose chunks
+                                are independent
 
 [ Page 2 ] ===========================================
 """
@@ -102,7 +161,8 @@ Encryption Commands:
                                 keys and 128-bit IV. If already switched to AES,
                                 it will encrypt/decrypt <text>.
     - des       <text>      :   Switches to DES encryptor which accepts 64-bit
-                                keys and 64-bit IV. If already switched to DES,
+                                keys (128/192-bit for triple DES) and 64-bit IV.
+                                If already switched to DES,
                                 it will encrypt/decrypt <text>.
     - arcfour   <text>      :   Switches to ArcFour encryptor which accepts keys up to
                                 40 - 2048 bits. If already switched to ArcFour
@@ -116,6 +176,10 @@ Encryption Commands:
     - piecewise <text>      :   Switches to piecewise function encryptor. If already
                                 switched to piecewise function, it will encrypt/decrypt
                                 <text>
+    - crack     <text> <n>  :   Recovers the offset of Caesar Cipher <text> by letter
+                                frequency analysis (English), using the 'alphabet',
+                                'case', 'whitespace' and 'foreign' options, and shows
+                                the <n> most likely plaintexts (default 3)
 
 [ Page 3 ] ===========================================
 """
@@ -135,7 +199,8 @@ Ransom Mode Commands:
                                 it will encrypt all files (excluding directories)
                                 inside <file>
     - des       <file>      :   Switches to DES encryptor which accepts 64-bit
-                                keys and 64-bit IV. If already switched to DES,
+                                keys (128/192-bit for triple DES) and 64-bit IV.
+                                If already switched to DES,
                                 it will encrypt/decrypt <text>.If <file> is a directory
                                 it will encrypt all files (excluding directories)
                                 inside <file>
@@ -149,6 +214,14 @@ Ransom Mode Commands:
                                 it will encrypt/decrypt <text>.If <file> is a directory
                                 it will encrypt all files (excluding directories)
                                 inside <file>
+    - envelope  <file>      :   Encrypts/decrypts <file> (or every file inside a
+                                directory) with its own random AES data key, stored
+                                wrapped under the master key set with 'key' in a
+                                header of the new <file>.env. Uses 'mode' for the
+                                data. Works in any output mode
+    - rewrap    <file> <key>:   Rotates the envelopes in <file> from the master key
+                                set with 'key' to the master key <key>, rewriting
+                                their headers only. Uses 'workers' processes
 
 [ Page 4 ] ===========================================
 """
@@ -188,13 +261,24 @@ class App:
             'whitespace' : self._set_whitespace,
             'foreign' : self._set_foreign,
             'offset' : self._set_offset,
+            'workers' : self._set_workers,
+            'rounds' : self._set_rounds,
+            'triple' : self._set_triple,
+            'encoding' : self._set_encoding,
+            'check' : self._set_check,
+            'progress' : self._set_progress,
             'config' : self._config,
             'caesar' : self._caesar,
+            'crack' : self._crack,
             'piecewise' : self._piecewise,
             'des' : self._des,
             'aes' : self._aes,
             'arcfour' : self._arcfour,
-            'chacha' : self._chacha
+            'chacha' : self._chacha,
+            'stats' : self._stats,
+            'analyse' : self._analyse,
+            'envelope' : self._envelope,
+            'rewrap' : self._rewrap
         }
 
         self._options = {
@@ -207,8 +291,40 @@ class App:
             'keep_case' : False,
             'keep_whitespace' : True,
             'foreign_chars' : False,
-            'text' : None
+            'text' : None,
+            'workers' : 1,
+            'rounds' : None,
+            'des_key_size' : TRIPLE_DES_KEYS["off"],
+            'encoding' : "hex",
+            'check' : False,
+            'progress' : sys.stdout.isatty()
         }
+        self._pool = None
+        self._pool_workers = 0
+        self._pipeline_stats = None
+
+        # Collect cipher statistics for the 'stats' command, until close()
+        self._session_stats = instrumentation.SessionStats()
+        instrumentation.add_hook(self._session_stats)
+
+    def close(self):
+        '''
+            Function which releases the app: its statistics hook is
+            unregistered and its worker pool shut down. Called on 'quit' and
+            at the end of run(); safe to call more than once.
+        '''
+        if self._session_stats in instrumentation.HOOKS:
+            instrumentation.remove_hook(self._session_stats)
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
 
     def _create_error_msg(self, command, message):
         return f"{Colours.FAIL}Error --> {Colours.ENDC}{command}: {message}. Please consult 'help' for more details."
@@ -218,16 +334,38 @@ class App:
             Function which acts as the run loop of the app
         '''
         while self._running:
-            command_line = input(f"{Colours.OKGREEN}3ncrypt0r{Colours.ENDC}:{Colours.OKCYAN}~/{self._output}/{self._mode}{self._algo}>>>{Colours.ENDC} ")
-            args = self._tokenise(command_line)
-            command = args[0] if len(args) != 0 else ""
-            if command not in self._commands:
-                if command != "":
-                    print(f"No such command: '{command}'")
-                continue
-            self._commands[command](args)
+            try:
+                command_line = input(f"{Colours.OKGREEN}3ncrypt0r{Colours.ENDC}:{Colours.OKCYAN}~/{self._output}/{self._mode}{self._algo}>>>{Colours.ENDC} ")
+            except EOFError:
+                # Input was piped in and has run out
+                print()
+                break
+            self.execute(command_line)
+        self.close()
         print(f"{Colours.WARNING}Thank you for using 3ncrypt0r!{Colours.ENDC}")
 
+    def run_commands(self, command_lines):
+        '''
+            Function which runs the given command lines non-interactively,
+            stopping early if one of them is 'quit'
+        '''
+        for command_line in command_lines:
+            if not self._running:
+                break
+            self.execute(command_line)
+
+    def execute(self, command_line):
+        '''
+            Function which runs a single command line
+        '''
+        args = self._tokenise(command_line)
+        command = args[0] if len(args) != 0 else ""
+        if command not in self._commands:
+            if command != "":
+                print(f"No such command: '{command}'")
+            return
+        self._commands[command](args)
+
     def _tokenise(self, line):
         is_string = False
         args = []
@@ -272,6 +410,7 @@ class App:
 
     def _quit(self, *args):
         self._running = False
+        self.close()
 
     def _help(self, args):
         if len(args) == 1:
@@ -295,51 +434,199 @@ class App:
     def _stdout_mode(self, *args):
         self._output = 'stdout'
 
-    def _handle_dirs_e(self, encryptor, file, key, mode, IV):
+    def _handle_dirs_e(self, encryptor, file, key, mode, IV, **options):
         for f in file.rglob("*"):
             if f.is_dir():
                 continue
-            key, IV = self._encrypt_file(encryptor, f, key, mode, IV)
+            key, IV = self._encrypt_file(encryptor, f, key, mode, IV, **options)
         return key, IV
 
-    def _handle_dirs_d(self, decryptor, file, key, mode, IV):
+    def _handle_dirs_d(self, decryptor, file, key, mode, IV, **options):
         for f in file.rglob("*.rekt"):
             if f.is_dir():
                 continue
-            self._decrypt_file(decryptor, f, key, mode, IV)
+            self._decrypt_file(decryptor, f, key, mode, IV, **options)
 
-    def _encrypt_file(self, encryptor, file, *args):
+    def _encrypt_file(self, encryptor, file, *args, **options):
         # Check for shielding
         if file.name in CRITICAL_FILES:
             print(self._create_error_msg(self._algo.strip("/"), f"Attempted to encrypt critical program file '{file.name}'"))
             return None, None
 
+        algo = self._algo.strip("/")
+        if encryptor in STREAM_ENCRYPTORS:
+            prepared = STREAM_ENCRYPTORS[encryptor](key=args[0], mode=args[1], IV=args[2], **options)
+            if prepared is not None:
+                return self._pipeline_file(encryptor, file, args[1], *prepared, **options)
+
         # Reading file data
         with open(file, 'rb') as r_file:
-            file_bytes = bytearray(r_file.read())
-            ciphertext, key, iv = encryptor(file_bytes, key=args[0], mode=args[1], IV=args[2], ransom=True)
+            with instrumentation.timed(algo, "io", file.stat().st_size):
+                file_bytes = bytearray(r_file.read())
+            ciphertext, key, iv = encryptor(file_bytes, key=args[0], mode=args[1], IV=args[2], ransom=True,
+                                            **self._check_option(), **self._progress_option(file), **options)
 
         # Overwriting actual file
-        cipher_filename, key, iv = encryptor(file.name, key=key, mode=args[1], IV=iv)
+        cipher_filename, key, iv = encryptor(file.name, key=key, mode=args[1], IV=iv, **options)
         print(file.name, cipher_filename)
         new_path = Path(file.parent, f"{cipher_filename}.rekt")
         file.rename(new_path)
         with open(new_path, 'wb') as new_file:
-            new_file.write(bytearray.fromhex(ciphertext))
+            with instrumentation.timed(algo, "io", len(ciphertext) // 2):
+                new_file.write(bytearray.fromhex(ciphertext))
+        return key, iv
+
+    def _pipeline_file(self, encryptor, file, mode, transform, key, iv, **options):
+        # Encrypt the file name first, then stream the contents into the
+        # renamed file with reading, encryption and writing overlapped
+        algo = self._algo.strip("/")
+        cipher_filename, key, iv = encryptor(file.name, key=key, mode=mode, IV=iv, **options)
+        print(file.name, cipher_filename)
+        new_path = Path(file.parent, f"{cipher_filename}.rekt")
+        executor = self._get_pool() if transform.parallel else None
+        try:
+            with open(file, 'rb') as source, open(new_path, 'wb') as destination:
+                # The ChaCha transform already records a non-default round count
+                rounds = check_rounds(options.get('rounds')) if algo == "chacha" else 0
+                if self._check_option() and not (algo == "chacha" and records_rounds(rounds)):
+                    destination.write(make_header(algo, key, mode, iv, rounds))
+                stats = pipeline.run_pipeline(source, destination, transform, executor=executor,
+                                              depth=max(pipeline.DEPTH, 2 * self._options['workers']),
+                                              progress=self._progress_bar(file), total=file.stat().st_size)
+        except:
+            new_path.unlink(missing_ok=True)
+            raise
+        file.unlink()
+        for stage in ("read", "write"):
+            instrumentation.record(algo, "io", stats.stages[stage].busy, stats.stages[stage].bytes)
+        self._pipeline_stats = stats
         return key, iv
 
-    def _decrypt_file(self, decryptor, file, *args):
+    def _get_pool(self):
+        workers = self._options['workers']
+        if workers <= 1:
+            return None
+        if self._pool is None or self._pool_workers != workers:
+            if self._pool is not None:
+                self._pool.shutdown()
+            self._pool = ProcessPoolExecutor(max_workers=workers)
+            self._pool_workers = workers
+        return self._pool
+
+    def _progress_bar(self, file):
+        # Progress bar for a file, or None if disabled
+        return ProgressBar(f"{file.name[:24]} ") if self._options['progress'] else None
+
+    def _progress_option(self, file):
+        # Keyword arguments asking the current cipher to report progress
+        if self._options['progress'] and self._algo in PROGRESS_ALGORITHMS:
+            return {'progress' : self._progress_bar(file)}
+        return {}
+
+    def _check_option(self):
+        # Keyword arguments asking the current cipher for a key check header
+        if self._options['check'] and self._algo in CHECKED_ALGORITHMS:
+            return {'check' : True}
+        return {}
+
+    def _decrypt_file(self, decryptor, file, *args, **options):
         # Reading file data
+        algo = self._algo.strip("/")
         with open(file, 'rb') as d_file:
-            file_bytes = bytearray(d_file.read())
-            plaintext = decryptor(file_bytes, args[0], mode=args[1], IV=args[2], ransom=True)
+            with instrumentation.timed(algo, "io", file.stat().st_size):
+                file_bytes = bytearray(d_file.read())
+            try:
+                plaintext = decryptor(file_bytes, args[0], mode=args[1], IV=args[2], ransom=True,
+                                      **self._check_option(), **self._progress_option(file), **options)
+            except WrongKeyError as error:
+                print(self._create_error_msg(algo, f"Could not decrypt '{file.name}': {error}"))
+                return
 
         # Overwriting actual file
-        filename = decryptor(file.stem, args[0], mode=args[1], IV=args[2])
+        filename = decryptor(file.stem, args[0], mode=args[1], IV=args[2], **options)
         new_path = Path(file.parent, f"{filename}")
         file.rename(new_path)
         with open(new_path, 'wb') as new_file:
-            new_file.write(plaintext)
+            with instrumentation.timed(algo, "io", len(plaintext)):
+                new_file.write(plaintext)
+
+    def _envelope_paths(self, file, sealed):
+        # Envelopes to open, or the files to seal (skipping program files)
+        paths = [file] if file.is_file() else [f for f in file.rglob("*") if f.is_file()]
+        if sealed:
+            return [f for f in paths if f.suffix == ENVELOPE_SUFFIX]
+        for f in paths:
+            if f.name in CRITICAL_FILES:
+                print(self._create_error_msg("envelope", f"Attempted to encrypt critical program file '{f.name}'"))
+        return [f for f in paths if f.suffix != ENVELOPE_SUFFIX and f.name not in CRITICAL_FILES]
+
+    def _envelope(self, args):
+        if len(args) < 2:
+            print(self._create_error_msg("envelope", "No file given"))
+            return
+        file = Path(args[1])
+        if not file.exists():
+            print(self._create_error_msg("envelope", f"File path {args[1]} not found"))
+            return
+        master_key = self._options['key']
+        if master_key is not None and len(master_key) not in [32, 48, 64]:
+            print(self._create_error_msg("envelope", f"Invalid master key length of {len(master_key)}. Key should be 32, 48 or 64 characters long"))
+            return
+        if self._mode == "encryption":
+            if master_key is None:
+                master_key = generate_master_key()
+            for f in self._envelope_paths(file, False):
+                with instrumentation.timed("aes", "io", f.stat().st_size):
+                    payload = f.read_bytes()
+                envelope = seal(payload, master_key, mode=self._options['mode'])
+                with instrumentation.timed("aes", "io", len(envelope)):
+                    Path(f"{f}{ENVELOPE_SUFFIX}").write_bytes(envelope)
+                f.unlink()
+            print(f"Master key: {master_key} - don't lose this!")
+            return
+        if master_key is None:
+            print(self._create_error_msg("envelope", "Master key not supplied for decryption"))
+            return
+        for f in self._envelope_paths(file, True):
+            try:
+                payload = unseal(f.read_bytes(), master_key)
+            except ValueError as error:
+                print(self._create_error_msg("envelope", f"Could not open '{f.name}': {error}"))
+                continue
+            with instrumentation.timed("aes", "io", len(payload)):
+                f.with_suffix("").write_bytes(payload)
+            f.unlink()
+
+    def _rewrap(self, args):
+        if len(args) < 3:
+            print(self._create_error_msg("rewrap", "A path and the new master key are needed"))
+            return
+        file = Path(args[1])
+        if not file.exists():
+            print(self._create_error_msg("rewrap", f"File path {args[1]} not found"))
+            return
+        if self._options['key'] is None:
+            print(self._create_error_msg("rewrap", "The current master key must be set with 'key'"))
+            return
+        paths = self._envelope_paths(file, True)
+        try:
+            results = rewrap_files(paths, self._options['key'], args[2], executor=self._get_pool())
+        except ValueError as error:
+            print(self._create_error_msg("rewrap", str(error)))
+            return
+        failed = 0
+        for path, result in zip(paths, results):
+            if result not in [REWRAPPED, CURRENT]:
+                print(self._create_error_msg("rewrap", f"Could not rewrap '{path.name}': {result}"))
+                failed += 1
+        print(f"Rewrapped {results.count(REWRAPPED)} envelope(s), {results.count(CURRENT)} already under the new key")
+        if failed:
+            # Keep the old key, which the failed envelopes still need
+            print(self._create_error_msg("rewrap", f"{failed} envelope(s) failed, the master key is unchanged. "
+                                                   "Fix them and run rewrap again"))
+            return
+        self._options['key'] = args[2]
+        print(f"Master key is now: {args[2]}")
 
     def _set_key(self, args):
         # Handle errors:
@@ -429,6 +716,75 @@ class App:
         except ValueError:
             print(self._create_error_msg("offset", "Non-decimal offset given"))
 
+    def _set_workers(self, args):
+        if len(args) < 2:
+            print(self._create_error_msg("workers", "No number of workers given"))
+            return
+        try:
+            workers = int(args[1])
+        except ValueError:
+            print(self._create_error_msg("workers", "Non-decimal number of workers given"))
+            return
+        if workers < 1:
+            print(self._create_error_msg("workers", "At least 1 worker is needed"))
+            return
+        self._options['workers'] = workers
+
+    def _set_rounds(self, args):
+        if len(args) < 2:
+            print(self._create_error_msg("rounds", "No round count given"))
+            return
+        try:
+            self._options['rounds'] = check_rounds(args[1])
+        except ValueError:
+            print(self._create_error_msg("rounds", f"Invalid round count. Use an even number or one of {', '.join(ROUND_TIERS)}"))
+
+    def _set_triple(self, args):
+        if len(args) < 2:
+            print(self._create_error_msg("triple", "No option given"))
+            return
+        if args[1].lower() not in TRIPLE_DES_KEYS:
+            print(self._create_error_msg("triple", f"Invalid option. Valid options are: {', '.join(TRIPLE_DES_KEYS)}"))
+            return
+        self._options['des_key_size'] = TRIPLE_DES_KEYS[args[1].lower()]
+
+    def _set_check(self, args):
+        if len(args) < 2 or args[1].lower() not in ["true", "false"]:
+            print(self._create_error_msg("check", "Invalid input. Valid options are: True, False"))
+            return
+        self._options['check'] = args[1].lower() == "true"
+
+    def _set_progress(self, args):
+        if len(args) < 2 or args[1].lower() not in ["true", "false"]:
+            print(self._create_error_msg("progress", "Invalid input. Valid options are: True, False"))
+            return
+        self._options['progress'] = args[1].lower() == "true"
+
+    def _set_encoding(self, args):
+        if len(args) < 2:
+            print(self._create_error_msg("encoding", "No encoding given"))
+            return
+        if args[1].lower() not in ENCODINGS:
+            print(self._create_error_msg("encoding", f"Invalid encoding. Valid encodings are: {', '.join(ENCODINGS)}"))
+            return
+        self._options['encoding'] = args[1].lower()
+
+    def _encode_ciphertext(self, ciphertext):
+        # The encryptors return hexadecimal ciphertext
+        if self._options['encoding'] == "hex":
+            return ciphertext
+        return encode(bytes.fromhex(ciphertext), self._options['encoding'])
+
+    def _decode_ciphertext(self, algo, text):
+        # Returns the ciphertext as hexadecimal for the decryptors, or None
+        # if it is not valid in the selected encoding
+        try:
+            ciphertext = decode(text, self._options['encoding'])
+        except ValueError:
+            print(self._create_error_msg(algo, f"Ciphertext is not in {self._options['encoding']} form"))
+            return None
+        return text.strip() if self._options['encoding'] == "hex" else ciphertext.hex()
+
     def _config(self, *args):
         print(f"===== {self._mode.capitalize()} Config =====")
         if self._algo in ["/caesar", "/piecewise"]:
@@ -442,13 +798,68 @@ class App:
             print(f"Key: {self._options['key']}")
             print(f"Mode: {self._options['mode']}")
             print(f"IV (only for non-ECB mode): {self._options['IV']}")
+            if self._algo == "/des":
+                triple = {size : option for option, size in TRIPLE_DES_KEYS.items()}[self._options['des_key_size']]
+                print(f"Triple DES keys (generated keys): {triple}")
         elif self._algo in ['/arcfour', '/chacha']:
             print(f"Key: {self._options['key']}")
             print(f"Seed (chacha only): {self._options['IV']}")
+            print(f"Rounds (chacha only): {self._options['rounds'] or DEFAULT_ROUNDS}")
+        if self._algo in CHECKED_ALGORITHMS:
+            print(f"Key check header: {self._options['check']}")
+        if self._algo in ["/des", "/aes", "/arcfour", "/chacha"]:
+            print(f"Encoding (text mode): {self._options['encoding']}")
+            print(f"Workers (ransom mode): {self._options['workers']}")
+            print(f"Progress bar (ransom mode): {self._options['progress']}")
         if self._algo == "":
             print("No encryption mode selected!")
         print("=============================")
 
+    def _stats(self, args):
+        if len(args) > 1:
+            if args[1].lower() != "reset":
+                print(self._create_error_msg("stats", "Invalid option. Valid options are: reset"))
+                return
+            self._session_stats.reset()
+            self._pipeline_stats = None
+            print("Session statistics cleared")
+            return
+        print("===== Session Statistics =====")
+        lines = self._session_stats.report()
+        if not lines:
+            print("No operations performed yet!")
+        for line in lines:
+            print(line)
+        caches = instrumentation.cache_stats()
+        if caches:
+            print("Cache hit rates:")
+        for name, (hits, misses, rate) in caches.items():
+            print(f"    {name}: {hits} hit(s), {misses} miss(es) ({rate * 100:.1f}%)")
+        if self._pipeline_stats is not None:
+            print("Last file pipeline:")
+            for line in self._pipeline_stats.report():
+                print(f"    {line}")
+        print("==============================")
+
+    def _analyse(self, args):
+        if len(args) < 2:
+            print(self._create_error_msg("analyse", "No file given"))
+            return
+        file = Path(args[1])
+        if not file.exists():
+            print(self._create_error_msg("analyse", f"File path {args[1]} not found"))
+            return
+        paths = [file] if file.is_file() else sorted(f for f in file.rglob("*") if f.is_file())
+        for f in paths:
+            try:
+                stats = analyse(f)
+            except OSError as error:
+                print(self._create_error_msg("analyse", f"Could not read '{f}': {error.strerror}"))
+                continue
+            print(f"===== {f} =====")
+            for line in stats.report():
+                print(line)
+
     def _caesar(self, args):
         if self._algo != "/caesar":
             self._algo = "/caesar"
@@ -478,6 +889,27 @@ class App:
             except:
                 print(self._create_error_msg("caesar", "There was an error in decryption. Check your ciphertext!"))
 
+    def _crack(self, args):
+        if len(args) < 2:
+            print(self._create_error_msg("crack", "No text to crack"))
+            return
+        candidates = 3
+        if len(args) > 2:
+            if not args[2].strip().isdigit() or int(args[2]) < 1:
+                print(self._create_error_msg("crack", "Number of candidates must be a positive integer"))
+                return
+            candidates = int(args[2])
+        try:
+            results = caesar_crack(args[1], self._options['alphabet'], candidates,
+                                   keep_case=self._options['keep_case'],
+                                   whitespace=self._options['keep_whitespace'],
+                                   special_chars=self._options['foreign_chars'])
+        except ValueError as error:
+            print(self._create_error_msg("crack", str(error)))
+            return
+        for rank, (offset, score, plaintext) in enumerate(results, 1):
+            print(f"{rank}. Offset {offset} (chi-squared {score:.1f}): {plaintext}")
+
     def _piecewise(self, args):
         if self._algo != "/piecewise":
             self._algo = "/piecewise"
@@ -509,8 +941,9 @@ class App:
         key = self._options['key']
         IV = self._options['IV']
         mode = self._options['mode']
-        if key is not None and len(key) != 16:
-            print(self._create_error_msg("des", f"Invalid key length of {len(key)}. Key should be 16 characters long"))
+        key_size = self._options['des_key_size']
+        if key is not None and len(key) not in [16, 32, 48]:
+            print(self._create_error_msg("des", f"Invalid key length of {len(key)}. Key should be 16 characters long, or 32/48 for triple DES"))
             return
         if IV is not None and len(IV) != 16:
             print(self._create_error_msg("des", f"Invalid IV length of {len(IV)}. IV should be 16 characters long"))
@@ -524,9 +957,9 @@ class App:
                 return
             if self._mode == "encryption":
                 if file.is_dir():
-                    key, iv = self._handle_dirs_e(encrypt_des, file, key, mode, IV)
+                    key, iv = self._handle_dirs_e(encrypt_des, file, key, mode, IV, key_size=key_size)
                 else:
-                    key, iv = self._encrypt_file(encrypt_des, file, key, mode, IV)
+                    key, iv = self._encrypt_file(encrypt_des, file, key, mode, IV, key_size=key_size)
                 print(f"Ransom key: {key}\nRansom IV: {iv}")
 
             else:
@@ -536,19 +969,20 @@ class App:
                     self._decrypt_file(decrypt_des, file, key, mode, IV)
         else:
             if self._mode == "encryption":
-                ciphertext, key, iv = encrypt_des(args[1], key=key, mode=mode, IV=IV)
+                ciphertext, key, iv = encrypt_des(args[1], key=key, mode=mode, IV=IV, key_size=key_size, **self._check_option())
+                ciphertext = self._encode_ciphertext(ciphertext)
                 print(f"Your encrypted text is: {ciphertext}\nYour key is: {key} - don't lose this!\nYour IV is: {iv}")
             elif self._mode == "decryption":
-                try:
-                    int(args[1], 16)
-                except:
-                    print(self._create_error_msg("des", "Ciphertext is not in hexadecimal form"))
+                ciphertext = self._decode_ciphertext("des", args[1])
+                if ciphertext is None:
                     return
                 if key is None or (IV is None and mode != "ECB"):
                     print(self._create_error_msg("des", "Key or IV not supplied for decryption"))
                     return
                 try:
-                    print(f"Decrypted text: {decrypt_des(args[1], key=key, mode=mode, IV=IV)}")
+                    print(f"Decrypted text: {decrypt_des(ciphertext, key=key, mode=mode, IV=IV, **self._check_option())}")
+                except WrongKeyError as error:
+                    print(self._create_error_msg("des", f"Could not decrypt: {error}"))
                 except:
                     print(self._create_error_msg("des", "There was an error in decryption. Check your ciphertext!"))
 
@@ -591,19 +1025,20 @@ class App:
                     self._decrypt_file(aes_decrypt, file, key, mode, IV)
         else:
             if self._mode == "encryption":
-                ciphertext, key, iv = aes_encrypt(args[1], key=key, mode=mode, IV=IV)
+                ciphertext, key, iv = aes_encrypt(args[1], key=key, mode=mode, IV=IV, **self._check_option())
+                ciphertext = self._encode_ciphertext(ciphertext)
                 print(f"Your encrypted text is: {ciphertext}\nYour key is: {key} - don't lose this!\nYour IV is: {iv}")
             else:
-                try:
-                    int(args[1], 16)
-                except:
-                    print(self._create_error_msg("aes", "Ciphertext is not in hexadecimal form"))
+                ciphertext = self._decode_ciphertext("aes", args[1])
+                if ciphertext is None:
                     return
                 if key is None or (IV is None and mode != "ECB"):
                     print(self._create_error_msg("aes", "Key or IV not supplied for decryption"))
                     return
                 try:
-                    print(f"Decrypted text: {aes_decrypt(args[1], key=key, mode=mode, IV=IV)}")
+                    print(f"Decrypted text: {aes_decrypt(ciphertext, key=key, mode=mode, IV=IV, **self._check_option())}")
+                except WrongKeyError as error:
+                    print(self._create_error_msg("aes", f"Could not decrypt: {error}"))
                 except:
                     print(self._create_error_msg("aes", "There was an error in decryption. Check your ciphertext!"))
 
@@ -642,18 +1077,17 @@ class App:
         else:
             if self._mode == "encryption":
                 ciphertext, key = arcfour_parse(args[1], key=key)
+                ciphertext = self._encode_ciphertext(ciphertext)
                 print(f"Your encrypted text is: {ciphertext}\nYour key is: {key} - don't lose this!")
             else:
-                try:
-                    int(args[1], 16)
-                except:
-                    print(self._create_error_msg("arcfour", "Ciphertext is not in hexadecimal form"))
+                ciphertext = self._decode_ciphertext("arcfour", args[1])
+                if ciphertext is None:
                     return
                 if key is None:
                     print(self._create_error_msg("arcfour", "Key or IV not supplied for decryption"))
                     return
                 try:
-                    print(f"Decrypted text: {arcfour_parse(args[1], key=key, decrypt=True)}")
+                    print(f"Decrypted text: {arcfour_parse(ciphertext, key=key, decrypt=True)}")
                 except:
                     print(self._create_error_msg("arcfour", "There was an error in decryption. Check your ciphertext!"))
 
@@ -667,6 +1101,7 @@ class App:
             return
         key = self._options['key']
         iv = self._options['IV']
+        rounds = self._options['rounds']
         if key is not None and len(key) != 64:
             print(self._create_error_msg("chacha", f"Invalid key length of {len(key)}. Key should be 64 characters long"))
             return
@@ -682,9 +1117,9 @@ class App:
 
             if self._mode == "encryption":
                 if file.is_dir():
-                    key, iv = self._handle_dirs_e(chacha_encrypt, file, key, None, iv)
+                    key, iv = self._handle_dirs_e(chacha_encrypt, file, key, None, iv, rounds=rounds)
                 else:
-                    key, iv = self._encrypt_file(chacha_encrypt, file, key, None, iv)
+                    key, iv = self._encrypt_file(chacha_encrypt, file, key, None, iv, rounds=rounds)
                 print(f"Ransom key: {key}\nRansom IV: {iv}")
 
             else:
@@ -693,23 +1128,24 @@ class App:
                     return
                 
                 if file.is_dir():
-                    self._handle_dirs_d(chacha_decrypt, file, key, None, iv)
+                    self._handle_dirs_d(chacha_decrypt, file, key, None, iv, rounds=rounds)
                 else:
-                    self._decrypt_file(chacha_decrypt, file, key, None, iv)
+                    self._decrypt_file(chacha_decrypt, file, key, None, iv, rounds=rounds)
         else:
             if self._mode == "encryption":
-                ciphertext, key, iv = chacha_parse(args[1], key=key, IV=iv)
+                ciphertext, key, iv = chacha_parse(args[1], key=key, IV=iv, rounds=rounds, **self._check_option())
+                ciphertext = self._encode_ciphertext(ciphertext)
                 print(f"Your encrypted text is: {ciphertext}\nYour key is: {key} - don't lose this!\nYour IV is: {iv}")
             else:
-                try:
-                    int(args[1], 16)
-                except:
-                    print(self._create_error_msg("chacha", "Ciphertext is not in hexadecimal form"))
+                ciphertext = self._decode_ciphertext("chacha", args[1])
+                if ciphertext is None:
                     return
                 if key is None or iv is None:
                     print(self._create_error_msg("chacha", "Key or IV not supplied for decryption"))
                     return
                 try:
-                    print(f"Decrypted text: {chacha_parse(args[1], key=key, IV=iv, decrypt=True)}")
+                    print(f"Decrypted text: {chacha_parse(ciphertext, key=key, IV=iv, decrypt=True, rounds=rounds, **self._check_option())}")
+                except WrongKeyError as error:
+                    print(self._create_error_msg("chacha", f"Could not decrypt: {error}"))
                 except:
                     print(self._create_error_msg("chacha", "There was an error in decryption. Check your ciphertext!"))
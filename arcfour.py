@@ -3,6 +3,14 @@
 '''
 
 import secrets
+from functools import lru_cache
+import batch
+import engines
+import instrumentation
+import nonces
+import pipeline
+import prefetch
+import progress as progress_reports
 
 def bytearray_to_bitarray(array):
     '''
@@ -57,24 +65,53 @@ def generate_keystream(key):
     # print()
     return keystream
 
-def arcfour_encrypt(text, key=None, ransom=False, **kwargs):
+@lru_cache(maxsize=256)
+def key_state(key):
+    '''
+        Function which returns the (cached) S-box left by the key schedule
+        for a key given as bytes, as a tuple so the snapshot cannot be
+        modified by the generator
+    '''
+    state = list(range(256))
+    j = 0
+    for i in range(256):
+        j = (j + state[i] + key[i % len(key)]) % 256
+        state[i], state[j] = state[j], state[i]
+    return tuple(state)
+
+def engine_keystream(key):
+    '''
+        Function which generates the same keystream as generate_keystream,
+        starting the generator from a copy of the cached key state instead of
+        running the key schedule again
+    '''
+    return bytes(pseudorandomise(list(key_state(bytes(key))), 256))
+
+def arcfour_encrypt(text, key=None, ransom=False, engine=None, progress=None, **kwargs):
     '''
         Function wrapper for arcfour_parse (for encryption)
     '''
-    package = arcfour_parse(text, key=key, ransom=ransom)
+    package = arcfour_parse(text, key=key, ransom=ransom, engine=engine, progress=progress)
     return package[0], package[1], None
 
-def arcfour_decrypt(text, key=None, ransom=False, **kwargs):
+def arcfour_decrypt(text, key=None, ransom=False, engine=None, progress=None, **kwargs):
     '''
         Function wrapper for arcfour_parse (for decryption)
     '''
-    return arcfour_parse(text, key=key, ransom=ransom, decrypt=True)
+    return arcfour_parse(text, key=key, ransom=ransom, decrypt=True, engine=engine, progress=progress)
 
-def arcfour_parse(text, key=None, decrypt=False, ransom=False):
+@instrumentation.instrumented("arcfour")
+def arcfour_parse(text, key=None, decrypt=False, ransom=False, engine=None, progress=None):
     '''
         Function which encrypts AND decrypts the given text using the arcfour
-        PRNG.
+        PRNG. <engine> names the engine to use (see ENGINES) and defaults to
+        ENGINE. <progress> is an optional callback reporting the bytes done
+        (see progress)
     '''
+    engine = engines.resolve("arcfour", engine, ENGINE, None, instrumentation.payload_size(text, decrypt and not ransom),
+                             decrypt=decrypt)
+    if engine != "reference":
+        return engine_parse(ENGINES[engine], text, key, decrypt, ransom, progress)
     if not ransom:
         if not decrypt:
             text = bytearray(text, 'utf-8')
@@ -82,16 +119,19 @@ def arcfour_parse(text, key=None, decrypt=False, ransom=False):
             text = bytearray.fromhex(text)
 
     if key is None:
-        key = bytearray(secrets.token_bytes(16))          # 128 bits
+        key = bytearray(nonces.token_bytes(16))          # 128 bits
     else:
         key = bytearray.fromhex(key)
 
     keystream = generate_keystream(key)
+    tracker = progress_reports.tracker(progress, len(text), 256)
     output = ""
     for index, byte in enumerate(text):
         new_byte = bytearray([byte ^ keystream[index % 256]])
         new_byte = f"{bitarray_to_int(bytearray_to_bitarray(new_byte)):02x}"
         output += new_byte
+        if tracker is not None:
+            tracker.advance(1)
     
     key = ''.join(f'{x:02x}' for x in key)
     if not decrypt:
@@ -102,6 +142,161 @@ def arcfour_parse(text, key=None, decrypt=False, ransom=False):
             return output_i.to_bytes((len(output) * 4) // 8, byteorder='big')
         return output_i.to_bytes((len(output) * 4) // 8, byteorder='big').decode('utf-8')
 
+# ------------------------------------------------------------------------------
+#   Bulk engine
+#
+#   XORs the whole message with the (repeated) keystream as one big integer
+#   instead of formatting every byte through a bit list. The per-byte loop in
+#   arcfour_parse is the reference verify.py checks the engine against. The
+#   S-box left by the key schedule is cached per key (key_state), so repeated
+#   messages under a key only run the generator.
+# ------------------------------------------------------------------------------
+
+def bulk_engine(key, data):
+    '''
+        Engine which encrypts/decrypts <data> in a single big-integer XOR
+    '''
+    with instrumentation.timed("arcfour", "key_setup"):
+        keystream = engine_keystream(key)
+    return xor_keystream(data, keystream)
+
+def xor_keystream(data, keystream):
+    '''
+        Function which XORs <data> with the 256-byte <keystream> repeated to
+        its length
+    '''
+    length = len(data)
+    # ArcFour works byte by byte, so every byte counts as a block
+    with instrumentation.timed("arcfour", "cipher", length):
+        keystream = (keystream * (length // 256 + 1))[:length]
+        return (int.from_bytes(data, 'big') ^ int.from_bytes(keystream, 'big')).to_bytes(length, 'big')
+
+def engine_parse(engine, text, key, decrypt, ransom, progress=None):
+    '''
+        Function which handles key generation and output formatting around an
+        engine, mirroring arcfour_parse
+    '''
+    with instrumentation.timed("arcfour", "decode" if decrypt else "encode", len(text)):
+        if ransom:
+            text = bytes(text)
+        else:
+            text = bytes.fromhex(text) if decrypt else text.encode('utf-8')
+    key = nonces.token_bytes(16) if key is None else bytes.fromhex(key)
+    if progress is None:
+        output = engine(key, text)
+    else:
+        # The keystream repeats every 256 bytes, so 256-byte blocks are independent
+        output = progress_reports.chunked(lambda chunk: engine(key, bytes(chunk)), text, 256, progress)
+    if not decrypt:
+        with instrumentation.timed("arcfour", "encode", len(output)):
+            return output.hex(), key.hex()
+    if not output:
+        raise ValueError("No ciphertext to decrypt")
+    if ransom:
+        return output
+    with instrumentation.timed("arcfour", "decode", len(output)):
+        return output.decode('utf-8')
+
+def parse_chunk(texts, key, decrypt, ransom, engine):
+    '''
+        Function which encrypts/decrypts a list of texts under one key with
+        the named engine, for encrypt_many/decrypt_many. The keystream only
+        depends on the key, so the bulk engine generates it once per chunk.
+    '''
+    if engine == "reference":
+        return [arcfour_parse(text, key, decrypt, ransom, engine) if decrypt
+                else arcfour_parse(text, key, decrypt, ransom, engine)[0] for text in texts]
+    if engine == "bulk":
+        with instrumentation.timed("arcfour", "key_setup"):
+            keystream = engine_keystream(bytes.fromhex(key))
+        engine = lambda key, data: xor_keystream(data, keystream)
+    else:
+        engine = ENGINES[engine]
+    if decrypt:
+        return [engine_parse(engine, text, key, decrypt, ransom) for text in texts]
+    return [engine_parse(engine, text, key, decrypt, ransom)[0] for text in texts]
+
+def encrypt_many(texts, key, ransom=False, engine=None, executor=None, workers=None, reuse_keystream=False):
+    '''
+        Function which encrypts many messages under one key, generating the
+        keystream once per chunk of messages instead of once per message.
+
+        ArcFour takes no nonce, so every message is encrypted with the same
+        keystream: XORing two of the ciphertexts gives the XOR of their
+        plaintexts, which usually reveals both. The call therefore raises
+        ValueError unless <reuse_keystream> accepts this. Messages needing
+        confidentiality from each other should use a cipher with a nonce per
+        message (chacha.encrypt_many, or aes.encrypt_many in CTR mode).
+
+        Inputs:
+            texts       (iterable) - The plaintexts
+            key         (str)      - Hexadecimal key shared by every message
+            ransom      (bool)     - Whether the plaintexts are bytes
+            engine      (str)      - Engine name. Defaults to ENGINE
+            executor    (Executor) - Optional pool to fan the chunks out to
+            workers     (int)      - Optional number of processes to fan out to
+            reuse_keystream (bool) - Whether to accept that the messages share
+                                      one keystream
+        Returns:
+            results     (list)     - The hexadecimal ciphertexts, in order
+    '''
+    if not reuse_keystream:
+        raise ValueError("ArcFour encrypts every message under one key with the same keystream. "
+                         "Pass reuse_keystream=True to accept this, or use a cipher with a nonce per message")
+    return batch.cipher_many("arcfour", parse_chunk, texts, key, False, ransom, default=ENGINE, ransom=ransom,
+                             engine=engine, executor=executor, workers=workers)
+
+def decrypt_many(texts, key, ransom=False, engine=None, executor=None, workers=None):
+    '''
+        Function which decrypts many messages under one key. Takes the same
+        options as encrypt_many and returns the plaintexts in order.
+    '''
+    return batch.cipher_many("arcfour", parse_chunk, texts, key, True, ransom, default=ENGINE, ransom=ransom,
+                             engine=engine, decrypt=True, executor=executor, workers=workers)
+
+def stream_chunk(engine, key, offset, chunk, final):
+    '''
+        Function which encrypts the chunk of a message starting at <offset>,
+        for stream_encrypt. The keystream repeats every 256 bytes, so chunks
+        at multiples of 256 bytes are independent.
+    '''
+    return engine(key, bytes(chunk))
+
+def stream_encrypt(key=None, engine=None, chunk_size=pipeline.CHUNK_SIZE, **kwargs):
+    '''
+        Function which prepares the encryption of a message in consecutive
+        chunks (see pipeline.run_pipeline), producing the same ciphertext as
+        arcfour_encrypt with ransom=True.
+
+        Returns (transform, key, None) with the key as a hexadecimal string,
+        or None if the engine (eg. "reference") cannot work in chunks
+    '''
+    engine = engines.engine_function("arcfour", engine, ENGINE, None, chunk_size)
+    if engine is None:
+        return None
+    key = nonces.token_bytes(16) if key is None else bytes.fromhex(key)
+    return pipeline.ChunkTransform(stream_chunk, engine, key, parallel=True), key.hex(), None
+
+def keystream_prefetcher(key, engine=None, depth=prefetch.DEPTH, decrypt=False):
+    '''
+        Function which returns a prefetch.KeystreamPrefetcher generating the
+        keystream of <key> (given as bytes) in the background. Its xor() then
+        encrypts/decrypts data as it arrives; <decrypt> picks the engine tuned
+        for decryption.
+    '''
+    return prefetch.stream_prefetcher("arcfour", engine, ENGINE, key, depth=depth, decrypt=decrypt)
+
+# Engine used when none is given to arcfour_parse. "auto" lets
+# engines.select() pick the fastest engine for the payload size.
+ENGINE = "auto"
+ENGINES = {
+    "bulk" : bulk_engine
+}
+TRIAL_KEY = secrets.token_bytes(16)
+instrumentation.register_cache("arcfour key state", key_state.cache_info)
+engines.register_cipher("arcfour", ENGINES, engines.stream_trial(TRIAL_KEY))
+
+
 if "__main__" == __name__:
     key, text  = arcfour_parse("The quick brown fox jumps over the lazy dog.", key="63727970746969")
     print(f"Your encrypted text is: {text}\nYour key is: {key}")
@@ -0,0 +1,97 @@
+'''
+    Module which runs many small cipher calls under one key.
+
+    The cipher modules' encrypt_many/decrypt_many (see cipher_many) split
+    their items into chunks and hand each chunk to a chunk function, either
+    in this process or across a process pool. Each process sets the key up once per chunk (the
+    key schedules are cached), so the per-message cost is the cipher work
+    itself rather than parsing, engine selection and schedule generation.
+'''
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import engines
+import instrumentation
+
+# Items per chunk handed to a worker process
+CHUNK_SIZE = 256
+
+def chunked(items, size):
+    '''
+        Function which splits an iterable into lists of <size> items
+    '''
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def run_many(function, items, *args, executor=None, workers=None, chunk_size=CHUNK_SIZE):
+    '''
+        Function which calls function(chunk, *args) over the chunks of
+        <items> and returns the concatenated results in order.
+
+        Inputs:
+            function    (callable) - Module-level chunk function returning a
+                                      list with one result per item
+            items       (iterable) - The items to process
+            executor    (Executor) - Pool to run the chunks on. If None and
+                                      <workers> is given, a process pool of
+                                      <workers> processes is used for this call
+            workers     (int)      - Number of processes, or None to run the
+                                      chunks in this process
+            chunk_size  (int)      - Items per chunk
+        Returns:
+            results     (list)     - One result per item, in order
+    '''
+    if executor is None and not workers:
+        return function(list(items), *args)
+    results = []
+    task = partial(function_call, function, args)
+    if executor is not None:
+        for chunk_results in executor.map(task, chunked(items, chunk_size)):
+            results += chunk_results
+        return results
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk_results in pool.map(task, chunked(items, chunk_size)):
+            results += chunk_results
+    return results
+
+def function_call(function, args, chunk):
+    '''
+        Function which calls function(chunk, *args), so a chunk can be mapped
+        over a pool
+    '''
+    return function(chunk, *args)
+
+def cipher_many(algo, function, items, key, *args, default, mode=None, ransom=False, engine=None,
+                decrypt=False, executor=None, workers=None):
+    '''
+        Function which runs the encrypt_many/decrypt_many of a cipher module.
+        The engine is picked once for the whole batch, from the size of its
+        first chunk, and function(chunk, key, *args, engine) is run over the
+        chunks with run_many.
+
+        Inputs:
+            algo        (str)      - Name of the cipher (see engines.select)
+            function    (callable) - Module-level chunk function of the cipher
+            items       (iterable) - The messages, or (message, IV) pairs
+            key         (str)      - Hexadecimal key shared by every message
+            default     (str)      - The module's ENGINE, used if <engine> is None
+            mode        (str)      - Mode of operation, or None for stream ciphers
+            ransom      (bool)     - Whether the messages are bytes
+            decrypt     (bool)     - Whether the messages are ciphertexts
+            engine, executor, workers - As for encrypt_many
+        Returns:
+            results     (list)     - One result per item, in order
+    '''
+    items = list(items)
+    if not key and not decrypt:
+        raise ValueError("encrypt_many needs the key shared by the messages")
+    size = sum(instrumentation.payload_size(item[0] if isinstance(item, (tuple, list)) else item,
+                                            decrypt and not ransom) for item in items[:CHUNK_SIZE])
+    engine = engines.resolve(algo, engine, default, mode, size, decrypt)
+    return run_many(function, items, key, *args, engine, executor=executor, workers=workers)
@@ -0,0 +1,259 @@
+'''
+    Module which benchmarks every cipher, mode and engine.
+
+    Two modes are available:
+        throughput  - Best time per call and MB/s (default)
+        memory      - tracemalloc peak per call, and the bytes and blocks
+                      the call allocates (in total, not only those still
+                      alive when it returns) per payload byte and per MB
+
+    Allocations are counted by sampling the traced memory and the number of
+    allocated blocks on every line the call executes and adding up the
+    increases (see AllocationCounter). Memory allocated and freed within a
+    single line is not seen, so the counts are a lower bound, but they grow
+    with every temporary a line leaves behind, which is what the per-call
+    allocation cost is about.
+
+    The memory mode can save its ratios as a baseline and fail the run when a
+    later run allocates more per payload byte than the baseline allows.
+
+    Usage:
+        python benchmark.py [--memory] [--size BYTES] [--repeat N]
+                            [--cipher NAME ...] [--engine NAME ...]
+                            [--save-baseline FILE] [--baseline FILE]
+                            [--tolerance FRACTION]
+'''
+import argparse
+import json
+import secrets
+import sys
+import time
+import tracemalloc
+
+import aes
+import arcfour
+import chacha
+import des
+from caesar_encryptor import caesar_encrypt, caesar_decrypt, caesar_crack
+from piecewise_encryptor import piecewise_encrypt, piecewise_decrypt
+
+ALPHABET = "abcdefghijklmnopqrstuvwxyz"
+MEGABYTE = 1024 * 1024
+
+def block_cipher_cases(name, module, encrypt, decrypt, key_bytes, block_size, size, engines):
+    '''
+        Function which generates the benchmark cases of a block cipher: one per
+        mode, engine and direction
+    '''
+    payload = secrets.token_bytes(size)
+    key = secrets.token_bytes(key_bytes).hex()
+    IV = secrets.token_bytes(block_size).hex()
+    for mode in module.MODES:
+        # Every engine produces the same ciphertext, so prepare it with the fastest one
+        ciphertext = encrypt(bytearray(payload), key=key, mode=mode, IV=IV, ransom=True,
+                             engine=next(iter(module.ENGINES), "reference"))[0]
+        cipher_bytes = bytes.fromhex(ciphertext)
+        for engine in ["reference"] + list(module.ENGINES):
+            if engines and engine not in engines:
+                continue
+            yield (f"{name} {mode} {engine} encrypt", size,
+                   lambda engine=engine, mode=mode: lambda data=bytearray(payload):
+                        encrypt(data, key=key, mode=mode, IV=IV, ransom=True, engine=engine))
+            yield (f"{name} {mode} {engine} decrypt", size,
+                   lambda engine=engine, mode=mode, cipher_bytes=cipher_bytes: lambda data=bytearray(cipher_bytes):
+                        decrypt(data, key, mode=mode, IV=IV, ransom=True, engine=engine))
+
+def stream_cipher_cases(name, module, parse, size, engines, **kwargs):
+    '''
+        Function which generates the benchmark cases of a stream cipher: one
+        per engine and direction
+    '''
+    payload = secrets.token_bytes(size)
+    ciphertext = bytes.fromhex(parse(bytearray(payload), ransom=True, **kwargs)[0])
+    for engine in ["reference"] + list(module.ENGINES):
+        if engines and engine not in engines:
+            continue
+        yield (f"{name} {engine} encrypt", size,
+               lambda engine=engine: lambda data=bytearray(payload):
+                    parse(data, ransom=True, engine=engine, **kwargs))
+        yield (f"{name} {engine} decrypt", size,
+               lambda engine=engine: lambda data=bytearray(ciphertext):
+                    parse(data, decrypt=True, ransom=True, engine=engine, **kwargs))
+
+def chacha_cases(size, engines, key, IV):
+    '''
+        Function which generates the benchmark cases of every ChaCha round
+        tier. The default tier keeps the plain "ChaCha" label.
+    '''
+    for tier, rounds in chacha.ROUND_TIERS.items():
+        name = "ChaCha" if rounds == chacha.DEFAULT_ROUNDS else tier.replace("chacha", "ChaCha")
+        yield from stream_cipher_cases(name, chacha, chacha.chacha_parse, size, engines, key=key, IV=IV, rounds=rounds)
+
+def text_cipher_cases(size, engines):
+    '''
+        Function which generates the benchmark cases of the text-only ciphers
+    '''
+    if engines and "reference" not in engines:
+        return
+    text = ''.join(ALPHABET[b % 26] for b in secrets.token_bytes(size))
+    caesar_text = caesar_encrypt(text, 7, ALPHABET)
+    piecewise_text = piecewise_encrypt(text, 777)
+    yield ("Caesar reference encrypt", size, lambda: lambda: caesar_encrypt(text, 7, ALPHABET))
+    yield ("Caesar reference decrypt", size, lambda: lambda: caesar_decrypt(caesar_text, 7, ALPHABET))
+    yield ("Caesar reference crack", size, lambda: lambda: caesar_crack(caesar_text, ALPHABET))
+    yield ("Piecewise reference encrypt", size, lambda: lambda: piecewise_encrypt(text, 777))
+    yield ("Piecewise reference decrypt", size, lambda: lambda: piecewise_decrypt(piecewise_text, 777))
+
+def benchmark_cases(size, ciphers=None, engines=None):
+    '''
+        Function which generates every benchmark case as a tuple of
+        (label, payload size, prepare) where prepare() returns a zero-argument
+        callable bound to fresh inputs
+    '''
+    key = secrets.token_bytes(32).hex()
+    IV = secrets.token_bytes(12).hex()
+    generators = {
+        "aes" : lambda: block_cipher_cases("AES", aes, aes.aes_encrypt, aes.aes_decrypt, 16, 16, size, engines),
+        "des" : lambda: block_cipher_cases("DES", des, des.encrypt_des, des.decrypt_des, 8, 8, size, engines),
+        "chacha" : lambda: chacha_cases(size, engines, key, IV),
+        "arcfour" : lambda: stream_cipher_cases("ArcFour", arcfour, arcfour.arcfour_parse, size, engines, key=key),
+        "text" : lambda: text_cipher_cases(size, engines)
+    }
+    for name, generator in generators.items():
+        if ciphers and name not in ciphers:
+            continue
+        yield from generator()
+
+def measure_time(prepare, repeat):
+    '''
+        Function which returns the best wall time of <repeat> calls
+    '''
+    best = None
+    for i in range(repeat):
+        run = prepare()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+class AllocationCounter:
+    '''
+        Trace function which samples the traced memory and the number of
+        allocated blocks at every line, call and return, and adds up the
+        increases between samples as the bytes and blocks allocated. Memory
+        freed later does not cancel what was allocated before.
+    '''
+    def __init__(self):
+        self.bytes = 0
+        self.blocks = 0
+        self._memory = tracemalloc.get_traced_memory()[0]
+        self._count = sys.getallocatedblocks()
+
+    def sample(self):
+        '''
+            Function which adds the allocations since the previous sample
+        '''
+        memory, count = tracemalloc.get_traced_memory()[0], sys.getallocatedblocks()
+        self.bytes += max(0, memory - self._memory)
+        self.blocks += max(0, count - self._count)
+        self._memory, self._count = memory, count
+
+    def __call__(self, frame, event, arg):
+        self.sample()
+        return self
+
+def measure_memory(prepare):
+    '''
+        Function which returns the tracemalloc peak of a call (in bytes, above
+        the memory already in use) and the bytes and blocks it allocated.
+        tracemalloc must already be tracing.
+    '''
+    run = prepare()
+    start = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    counter = AllocationCounter()
+    sys.settrace(counter)
+    try:
+        result = run()
+    finally:
+        sys.settrace(None)
+    counter.sample()
+    peak = tracemalloc.get_traced_memory()[1] - start
+    del result
+    return peak, counter.bytes, counter.blocks
+
+def run_throughput(cases, repeat):
+    '''
+        Function which prints the throughput of every case
+    '''
+    print(f"{'Case':<34} {'Best time':>12} {'MB/s':>10}")
+    for label, size, prepare in cases:
+        elapsed = measure_time(prepare, repeat)
+        print(f"{label:<34} {elapsed * 1000:>10.2f}ms {size / elapsed / MEGABYTE:>10.3f}")
+
+def run_memory(cases):
+    '''
+        Function which prints the memory footprint of every case and returns
+        the bytes allocated per payload byte, keyed by case label
+    '''
+    ratios = {}
+    print(f"{'Case':<34} {'Peak (B)':>14} {'Allocated (B)':>16} {'B/byte':>10} {'Allocated per MB':>18} "
+          f"{'Blocks':>10} {'Blocks/byte':>12}")
+    tracemalloc.start()
+    try:
+        for label, size, prepare in cases:
+            peak, allocated, blocks = measure_memory(prepare)
+            ratios[label] = allocated / size
+            print(f"{label:<34} {peak:>14,} {allocated:>16,} {allocated / size:>10.1f} "
+                  f"{allocated / size * MEGABYTE:>18,.0f} {blocks:>10,} {blocks / size:>12.2f}")
+    finally:
+        tracemalloc.stop()
+    return ratios
+
+def check_baseline(ratios, baseline, tolerance):
+    '''
+        Function which compares memory ratios against a baseline. Returns a list
+        of messages for every case whose ratio grew by more than <tolerance>.
+    '''
+    regressions = []
+    for label, ratio in ratios.items():
+        if label in baseline and ratio > baseline[label] * (1 + tolerance):
+            regressions.append(f"{label}: {ratio:.1f} B/byte (baseline {baseline[label]:.1f} B/byte)")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the 3ncrypt0r ciphers")
+    parser.add_argument("--memory", action="store_true", help="report tracemalloc memory footprint instead of time")
+    parser.add_argument("--size", type=int, default=1024, help="payload size in bytes (default 1024)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed calls per case (default 3)")
+    parser.add_argument("--cipher", nargs="*", choices=["aes", "des", "chacha", "arcfour", "text"], help="ciphers to run")
+    parser.add_argument("--engine", nargs="*", help="engines to run (default all)")
+    parser.add_argument("--save-baseline", metavar="FILE", help="save memory ratios to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="fail if memory ratios exceed those in FILE")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed growth over the baseline (default 0.1)")
+    args = parser.parse_args(argv)
+
+    cases = benchmark_cases(args.size, args.cipher, args.engine)
+    if not args.memory:
+        run_throughput(cases, args.repeat)
+        return 0
+
+    ratios = run_memory(cases)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(ratios, baseline_file, indent=4, sort_keys=True)
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = check_baseline(ratios, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print("\nMemory regressions:")
+            for regression in regressions:
+                print(f"    {regression}")
+            return 1
+        print("\nNo memory regressions against baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
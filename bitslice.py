@@ -0,0 +1,457 @@
+'''
+    Module which implements bitsliced block ciphers on Python big-int lanes.
+
+    Instead of encrypting one block at a time, a batch of blocks is
+    transposed into bit-planes: plane i is an integer holding bit i of every
+    block in the batch, one block per bit. Every gate of the cipher then
+    becomes a single big-int operation acting on all blocks at once, so the
+    interpreter overhead is paid once per batch instead of once per block.
+
+    Bits are numbered from the most significant bit of the first byte of a
+    block, so plane 8 * j + i holds bit i (0 = MSB) of byte j.
+'''
+
+# Blocks transformed per pass. Larger batches amortise more overhead but the
+# planes stop fitting in cache.
+LANES = 8192
+
+def lane_masks(width):
+    '''
+        Function which returns the byte-repeated masks used to transpose
+        <width>-byte lanes
+    '''
+    return [int.from_bytes(bytes([mask]) * width, 'big') for mask in (0x0f, 0x33, 0x55)]
+
+def transpose_8x8(rows, masks):
+    '''
+        Function which transposes, within every byte position, the 8x8 bit
+        matrix formed by 8 integers (bit c of row r becomes bit r of row c).
+        The transpose is its own inverse.
+    '''
+    rows = list(rows)
+    for k, mask in zip((4, 2, 1), masks):
+        for r in range(8):
+            if r & k:
+                continue
+            t = ((rows[r] >> k) ^ rows[r + k]) & mask
+            rows[r + k] ^= t
+            rows[r] ^= t << k
+    return rows
+
+def to_planes(data, block_size):
+    '''
+        Function which transposes <data> (8 * width blocks of <block_size>
+        bytes) into 8 * block_size bit-planes of 8 * width bits.
+        Returns the planes and the lane width in bytes.
+    '''
+    group = len(data) // 8
+    width = group // block_size
+    masks = lane_masks(width)
+    planes = []
+    for j in range(block_size):
+        # Row r holds byte j of the blocks in group r, one block per byte
+        rows = [int.from_bytes(data[r * group + j : (r + 1) * group : block_size], 'big') for r in range(8)]
+        planes.extend(reversed(transpose_8x8(rows, masks)))
+    return planes, width
+
+def from_planes(planes, block_size, width):
+    '''
+        Function which reverses to_planes()
+    '''
+    group = width * block_size
+    masks = lane_masks(width)
+    output = bytearray(8 * group)
+    for j in range(block_size):
+        rows = transpose_8x8(reversed(planes[8 * j : 8 * (j + 1)]), masks)
+        for r in range(8):
+            output[r * group + j : (r + 1) * group : block_size] = rows[r].to_bytes(width, 'big')
+    return bytes(output)
+
+def run_lanes(transform, data, block_size):
+    '''
+        Function which runs <transform> (a function of the planes and the
+        all-ones lane mask) over <data> in batches of at most LANES blocks.
+        The last batch is padded with zero blocks which are dropped again.
+    '''
+    output = []
+    step = LANES * block_size
+    for start in range(0, len(data), step):
+        chunk = bytes(data[start : start + step])
+        lanes = -(-len(chunk) // (8 * block_size)) * 8
+        planes, width = to_planes(chunk.ljust(lanes * block_size, b'\x00'), block_size)
+        planes = transform(planes, (1 << (8 * width)) - 1)
+        output.append(from_planes(planes, block_size, width)[:len(chunk)])
+    return b''.join(output)
+
+
+# ====================================================================
+#                                 AES
+# ====================================================================
+
+def aes_sbox(u0, u1, u2, u3, u4, u5, u6, u7, ones):
+    '''
+        Function which evaluates the AES S-box on bit-planes (u0 = MSB) using
+        the 113 gate circuit of Boyar and Peralta. Returns the 8 output planes.
+    '''
+    # Top linear layer
+    t1 = u0 ^ u3
+    t2 = u0 ^ u5
+    t3 = u0 ^ u6
+    t4 = u3 ^ u5
+    t5 = u4 ^ u6
+    t6 = t1 ^ t5
+    t7 = u1 ^ u2
+    t8 = u7 ^ t6
+    t9 = u7 ^ t7
+    t10 = t6 ^ t7
+    t11 = u1 ^ u5
+    t12 = u2 ^ u5
+    t13 = t3 ^ t4
+    t14 = t6 ^ t11
+    t15 = t5 ^ t11
+    t16 = t5 ^ t12
+    t17 = t9 ^ t16
+    t18 = u3 ^ u7
+    t19 = t7 ^ t18
+    t20 = t1 ^ t19
+    t21 = u6 ^ u7
+    t22 = t7 ^ t21
+    t23 = t2 ^ t22
+    t24 = t2 ^ t10
+    t25 = t20 ^ t17
+    t26 = t3 ^ t16
+    t27 = t1 ^ t12
+
+    # Non-linear middle layer (inversion in GF(2^8))
+    m1 = t13 & t6
+    m2 = t23 & t8
+    m3 = t14 ^ m1
+    m4 = t19 & u7
+    m5 = m4 ^ m1
+    m6 = t3 & t16
+    m7 = t22 & t9
+    m8 = t26 ^ m6
+    m9 = t20 & t17
+    m10 = m9 ^ m6
+    m11 = t1 & t15
+    m12 = t4 & t27
+    m13 = m12 ^ m11
+    m14 = t2 & t10
+    m15 = m14 ^ m11
+    m16 = m3 ^ m2
+    m17 = m5 ^ t24
+    m18 = m8 ^ m7
+    m19 = m10 ^ m15
+    m20 = m16 ^ m13
+    m21 = m17 ^ m15
+    m22 = m18 ^ m13
+    m23 = m19 ^ t25
+    m24 = m22 ^ m23
+    m25 = m22 & m20
+    m26 = m21 ^ m25
+    m27 = m20 ^ m21
+    m28 = m23 ^ m25
+    m29 = m28 & m27
+    m30 = m26 & m24
+    m31 = m20 & m23
+    m32 = m27 & m31
+    m33 = m27 ^ m25
+    m34 = m21 & m22
+    m35 = m24 & m34
+    m36 = m24 ^ m25
+    m37 = m21 ^ m29
+    m38 = m32 ^ m33
+    m39 = m23 ^ m30
+    m40 = m35 ^ m36
+    m41 = m38 ^ m40
+    m42 = m37 ^ m39
+    m43 = m37 ^ m38
+    m44 = m39 ^ m40
+    m45 = m42 ^ m41
+    m46 = m44 & t6
+    m47 = m40 & t8
+    m48 = m39 & u7
+    m49 = m43 & t16
+    m50 = m38 & t9
+    m51 = m37 & t17
+    m52 = m42 & t15
+    m53 = m45 & t27
+    m54 = m41 & t10
+    m55 = m44 & t13
+    m56 = m40 & t23
+    m57 = m39 & t19
+    m58 = m43 & t3
+    m59 = m38 & t22
+    m60 = m37 & t20
+    m61 = m42 & t1
+    m62 = m45 & t4
+    m63 = m41 & t2
+
+    # Bottom linear layer (including the affine transform)
+    l0 = m61 ^ m62
+    l1 = m50 ^ m56
+    l2 = m46 ^ m48
+    l3 = m47 ^ m55
+    l4 = m54 ^ m58
+    l5 = m49 ^ m61
+    l6 = m62 ^ l5
+    l7 = m46 ^ l3
+    l8 = m51 ^ m59
+    l9 = m52 ^ m53
+    l10 = m53 ^ l4
+    l11 = m60 ^ l2
+    l12 = m48 ^ m51
+    l13 = m50 ^ l0
+    l14 = m52 ^ m61
+    l15 = m55 ^ l1
+    l16 = m56 ^ l0
+    l17 = m57 ^ l1
+    l18 = m58 ^ l8
+    l19 = m63 ^ l4
+    l20 = l0 ^ l1
+    l21 = l1 ^ l7
+    l22 = l3 ^ l12
+    l23 = l18 ^ l2
+    l24 = l15 ^ l9
+    l25 = l6 ^ l10
+    l26 = l7 ^ l9
+    l27 = l8 ^ l10
+    l28 = l11 ^ l14
+    l29 = l11 ^ l17
+    return [l6 ^ l24, l16 ^ l26 ^ ones, l19 ^ l28 ^ ones, l6 ^ l21,
+            l20 ^ l22, l25 ^ l29, l13 ^ l27 ^ ones, l6 ^ l23 ^ ones]
+
+def aes_inverse_affine(b, ones):
+    '''
+        Function which applies the inverse of the S-box affine transform
+        (including its constant) to the 8 bit-planes of a byte (b[0] = MSB)
+    '''
+    # Bit k (LSB numbering) becomes b_{k+2} ^ b_{k+5} ^ b_{k+7}, then ^ 0x05
+    bit = [b[7 - k] for k in range(8)]
+    out = [bit[(k + 2) % 8] ^ bit[(k + 5) % 8] ^ bit[(k + 7) % 8] for k in range(8)]
+    out[0] ^= ones
+    out[2] ^= ones
+    return out[::-1]
+
+def aes_inverse_sbox(b, ones):
+    '''
+        Function which evaluates the inverse AES S-box on the 8 bit-planes of
+        a byte. As S(x) = A(x^-1), S^-1(y) = A^-1(S(A^-1(y))).
+    '''
+    return aes_inverse_affine(aes_sbox(*aes_inverse_affine(b, ones), ones), ones)
+
+def aes_xtime(a):
+    '''
+        Function which multiplies the 8 bit-planes of a byte by 2 in GF(2^8)
+    '''
+    return [a[1], a[2], a[3], a[4] ^ a[0], a[5] ^ a[0], a[6], a[7] ^ a[0], a[0]]
+
+def aes_mix_columns(state):
+    '''
+        Function which applies MixColumns to a bitsliced state (16 bytes of 8
+        bit-planes, column-major)
+    '''
+    output = []
+    for c in range(4):
+        column = state[4 * c : 4 * (c + 1)]
+        total = [column[0][i] ^ column[1][i] ^ column[2][i] ^ column[3][i] for i in range(8)]
+        for r in range(4):
+            a, b = column[r], column[(r + 1) % 4]
+            doubled = aes_xtime([a[i] ^ b[i] for i in range(8)])
+            output.append([a[i] ^ total[i] ^ doubled[i] for i in range(8)])
+    return output
+
+def aes_inv_mix_columns(state):
+    '''
+        Function which applies InvMixColumns to a bitsliced state, as
+        MixColumns after multiplying by (04 x^2 + 05)
+    '''
+    premixed = []
+    for c in range(4):
+        column = state[4 * c : 4 * (c + 1)]
+        u = aes_xtime(aes_xtime([column[0][i] ^ column[2][i] for i in range(8)]))
+        v = aes_xtime(aes_xtime([column[1][i] ^ column[3][i] for i in range(8)]))
+        for r in range(4):
+            mask = u if r % 2 == 0 else v
+            premixed.append([column[r][i] ^ mask[i] for i in range(8)])
+    return aes_mix_columns(premixed)
+
+# ShiftRows as a permutation of the column-major byte positions
+AES_SHIFT_ROWS = [r + 4 * ((c + r) % 4) for c in range(4) for r in range(4)]
+AES_INV_SHIFT_ROWS = [AES_SHIFT_ROWS.index(j) for j in range(16)]
+
+class BitslicedAES:
+    '''
+        Class which encrypts/decrypts batches of AES blocks given the round
+        key words produced by aes.expand_key
+    '''
+    def __init__(self, round_keys):
+        self.rounds = len(round_keys) // 4 - 1
+        # Round key bits as flags for every plane, one list per round
+        self.round_key_bits = []
+        for r in range(self.rounds + 1):
+            key = b''.join(word.to_bytes(4, 'big') for word in round_keys[4 * r : 4 * (r + 1)])
+            self.round_key_bits.append([(key[j] >> (7 - i)) & 1 for j in range(16) for i in range(8)])
+
+    def add_round_key(self, state, r, ones):
+        bits = self.round_key_bits[r]
+        return [[plane ^ ones if bits[8 * j + i] else plane for i, plane in enumerate(byte)]
+                for j, byte in enumerate(state)]
+
+    def encrypt_planes(self, planes, ones):
+        state = [planes[8 * j : 8 * (j + 1)] for j in range(16)]
+        state = self.add_round_key(state, 0, ones)
+        for r in range(1, self.rounds + 1):
+            state = [aes_sbox(*byte, ones) for byte in state]
+            state = [state[j] for j in AES_SHIFT_ROWS]
+            if r != self.rounds:
+                state = aes_mix_columns(state)
+            state = self.add_round_key(state, r, ones)
+        return [plane for byte in state for plane in byte]
+
+    def decrypt_planes(self, planes, ones):
+        state = [planes[8 * j : 8 * (j + 1)] for j in range(16)]
+        state = self.add_round_key(state, self.rounds, ones)
+        for r in range(self.rounds - 1, -1, -1):
+            state = [state[j] for j in AES_INV_SHIFT_ROWS]
+            state = [aes_inverse_sbox(byte, ones) for byte in state]
+            state = self.add_round_key(state, r, ones)
+            if r:
+                state = aes_inv_mix_columns(state)
+        return [plane for byte in state for plane in byte]
+
+    def encrypt_bytes(self, data):
+        '''
+            Function which encrypts every 16-byte block of <data> (ECB)
+        '''
+        return run_lanes(self.encrypt_planes, data, 16)
+
+    def decrypt_bytes(self, data):
+        '''
+            Function which decrypts every 16-byte block of <data> (ECB)
+        '''
+        return run_lanes(self.decrypt_planes, data, 16)
+
+
+# ====================================================================
+#                                 DES
+# ====================================================================
+
+def lookup_circuit(outputs, inputs):
+    '''
+        Function which builds a gate circuit for a lookup table of <inputs>
+        input bits, given as one truth table (list of 0/1 indexed by the
+        input value, MSB first) per output bit. Each output is decomposed as
+        a tree of multiplexers f = f0 ^ (x & (f0 ^ f1)) with constants folded
+        and identical sub-functions shared between outputs.
+
+        Returns (gates, outputs): wires 0 to inputs - 1 are the inputs (MSB
+        first) and wire <inputs> is the all-ones constant. Gate i, a tuple of
+        (is_xor, a, b), writes wire inputs + 1 + i. <outputs> lists the wire
+        of every output bit.
+    '''
+    ones = inputs
+    gates = []
+    shared = {}
+
+    def gate(is_xor, a, b):
+        gates.append((is_xor, a, b))
+        return inputs + len(gates)
+
+    def build(table, depth):
+        # Returns the wire of the function <table> of inputs depth onwards,
+        # or None for the zero function
+        if not any(table):
+            return None
+        if all(table):
+            return ones
+        if (table, depth) not in shared:
+            half = len(table) // 2
+            f0, f1 = build(table[:half], depth + 1), build(table[half:], depth + 1)
+            if f0 == f1:
+                wire = f0
+            else:
+                difference = f1 if f0 is None else f0 if f1 is None else gate(True, f0, f1)
+                selected = depth if difference == ones else gate(False, depth, difference)
+                wire = selected if f0 is None else gate(True, f0, selected)
+            shared[(table, depth)] = wire
+        return shared[(table, depth)]
+
+    return gates, [build(tuple(table), 0) for table in outputs]
+
+def run_circuit(circuit, inputs, ones):
+    '''
+        Function which evaluates a circuit built by lookup_circuit on
+        bit-planes
+    '''
+    gates, outputs = circuit
+    wires = list(inputs)
+    wires.append(ones)
+    append = wires.append
+    for is_xor, a, b in gates:
+        append(wires[a] ^ wires[b] if is_xor else wires[a] & wires[b])
+    return [wires[output] for output in outputs]
+
+def des_sbox_circuits(s_boxes):
+    '''
+        Function which builds the circuits of the DES S-boxes. The input is
+        the 6-bit chunk (the outer bits select the row, the inner bits the
+        column) and the outputs are the 4 bits of the S-box value, MSB first.
+    '''
+    circuits = []
+    for s_box in s_boxes:
+        values = [s_box[((chunk >> 4) & 2) | (chunk & 1)][(chunk >> 1) & 0xf] for chunk in range(64)]
+        circuits.append(lookup_circuit([[(value >> (3 - bit)) & 1 for value in values] for bit in range(4)], 6))
+    return circuits
+
+class BitslicedDES:
+    '''
+        Class which encrypts/decrypts batches of DES blocks. The permutations
+        are wire renames on the bit-planes, so only the S-boxes and the key
+        and round XORs cost operations. Triple DES runs its three stages of
+        16 rounds between a single initial and final permutation, swapping
+        the halves between stages.
+
+        Inputs:
+            subkeys         (list)   - The 16 subkeys (48 for triple DES) as
+                                        tuples of eight 6-bit chunks (see
+                                        des.create_schedule)
+            circuits        (list)   - The S-box circuits (des_sbox_circuits)
+            initial_p       (list)   - The tables of des.py (1-indexed)
+            final_p         (list)
+            expansion       (list)
+            permutation     (list)
+    '''
+    def __init__(self, subkeys, circuits, initial_p, final_p, expansion, permutation):
+        self.subkey_bits = [[(chunk >> (5 - i)) & 1 for chunk in subkey for i in range(6)] for subkey in subkeys]
+        self.circuits = circuits
+        self.initial_p = [bit - 1 for bit in initial_p]
+        self.final_p = [bit - 1 for bit in final_p]
+        self.expansion = [bit - 1 for bit in expansion]
+        self.permutation = [bit - 1 for bit in permutation]
+
+    def feistel_planes(self, planes, subkey_bits, ones):
+        planes = [planes[bit] for bit in self.initial_p]
+        left, right = planes[:32], planes[32:]
+        for stage in range(0, len(subkey_bits), 16):
+            for bits in subkey_bits[stage : stage + 16]:
+                expanded = [right[bit] ^ ones if key_bit else right[bit] for bit, key_bit in zip(self.expansion, bits)]
+                substituted = []
+                for i, circuit in enumerate(self.circuits):
+                    substituted += run_circuit(circuit, expanded[6 * i : 6 * (i + 1)], ones)
+                left, right = right, [plane ^ substituted[bit] for plane, bit in zip(left, self.permutation)]
+            left, right = right, left
+        planes = left + right
+        return [planes[bit] for bit in self.final_p]
+
+    def encrypt_bytes(self, data):
+        '''
+            Function which encrypts every 8-byte block of <data> (ECB)
+        '''
+        return run_lanes(lambda planes, ones: self.feistel_planes(planes, self.subkey_bits, ones), data, 8)
+
+    def decrypt_bytes(self, data):
+        '''
+            Function which decrypts every 8-byte block of <data> (ECB)
+        '''
+        return run_lanes(lambda planes, ones: self.feistel_planes(planes, self.subkey_bits[::-1], ones), data, 8)
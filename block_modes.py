@@ -0,0 +1,398 @@
+'''
+    Module which implements the block cipher modes of operation on integer
+    blocks, for use by the optimised AES and DES engines.
+
+    The modes follow the exact conventions of the bit-list implementations in
+    aes.py and des.py (eg. CTR XORs the block counter into the IV rather than
+    adding it), so both paths produce identical ciphertext.
+
+    A cipher here is any object exposing encrypt_block(int) and
+    decrypt_block(int). The modes whose blocks are independent can also be
+    run by run_parallel() on a batch cipher exposing encrypt_bytes(bytes) and
+    decrypt_bytes(bytes), which transform every block of a buffer at once.
+    run_mode_into() writes into a caller-owned buffer instead of returning
+    new bytes, so streaming callers can recycle their buffers. It reads and
+    writes the blocks as big-endian 64-bit words with struct's unpack_from
+    and pack_into, straight on the buffers, so no bytes object or slice is
+    created per block.
+'''
+import struct
+
+def pad(data, block_size, aligned_pad=None):
+    '''
+        Function which pads <data> up to a multiple of <block_size> with zero
+        bytes, followed by a final byte holding the number of padding bytes.
+        If <data> is already aligned, <aligned_pad> bytes of padding are added
+        (a full block by default; des.py historically adds 64 bytes).
+    '''
+    to_pad = block_size - len(data) % block_size
+    if to_pad == block_size and aligned_pad is not None:
+        to_pad = aligned_pad
+    return bytes(data) + bytes(to_pad - 1) + bytes([to_pad])
+
+def unpad(data):
+    '''
+        Function which strips the padding added by pad(). Raises ValueError
+        if the padding is invalid or nothing would remain, just as the
+        bit-list implementations fail when decrypting with a wrong key.
+    '''
+    if not data:
+        raise ValueError("No data to unpad")
+    to_remove = data[-1]
+    if to_remove == 0 or to_remove >= len(data):
+        raise ValueError("Invalid padding")
+    return data[:-to_remove]
+
+def to_blocks(data, block_size):
+    '''
+        Function which splits <data> into a list of integer blocks. Trailing
+        bytes that do not fill a whole block are dropped.
+    '''
+    return [int.from_bytes(data[i : i + block_size], 'big')
+            for i in range(0, len(data) - block_size + 1, block_size)]
+
+def from_blocks(blocks, block_size):
+    '''
+        Function which joins a list of integer blocks back into bytes
+    '''
+    return b''.join([block.to_bytes(block_size, 'big') for block in blocks])
+
+def do_ECB(cipher, blocks, IV, decrypt=False):
+    '''
+        Function which handles ECB encryption/decryption
+    '''
+    transform = cipher.decrypt_block if decrypt else cipher.encrypt_block
+    return [transform(block) for block in blocks]
+
+def do_CBC(cipher, blocks, IV, decrypt=False):
+    '''
+        Function which handles CBC encryption/decryption
+    '''
+    output = []
+    if not decrypt:
+        encrypt_block = cipher.encrypt_block
+        for block in blocks:
+            IV = encrypt_block(block ^ IV)
+            output.append(IV)
+    else:
+        decrypt_block = cipher.decrypt_block
+        for block in blocks:
+            output.append(decrypt_block(block) ^ IV)
+            IV = block
+    return output
+
+def do_PCBC(cipher, blocks, IV, decrypt=False):
+    '''
+        Function which handles PCBC encryption/decryption
+    '''
+    output = []
+    if not decrypt:
+        encrypt_block = cipher.encrypt_block
+        for block in blocks:
+            outputblock = encrypt_block(block ^ IV)
+            IV = block ^ outputblock
+            output.append(outputblock)
+    else:
+        decrypt_block = cipher.decrypt_block
+        for block in blocks:
+            outputblock = decrypt_block(block) ^ IV
+            IV = block ^ outputblock
+            output.append(outputblock)
+    return output
+
+def do_CTR(cipher, blocks, IV, decrypt=False):
+    '''
+        Function which handles CTR encryption/decryption
+    '''
+    encrypt_block = cipher.encrypt_block
+    return [encrypt_block(IV ^ counter) ^ block for counter, block in enumerate(blocks)]
+
+def do_CFB(cipher, blocks, IV, decrypt=False):
+    '''
+        Function which handles CFB encryption/decryption
+    '''
+    output = []
+    encrypt_block = cipher.encrypt_block
+    for block in blocks:
+        outputblock = encrypt_block(IV) ^ block
+        IV = block if decrypt else outputblock
+        output.append(outputblock)
+    return output
+
+def do_OFB(cipher, blocks, IV, decrypt=False):
+    '''
+        Function which handles OFB encryption/decryption
+    '''
+    output = []
+    encrypt_block = cipher.encrypt_block
+    for block in blocks:
+        IV = encrypt_block(IV)
+        output.append(IV ^ block)
+    return output
+
+
+MODES = {
+    "ECB" : do_ECB,
+    "CBC" : do_CBC,
+    "PCBC" : do_PCBC,
+    "CTR" : do_CTR,
+    "CFB" : do_CFB,
+    "OFB" : do_OFB
+}
+
+def run_mode(cipher, mode, data, IV, block_size, decrypt=False):
+    '''
+        Function which encrypts/decrypts <data> with <cipher> under the given
+        mode of operation.
+
+        Inputs:
+            cipher      (object) - Object exposing encrypt_block/decrypt_block
+            mode        (str)    - One of the keys of MODES
+            data        (bytes)  - Data whose length is a multiple of block_size
+            IV          (bytes)  - Initialisation vector, or None for ECB
+            block_size  (int)    - Block size of the cipher in bytes
+        Returns:
+            output      (bytes)  - The transformed data
+    '''
+    if mode != "ECB" and not IV:
+        raise ValueError(f"An IV is required for {mode} mode")
+    IV = int.from_bytes(IV, 'big') if IV else 0
+    blocks = MODES[mode](cipher, to_blocks(data, block_size), IV, decrypt=decrypt)
+    return from_blocks(blocks, block_size)
+
+# Big-endian 64-bit word layout of a block, per block size
+BLOCK_WORDS = {8 : struct.Struct(">Q"), 16 : struct.Struct(">QQ")}
+WORD_MASK = (1 << 64) - 1
+
+def block_accessors(block_size, source, destination):
+    '''
+        Function which returns functions reading the integer block at an
+        offset of <source> and writing one at an offset of <destination>
+    '''
+    words = BLOCK_WORDS[block_size]
+    if block_size == 8:
+        def read(start):
+            return words.unpack_from(source, start)[0]
+        def write(start, block):
+            words.pack_into(destination, start, block)
+    else:
+        def read(start):
+            high, low = words.unpack_from(source, start)
+            return high << 64 | low
+        def write(start, block):
+            words.pack_into(destination, start, block >> 64, block & WORD_MASK)
+    return read, write
+
+def run_mode_into(cipher, mode, source, destination, IV, block_size, decrypt=False):
+    '''
+        Function which encrypts/decrypts <source> into the caller-owned buffer
+        <destination> with <cipher> under the given mode of operation,
+        producing the same bytes as run_mode(). Every block is read before
+        its output is written, so <source> and <destination> may be the same
+        buffer in every mode.
+
+        Inputs:
+            cipher      (object)     - Object exposing encrypt_block/decrypt_block
+            mode        (str)        - One of the keys of MODES
+            source      (buffer)     - Data whose length is a multiple of block_size
+            destination (buffer)     - Writable buffer at least as long as <source>
+            IV          (bytes)      - Initialisation vector, or None for ECB
+            block_size  (int)        - Block size of the cipher in bytes
+        Returns:
+            written     (int)        - Number of bytes written to <destination>
+    '''
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}'")
+    if mode != "ECB" and not IV:
+        raise ValueError(f"An IV is required for {mode} mode")
+    source = memoryview(source).cast('B')
+    destination = memoryview(destination).cast('B')
+    length = len(source)
+    if length % block_size != 0:
+        raise ValueError(f"The input must be a multiple of {block_size} bytes")
+    if len(destination) < length:
+        raise ValueError("The destination buffer is smaller than the input")
+    read, write = block_accessors(block_size, source, destination)
+    backward = decrypt and mode in ("ECB", "CBC", "PCBC")
+    transform = cipher.decrypt_block if backward else cipher.encrypt_block
+    state = initial = int.from_bytes(IV, 'big') if IV else 0
+    for counter, start in enumerate(range(0, length, block_size)):
+        block = read(start)
+        if mode == "ECB":
+            output = transform(block)
+        elif mode == "CTR":
+            output = transform(initial ^ counter) ^ block
+        elif mode == "OFB":
+            state = transform(state)
+            output = state ^ block
+        elif mode == "CFB":
+            output = transform(state) ^ block
+            state = block if decrypt else output
+        elif backward:
+            output = transform(block) ^ state
+            state = block if mode == "CBC" else block ^ output
+        else:
+            output = transform(block ^ state)
+            state = output if mode == "CBC" else block ^ output
+        write(start, output)
+    return length
+
+# (mode, decrypt) pairs whose blocks can be transformed independently
+PARALLEL_MODES = {("ECB", False), ("ECB", True), ("CTR", False), ("CTR", True),
+                  ("CBC", True), ("CFB", True)}
+
+def is_parallel(mode, decrypt=False):
+    '''
+        Function which returns whether <mode> can be run by run_parallel()
+    '''
+    return (mode, decrypt) in PARALLEL_MODES
+
+def xor_bytes(data1, data2):
+    '''
+        Function which XORs two byte strings of equal length
+    '''
+    return (int.from_bytes(data1, 'big') ^ int.from_bytes(data2, 'big')).to_bytes(len(data1), 'big')
+
+def run_parallel(cipher, mode, data, IV, block_size, decrypt=False):
+    '''
+        Function which encrypts/decrypts <data> with a batch cipher under one
+        of the PARALLEL_MODES. Takes the same arguments as run_mode() and
+        produces identical output.
+    '''
+    if mode != "ECB" and not IV:
+        raise ValueError(f"An IV is required for {mode} mode")
+    data = bytes(data[:len(data) - len(data) % block_size])
+    if not data:
+        return b''
+    if mode == "ECB":
+        return cipher.decrypt_bytes(data) if decrypt else cipher.encrypt_bytes(data)
+    if mode == "CTR":
+        IV = int.from_bytes(IV, 'big')
+        counters = from_blocks([IV ^ counter for counter in range(len(data) // block_size)], block_size)
+        return xor_bytes(cipher.encrypt_bytes(counters), data)
+    # CBC and CFB decryption chain on the previous ciphertext block
+    previous = bytes(IV) + data[:-block_size]
+    if mode == "CBC":
+        return xor_bytes(cipher.decrypt_bytes(data), previous)
+    return xor_bytes(cipher.encrypt_bytes(previous), data)
+
+class BlockBatch:
+    '''
+        Class which exposes a per-block cipher (encrypt_block/decrypt_block)
+        as a batch cipher (encrypt_bytes/decrypt_bytes)
+    '''
+    def __init__(self, cipher, block_size):
+        self.cipher = cipher
+        self.block_size = block_size
+
+    def encrypt_bytes(self, data):
+        encrypt_block = self.cipher.encrypt_block
+        return from_blocks([encrypt_block(block) for block in to_blocks(data, self.block_size)], self.block_size)
+
+    def decrypt_bytes(self, data):
+        decrypt_block = self.cipher.decrypt_block
+        return from_blocks([decrypt_block(block) for block in to_blocks(data, self.block_size)], self.block_size)
+
+def run_interleaved(cipher, mode, messages, IVs, block_size, decrypt=False):
+    '''
+        Function which encrypts/decrypts many independent messages at once
+        with a batch cipher. Step i transforms block i of every message in a
+        single batch call, so even the chained modes are batched across
+        messages. Every message gets the same output as run_mode() would give.
+
+        Inputs:
+            cipher      (object) - Object exposing encrypt_bytes/decrypt_bytes
+            mode        (str)    - One of the keys of MODES
+            messages    (list)   - Messages as bytes; bytes that do not fill
+                                    a whole block are dropped
+            IVs         (list)   - Initialisation vector of every message as
+                                    bytes, or None for ECB
+            block_size  (int)    - Block size of the cipher in bytes
+        Returns:
+            outputs     (list)   - The transformed messages, in order
+    '''
+    if mode != "ECB" and not all(IVs):
+        raise ValueError(f"An IV is required for {mode} mode")
+    counts = [len(message) // block_size for message in messages]
+    outputs = [bytearray() for message in messages]
+    state = [bytes(IV) if IV else None for IV in IVs]
+    for step in range(max(counts, default=0)):
+        active = [i for i, count in enumerate(counts) if count > step]
+        start, end = step * block_size, (step + 1) * block_size
+        blocks = b''.join([messages[i][start:end] for i in active])
+        chain = b''.join([state[i] for i in active]) if mode != "ECB" else None
+        new_state = None
+        if mode == "ECB":
+            output = cipher.decrypt_bytes(blocks) if decrypt else cipher.encrypt_bytes(blocks)
+        elif mode == "CTR":
+            counters = b''.join([(int.from_bytes(IVs[i], 'big') ^ step).to_bytes(block_size, 'big') for i in active])
+            output = xor_bytes(cipher.encrypt_bytes(counters), blocks)
+        elif mode in ("CBC", "PCBC"):
+            if decrypt:
+                output = xor_bytes(cipher.decrypt_bytes(blocks), chain)
+            else:
+                output = cipher.encrypt_bytes(xor_bytes(blocks, chain))
+            if mode == "PCBC":
+                new_state = xor_bytes(blocks, output)
+            else:
+                new_state = blocks if decrypt else output
+        elif mode == "CFB":
+            output = xor_bytes(cipher.encrypt_bytes(chain), blocks)
+            new_state = blocks if decrypt else output
+        else:
+            new_state = cipher.encrypt_bytes(chain)
+            output = xor_bytes(new_state, blocks)
+        for k, i in enumerate(active):
+            outputs[i] += output[k * block_size : (k + 1) * block_size]
+            if new_state is not None:
+                state[i] = new_state[k * block_size : (k + 1) * block_size]
+    return [bytes(output) for output in outputs]
+
+class ModeStream:
+    '''
+        Class which runs a mode of operation over consecutive chunks of one
+        message with an engine (see aes.ENGINES), carrying the chaining value
+        from one chunk to the next, so the chunks join up to the output of a
+        single engine call. Every chunk must be a multiple of the block size.
+
+        ECB and CTR chunks only depend on their offset in the message, so
+        <parallel> is True and their chunks may be transformed in any order
+        (eg. on a process pool). The other modes must be fed in order.
+    '''
+    def __init__(self, engine, key, mode, IV, block_size, decrypt=False):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}'")
+        if mode != "ECB" and not IV:
+            raise ValueError(f"An IV is required for {mode} mode")
+        self.engine = engine
+        self.key = bytes(key)
+        self.mode = mode
+        self.IV = bytes(IV) if IV else None
+        self.block_size = block_size
+        self.decrypt = decrypt
+        self.parallel = mode in ("ECB", "CTR")
+
+    def update(self, offset, data):
+        '''
+            Function which transforms the chunk <data> starting <offset>
+            bytes into the message
+        '''
+        data = bytes(data)
+        block_size = self.block_size
+        if not data:
+            return b''
+        if self.mode == "CTR":
+            # Counters continue from the chunk's first block; CTR is ECB over
+            # the counter blocks XORed with the data
+            IV, first = int.from_bytes(self.IV, 'big'), offset // block_size
+            counters = from_blocks([IV ^ counter for counter in range(first, first + len(data) // block_size)], block_size)
+            return xor_bytes(self.engine(self.key, "ECB", None, counters), data)
+        output = self.engine(self.key, self.mode, self.IV, data, decrypt=self.decrypt)
+        if self.mode != "ECB":
+            last_input, last_output = data[-block_size:], output[-block_size:]
+            if self.mode in ("CBC", "CFB"):
+                self.IV = last_input if self.decrypt else last_output
+            else:
+                # PCBC chains on P ^ C, and in OFB P ^ C is the keystream block
+                self.IV = xor_bytes(last_input, last_output)
+        return output
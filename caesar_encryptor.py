@@ -1,9 +1,23 @@
+from collections import Counter
+import instrumentation
+
+# Relative frequencies (percent) of the letters in English text, used as the
+# default language model for cracking. The space is about one character in
+# six of prose; it only counts when the alphabet contains it.
+ENGLISH_FREQUENCIES = {
+    'a' : 8.167, 'b' : 1.492, 'c' : 2.782, 'd' : 4.253, 'e' : 12.702, 'f' : 2.228,
+    'g' : 2.015, 'h' : 6.094, 'i' : 6.966, 'j' : 0.153, 'k' : 0.772, 'l' : 4.025,
+    'm' : 2.406, 'n' : 6.749, 'o' : 7.507, 'p' : 1.929, 'q' : 0.095, 'r' : 5.987,
+    's' : 6.327, 't' : 9.056, 'u' : 2.758, 'v' : 0.978, 'w' : 2.360, 'x' : 0.150,
+    'y' : 1.974, 'z' : 0.074, ' ' : 19.18
+}
 
 def find_new_character(letter, cipher, alphabet):
     alphabet_length = len(alphabet)
     new_index = (alphabet.index(letter) + cipher) % alphabet_length
     return alphabet[new_index]
 
+@instrumentation.instrumented("caesar", "encrypt", hex_decrypt=False)
 def caesar_encrypt(payload, cipher, alphabet,
                     keep_case=False, whitespace=True, special_chars=False):
     '''
@@ -51,6 +65,7 @@ def caesar_encrypt(payload, cipher, alphabet,
     
     return encrypt_msg
 
+@instrumentation.instrumented("caesar", "decrypt", hex_decrypt=False)
 def caesar_decrypt(payload, cipher, alphabet,
                     keep_case=False, whitespace=True, special_chars=False):
     '''
@@ -98,8 +113,101 @@ def caesar_decrypt(payload, cipher, alphabet,
     
     return decrypt_msg
 
+def alphabet_histogram(payload, alphabet):
+    '''
+        Function which counts every character of <alphabet> in <payload> in
+        one pass, folding in the other case of letters the alphabet only has
+        in one case (as caesar_encrypt does with keep_case)
+    '''
+    counts = Counter(payload)
+    histogram = []
+    for letter in alphabet:
+        count = counts[letter]
+        for other in {letter.lower(), letter.upper()} - {letter}:
+            if other not in alphabet:
+                count += counts[other]
+        histogram.append(count)
+    return histogram
+
+def expected_frequencies(alphabet, frequencies=None, exclude=""):
+    '''
+        Function which returns the expected probability of every character of
+        <alphabet> under the language model <frequencies> (a dictionary of
+        character to relative frequency, English by default). Characters the
+        model has no (or a zero) frequency for, and characters in <exclude>,
+        are None: they are left out of the scoring.
+    '''
+    frequencies = ENGLISH_FREQUENCIES if frequencies is None else frequencies
+    weights = [None if letter in exclude else frequencies.get(letter, frequencies.get(letter.lower())) or None
+               for letter in alphabet]
+    total = sum(weight for weight in weights if weight is not None)
+    return [weight and weight / total for weight in weights]
+
+def score_shifts(histogram, expected):
+    '''
+        Function which scores every shift of a ciphertext histogram against
+        the expected probabilities with the chi-squared statistic (lower is
+        better). The histogram is rotated instead of decrypting the text, and
+        only the characters with an expected probability are compared.
+    '''
+    modelled = [index for index, probability in enumerate(expected) if probability is not None]
+    scores = []
+    for shift in range(len(histogram)):
+        # Plaintext letter j was encrypted to ciphertext letter j + shift
+        rotated = histogram[shift:] + histogram[:shift]
+        total = sum(rotated[index] for index in modelled)
+        if not total:
+            scores.append(float("inf"))
+            continue
+        scores.append(sum((rotated[index] - expected[index] * total) ** 2 / (expected[index] * total)
+                          for index in modelled))
+    return scores
+
+def caesar_crack(payload, alphabet, candidates=1, frequencies=None,
+                 keep_case=False, whitespace=True, special_chars=False):
+    '''
+        Function which recovers the shift of a Caesar Cipher ciphertext by
+        frequency analysis. The ciphertext is read once to build a histogram,
+        every shift is scored on the histogram, and only the best
+        <candidates> shifts are decrypted.
+
+        Arguments:
+            payload (str)   - Ciphertext to be cracked
+            alphabet (str)  - Alphabet the ciphertext was encrypted with
+
+        Keyword Arguments:
+            candidates      (int)   - Number of best shifts to decrypt
+            frequencies     (dict)  - Relative frequency of every character in
+                                        the plaintext language. Default is English.
+                                        Characters it lacks are not scored
+            keep_case, whitespace, special_chars - As for caesar_decrypt. With
+                                        whitespace, whitespace is not scored
+
+        Returns:
+            results         (list)  - (shift, chi-squared score, plaintext)
+                                        tuples, best first
+    '''
+    if not alphabet:
+        raise ValueError("Alphabet is empty")
+    histogram = alphabet_histogram(payload if keep_case else payload.lower(), alphabet)
+    # Whitespace kept in the text is not evidence of the shift, so it is left
+    # out of both the histogram and the model
+    excluded = "".join(letter for letter in alphabet if letter.isspace()) if whitespace else ""
+    histogram = [0 if letter in excluded else count for letter, count in zip(alphabet, histogram)]
+    if not sum(histogram):
+        raise ValueError("The text has no characters of the alphabet")
+    expected = expected_frequencies(alphabet, frequencies, excluded)
+    if all(probability is None for probability in expected):
+        raise ValueError("The language model has no characters of the alphabet")
+    scores = score_shifts(histogram, expected)
+    best = sorted(range(len(scores)), key=scores.__getitem__)[:max(1, candidates)]
+    return [(shift, scores[shift], caesar_decrypt(payload, shift, alphabet, keep_case=keep_case,
+                                                  whitespace=whitespace, special_chars=special_chars))
+            for shift in best]
+
 if __name__ == "__main__":
     e = caesar_encrypt("Hello my name is Andre mwhahahaha", 7, "abcdefghijklmnopqrstuvwxyz", keep_case=True)
     print(e)
     d = caesar_decrypt(e, 7, "abcdefghijklmnopqrstuvwxyz", keep_case=True)
-    print(d)
\ No newline at end of file
+    print(d)
+    print(caesar_crack(e, "abcdefghijklmnopqrstuvwxyz", keep_case=True)[0])
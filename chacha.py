@@ -4,9 +4,32 @@
 
 from random import random
 import secrets
+from functools import lru_cache
+import batch
+import block_modes
+import engines
+import instrumentation
+import key_check
+import nonces
+import numpy_backend
+import pipeline
+import prefetch
+import progress as progress_reports
 
 CONSTANT = "expand 32-byte k"
 PAD_BYTE = bytearray(1)[0]
+# Rounds applied to the state, alternating diagonal and column rounds. This
+# implementation has always applied 10 rounds under the name ChaCha20, so the
+# reduced tiers keep the proportions of ChaCha12 and ChaCha8. Fewer rounds are
+# only suitable for non-adversarial obfuscation. Ciphertext under any other
+# round count than the default records it in a key check header (see
+# key_check), so it is never decrypted with the wrong round count.
+ROUND_TIERS = {
+    "chacha20" : 10,
+    "chacha12" : 6,
+    "chacha8" : 4
+}
+DEFAULT_ROUNDS = ROUND_TIERS["chacha20"]
 
 def bytearray_to_bitarray(array):
     '''
@@ -106,12 +129,12 @@ def shuffle_matrix(matrix, cells):
 
     return matrix
 
-def randomise_matrix(matrix):
+def randomise_matrix(matrix, rounds=DEFAULT_ROUNDS):
     '''
         Function which uses ChaCha20's pseudorandomiser to generate a random
         matrix state
     '''
-    for i in range(10):
+    for i in range(rounds):
         if i % 2 == 0:
             matrix = shuffle_matrix(matrix, [0, 5, 10, 15])
             matrix = shuffle_matrix(matrix, [1, 6, 11, 12])
@@ -125,28 +148,68 @@ def randomise_matrix(matrix):
 
     return matrix
 
-def generate_keystream(key, IV, counter):
+def generate_keystream(key, IV, counter, rounds=DEFAULT_ROUNDS):
     matrix = init_matrix(key, IV, counter)
-    matrix = randomise_matrix(matrix)
+    matrix = randomise_matrix(matrix, rounds)
     return matrix
 
-def chacha_encrypt(text, key=None, IV=None, ransom=False, **kwargs):
+def check_rounds(rounds):
+    '''
+        Function which validates a round count, given as a number or as one
+        of the ROUND_TIERS names, and returns it as a number. None is the
+        default round count.
+    '''
+    if rounds is None:
+        return DEFAULT_ROUNDS
+    if isinstance(rounds, str):
+        if rounds.lower() in ROUND_TIERS:
+            return ROUND_TIERS[rounds.lower()]
+        rounds = int(rounds)
+    if rounds < 2 or rounds % 2 != 0:
+        raise ValueError(f"ChaCha needs a positive, even number of rounds, got {rounds}")
+    return rounds
+
+def records_rounds(rounds):
+    '''
+        Function which tells whether ciphertext under <rounds> carries a key
+        check header recording the round count even without check=True
+    '''
+    return check_rounds(rounds) != DEFAULT_ROUNDS
+
+def chacha_encrypt(text, key=None, IV=None, ransom=False, engine=None, rounds=DEFAULT_ROUNDS, check=False,
+                   progress=None, **kwargs):
     '''
         Wrapper function for chacha_parse specifically for ransomware mode
     '''
-    return chacha_parse(text, key=key, IV=IV, ransom=ransom)
+    return chacha_parse(text, key=key, IV=IV, ransom=ransom, engine=engine, rounds=rounds, check=check,
+                        progress=progress)
 
-def chacha_decrypt(text, key=None, IV=None, ransom=False, **kwargs):
+def chacha_decrypt(text, key=None, IV=None, ransom=False, engine=None, rounds=None, check=False, progress=None,
+                   **kwargs):
     '''
         Wrapper function for chacha_parse specifically for ransomware mode
     '''
-    return chacha_parse(text, key=key, IV=IV, decrypt=True, ransom=ransom)
+    return chacha_parse(text, key=key, IV=IV, decrypt=True, ransom=ransom, engine=engine, rounds=rounds, check=check,
+                        progress=progress)
 
-def chacha_parse(text, key=None, IV=None, decrypt=False, ransom=False):
+@key_check.checked("chacha", rounds=check_rounds)
+@instrumentation.instrumented("chacha")
+def chacha_parse(text, key=None, IV=None, decrypt=False, ransom=False, engine=None, rounds=None, progress=None):
     '''
         Function which encrypts/decrypts the given text using the ChaCha stream
-        cipher
+        cipher. <engine> names the engine to use (see ENGINES) and defaults to
+        ENGINE. <rounds> is a round count or a name from ROUND_TIERS, by
+        default DEFAULT_ROUNDS, or when decrypting the round count recorded in
+        the ciphertext. With check=True, or with a round count other than the
+        default, the ciphertext carries a key check header (see key_check).
+        <progress> is an optional callback reporting the bytes done (see
+        progress)
     '''
+    rounds = check_rounds(rounds)
+    engine = engines.resolve("chacha", engine, ENGINE, None, instrumentation.payload_size(text, decrypt and not ransom),
+                             decrypt=decrypt)
+    if engine != "reference":
+        return engine_parse(ENGINES[engine], text, key, IV, decrypt, ransom, rounds, progress)
     if not ransom:
         if not decrypt:
             text = bytearray(text, 'utf-8')
@@ -154,12 +217,12 @@ def chacha_parse(text, key=None, IV=None, decrypt=False, ransom=False):
             text = bytearray.fromhex(text)
 
     if key is None:
-        key = bytearray(secrets.token_bytes(32))          # 256 bits
+        key = bytearray(nonces.token_bytes(32))          # 256 bits
     else:
         key = bytearray.fromhex(key)
 
     if IV is None:
-        IV = bytearray(secrets.token_bytes(12))           # 96 bit nonce
+        IV = bytearray(nonces.token_bytes(12))           # 96 bit nonce
     else:
         IV = bytearray.fromhex(IV)
     
@@ -175,9 +238,10 @@ def chacha_parse(text, key=None, IV=None, decrypt=False, ransom=False):
         for i in range((to_pad // 8) - 1):
             text.append(PAD_BYTE)
         text.append(to_pad // 8)
+    tracker = progress_reports.tracker(progress, len(text), 64)
     text = bytearray_to_bitarray(text)
     
-    keystream = generate_keystream(key, IV, bytearray_to_bitarray(bytearray.fromhex('0' * 8)))
+    keystream = generate_keystream(key, IV, bytearray_to_bitarray(bytearray.fromhex('0' * 8)), rounds)
 
     output = ""
     for i in range(len(text) // 32):
@@ -189,6 +253,8 @@ def chacha_parse(text, key=None, IV=None, decrypt=False, ransom=False):
         if len(new_word) != 8:
             new_word = '0' * (8 - len(new_word)) + new_word
         output += new_word
+        if tracker is not None:
+            tracker.advance(4)
     
     key = bitarray_to_int(key)
     key = key.to_bytes((key.bit_length() + 7) // 8, 'big')
@@ -213,6 +279,236 @@ def chacha_parse(text, key=None, IV=None, decrypt=False, ransom=False):
             return output_i.to_bytes((len(output) * 4) // 8, byteorder='big')
         return output_i.to_bytes((len(output) * 4) // 8, byteorder='big').decode('utf-8').rstrip('\x00')
 
+# ------------------------------------------------------------------------------
+#   Word engine
+#
+#   Works on 32-bit integers rather than bit lists and XORs the whole message
+#   with the keystream as one big integer. It reproduces randomise_matrix
+#   exactly (including its round order and mixing steps), which verify.py
+#   confirms against the bit-list chacha_parse above.
+# ------------------------------------------------------------------------------
+
+CONSTANT_WORDS = [int.from_bytes(CONSTANT.encode('utf-8')[4 * i : 4 * (i + 1)], 'big') for i in range(4)]
+DIAGONALS = [(0, 5, 10, 15), (1, 6, 11, 12), (2, 7, 8, 13), (3, 4, 9, 14)]
+COLUMNS = [(0, 4, 8, 12), (1, 5, 9, 13), (2, 6, 10, 14), (3, 7, 11, 15)]
+
+@lru_cache(maxsize=256)
+def key_state(key):
+    '''
+        Function which returns the (cached) constant and key words of the
+        initial state for a key given as bytes, as a tuple so the snapshot
+        cannot be modified
+    '''
+    key_words = [int.from_bytes(key[4 * i : 4 * (i + 1)], 'big') for i in range(len(key) // 4)]
+    if len(key_words) == 4:
+        key_words = key_words * 2
+    return tuple(CONSTANT_WORDS + key_words)
+
+def init_words(key, IV, counter=0):
+    '''
+        Function which generates the initial state for ChaCha20 as 32-bit words
+        from a key and nonce given as bytes. Only the counter and nonce words
+        are converted; the rest is copied from the cached key state.
+    '''
+    nonce_words = [int.from_bytes(IV[4 * i : 4 * (i + 1)], 'big') for i in range(3)]
+    return list(key_state(bytes(key))) + [counter] + nonce_words
+
+def randomise_words(state, rounds=DEFAULT_ROUNDS):
+    '''
+        Function which applies the same rounds as randomise_matrix to a state
+        of 32-bit words
+    '''
+    state = list(state)
+    for i in range(rounds):
+        for a, b, c, d in (DIAGONALS if i % 2 == 0 else COLUMNS):
+            x0, x1, x2, x3 = state[a], state[b], state[c], state[d]
+            x0 = (x0 + x3) & 0xffffffff
+            x3 ^= x0
+            x3 = ((x3 << 16) | (x3 >> 16)) & 0xffffffff
+            x2 = (x2 + x3) & 0xffffffff
+            x1 ^= x2
+            x1 = ((x1 << 12) | (x1 >> 20)) & 0xffffffff
+            x0 = (x0 + x1) & 0xffffffff
+            x3 ^= x0
+            x3 = ((x3 << 8) | (x3 >> 24)) & 0xffffffff
+            x2 = (x2 + x3) & 0xffffffff
+            x1 ^= x2
+            x1 = ((x1 << 7) | (x1 >> 25)) & 0xffffffff
+            state[a], state[b], state[c], state[d] = x0, x1, x2, x3
+    return state
+
+def keystream_bytes(key, IV, rounds=DEFAULT_ROUNDS):
+    '''
+        Function which generates the 64-byte keystream block for a key and nonce
+    '''
+    return b''.join([word.to_bytes(4, 'big') for word in randomise_words(init_words(key, IV), rounds)])
+
+def xor_keystream(data, keystream):
+    '''
+        Function which XORs <data> with <keystream> repeated to its length
+    '''
+    length = len(data)
+    keystream = (keystream * (length // len(keystream) + 1))[:length]
+    return (int.from_bytes(data, 'big') ^ int.from_bytes(keystream, 'big')).to_bytes(length, 'big')
+
+def word_engine(key, IV, data, rounds=DEFAULT_ROUNDS):
+    '''
+        Engine which encrypts/decrypts <data> using 32-bit word arithmetic
+    '''
+    with instrumentation.timed("chacha", "key_setup"):
+        keystream = keystream_bytes(key, IV, rounds)
+    with instrumentation.timed("chacha", "cipher", (len(data) + 63) // 64):
+        return xor_keystream(data, keystream)
+
+def numpy_engine(key, IV, data, rounds=DEFAULT_ROUNDS):
+    '''
+        Engine which encrypts/decrypts <data> by XORing the keystream with
+        NumPy
+    '''
+    with instrumentation.timed("chacha", "key_setup"):
+        keystream = keystream_bytes(key, IV, rounds)
+    with instrumentation.timed("chacha", "cipher", (len(data) + 63) // 64):
+        return numpy_backend.xor_repeated(data, keystream)
+
+def engine_parse(engine, text, key, IV, decrypt, ransom, rounds=DEFAULT_ROUNDS, progress=None):
+    '''
+        Function which handles key/IV generation, padding and output
+        formatting around an engine, mirroring chacha_parse
+    '''
+    with instrumentation.timed("chacha", "decode" if decrypt else "encode", len(text)):
+        if ransom:
+            text = bytes(text)
+        else:
+            text = bytes.fromhex(text) if decrypt else text.encode('utf-8')
+    key = nonces.token_bytes(32) if key is None else bytes.fromhex(key)
+    IV = nonces.token_bytes(12) if IV is None else bytes.fromhex(IV)
+
+    if not decrypt:
+        with instrumentation.timed("chacha", "padding"):
+            to_pad = 4 - len(text) % 4
+            text = text + bytes(to_pad - 1) + bytes([to_pad])
+    text = text[:len(text) - len(text) % 4]
+    if progress is None:
+        output = engine(key, IV, text, rounds)
+    else:
+        output = progress_reports.chunked(lambda chunk: engine(key, IV, bytes(chunk), rounds), text, 64, progress)
+
+    key = f"{int.from_bytes(key, 'big'):02x}".rjust(64, '0')
+    IV = f"{int.from_bytes(IV, 'big'):02x}".rjust(24, '0')
+    if not decrypt:
+        with instrumentation.timed("chacha", "encode", len(output)):
+            return output.hex(), key, IV
+    with instrumentation.timed("chacha", "padding"):
+        output = block_modes.unpad(output)
+    if ransom:
+        return output
+    with instrumentation.timed("chacha", "decode", len(output)):
+        return output.decode('utf-8').rstrip('\x00')
+
+def parse_chunk(items, key, decrypt, ransom, rounds, engine):
+    '''
+        Function which encrypts/decrypts a list of (text, IV) items under one
+        key with the named engine, for encrypt_many/decrypt_many
+    '''
+    results = []
+    for text, IV in items:
+        # chacha_parse writes and reads the recorded round counts
+        output = chacha_parse(text, key, IV, decrypt, ransom, engine, rounds)
+        results.append(output if decrypt else (output[0], output[2]))
+    return results
+
+def encrypt_many(items, key, ransom=False, engine=None, executor=None, workers=None, rounds=DEFAULT_ROUNDS):
+    '''
+        Function which encrypts many messages under one key. The engine is
+        picked once for the whole batch; the keystream depends on the nonce,
+        so each message still generates its own keystream block.
+
+        Inputs:
+            items       (iterable) - (plaintext, IV) pairs, with the IV as a
+                                      hexadecimal string or None to generate one
+            key         (str)      - Hexadecimal key shared by every message
+            ransom      (bool)     - Whether the plaintexts are bytes
+            engine      (str)      - Engine name. Defaults to ENGINE
+            executor    (Executor) - Optional pool to fan the chunks out to
+            workers     (int)      - Optional number of processes to fan out to
+            rounds      (int)      - Round count or ROUND_TIERS name
+        Returns:
+            results     (list)     - (ciphertext, IV) hexadecimal pairs, in
+                                      order, as chacha_encrypt returns them
+    '''
+    return batch.cipher_many("chacha", parse_chunk, items, key, False, ransom, check_rounds(rounds), default=ENGINE,
+                             ransom=ransom, engine=engine, executor=executor, workers=workers)
+
+def decrypt_many(items, key, ransom=False, engine=None, executor=None, workers=None, rounds=None):
+    '''
+        Function which decrypts many messages under one key. Takes
+        (ciphertext, IV) pairs and the same options as encrypt_many, and
+        returns the plaintexts in order. Without <rounds>, each message is
+        decrypted with the round count it records.
+    '''
+    return batch.cipher_many("chacha", parse_chunk, items, key, True, ransom, rounds, default=ENGINE,
+                             ransom=ransom, engine=engine, decrypt=True, executor=executor, workers=workers)
+
+def stream_chunk(engine, key, IV, rounds, header, offset, chunk, final):
+    '''
+        Function which encrypts the chunk of a message starting at <offset>,
+        padding it if it is the final chunk and putting <header> in front of
+        the first one, for stream_encrypt. The keystream repeats every 64
+        bytes, so chunks at multiples of 64 bytes are independent.
+    '''
+    if final:
+        with instrumentation.timed("chacha", "padding"):
+            to_pad = 4 - len(chunk) % 4
+            chunk = bytes(chunk) + bytes(to_pad - 1) + bytes([to_pad])
+    output = engine(key, IV, bytes(chunk), rounds)
+    return header + output if offset == 0 else output
+
+def stream_encrypt(key=None, IV=None, engine=None, chunk_size=pipeline.CHUNK_SIZE, rounds=DEFAULT_ROUNDS, **kwargs):
+    '''
+        Function which prepares the encryption of a message in consecutive
+        chunks (see pipeline.run_pipeline), producing the same ciphertext as
+        chacha_encrypt with ransom=True, including the header recording a
+        round count other than the default.
+
+        Returns (transform, key, IV) with the key and IV as hexadecimal
+        strings, or None if the engine (eg. "reference") cannot work in chunks
+    '''
+    engine = engines.engine_function("chacha", engine, ENGINE, None, chunk_size)
+    if engine is None:
+        return None
+    key = nonces.token_bytes(32) if key is None else bytes.fromhex(key)
+    IV = nonces.token_bytes(12) if IV is None else bytes.fromhex(IV)
+    key, IV = f"{int.from_bytes(key, 'big'):02x}".rjust(64, '0'), f"{int.from_bytes(IV, 'big'):02x}".rjust(24, '0')
+    rounds = check_rounds(rounds)
+    header = key_check.make_header("chacha", key, None, IV, rounds) if records_rounds(rounds) else b''
+    transform = pipeline.ChunkTransform(stream_chunk, engine, bytes.fromhex(key), bytes.fromhex(IV), rounds, header,
+                                        parallel=True)
+    return transform, key, IV
+
+def keystream_prefetcher(key, IV, engine=None, depth=prefetch.DEPTH, rounds=DEFAULT_ROUNDS, decrypt=False):
+    '''
+        Function which returns a prefetch.KeystreamPrefetcher generating the
+        keystream of <key> and <IV> (given as bytes) in the background. Its
+        xor() then encrypts/decrypts unpadded data as it arrives; <decrypt>
+        picks the engine tuned for decryption.
+    '''
+    return prefetch.stream_prefetcher("chacha", engine, ENGINE, key, IV, depth=depth, decrypt=decrypt,
+                                      rounds=check_rounds(rounds))
+
+# Engine used when none is given to chacha_parse. "auto" lets engines.select()
+# pick the fastest engine for the payload size.
+ENGINE = "auto"
+ENGINES = {
+    "word" : word_engine
+}
+if numpy_backend.AVAILABLE:
+    ENGINES["numpy"] = numpy_engine
+TRIAL_KEY = secrets.token_bytes(32)
+TRIAL_IV = secrets.token_bytes(12)
+instrumentation.register_cache("chacha key state", key_state.cache_info)
+engines.register_cipher("chacha", ENGINES, engines.stream_trial(TRIAL_KEY, TRIAL_IV))
+
+
 if "__main__" == __name__:
     text, key, iv  = chacha_parse("The quick brown fox jumps over the lazy dog.")
     print(f"Your encrypted text is: {text}\nYour key is: {key}\nYour IV is: {iv}")
@@ -220,11 +516,11 @@ if "__main__" == __name__:
     print(f"Your decrypted text is: {text}")
     assert text == "The quick brown fox jumps over the lazy dog."
 
+    import progress
     # Stress test nonce and key generation:
-    print(f"Testing Key/IV Reliability: [{100 * ' '}] 0%", end='')
+    bar = progress.ProgressBar("Testing Key/IV Reliability: ")
     for i in range(10000):
-        print(f"\rTesting Key/IV Reliability: [{(i + 1) // 100 * '>' + (100 - ((i + 1) // 100)) * ' '}] {(i + 1)/100:.2f}%", end='')
         cipher, key, iv = chacha_parse("我是构建这个狡猾的实现的了不起的家伙。不要像农民一样侮辱我！ :3~~~")
         plaintext = chacha_parse(cipher, key=key, IV=iv, decrypt=True)
         assert plaintext == "我是构建这个狡猾的实现的了不起的家伙。不要像农民一样侮辱我！ :3~~~"
-    print()
+        bar(i + 1, 10000)
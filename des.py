@@ -1,5 +1,5 @@
 '''
-    Module which handles DES encryption
+    Module which handles DES and triple DES (EDE) encryption
 
     Verification sites:
     https://the-x.cn/en-US/cryptography/Des.aspx
@@ -10,8 +10,21 @@
     (Note for Cyberchef, it adds extra padding at the end)
 '''
 import secrets
+from functools import lru_cache
+import batch
+import bitslice
+import block_modes
+import engines
+import instrumentation
+import key_check
+import nonces
+import pipeline
+import prefetch
+import progress as progress_reports
 
 PAD_BYTE = bytearray(1)[0]
+# Key lengths in bytes of DES, 2-key and 3-key triple DES (EDE)
+KEY_SIZES = [8, 16, 24]
 KEY_BIT_ORDER1 = [  57, 49, 41, 33, 25, 17,  9,
                      1, 58, 50, 42, 34, 26, 18,
                     10,  2, 59, 51, 43, 35, 27,
@@ -149,7 +162,7 @@ def do_ECB(block, key, IV, *args, decrypt=False):
     '''
         Function which handles ECB encryption/decryption
     '''
-    outputblock = do_des(block, key, decrypt=decrypt)
+    outputblock = do_block(block, key, decrypt=decrypt)
     IV = outputblock
     return outputblock, IV
 
@@ -162,7 +175,7 @@ def do_CBC(block, key, IV, *args, decrypt=False):
         block = do_xor(block, IV)
     
     # Actual encryption
-    outputblock = do_des(block, key, decrypt=decrypt)
+    outputblock = do_block(block, key, decrypt=decrypt)
 
     # CBC handling for decryption
     if decrypt:
@@ -180,7 +193,7 @@ def do_PCBC(block, key, IV, counter, decrypt=False):
         block = do_xor(block, IV)
     
     # Actual encryption
-    outputblock = do_des(block, key, decrypt=decrypt)
+    outputblock = do_block(block, key, decrypt=decrypt)
 
     # PCBC handling for decryption
     if decrypt:
@@ -193,7 +206,7 @@ def do_CTR(block, key, IV, counter, decrypt=False):
         Function which handles CTR encryption/decryption
     '''
     nonce = do_xor(IV, int_to_bitarray(counter))
-    outputblock = do_des(nonce, key)
+    outputblock = do_block(nonce, key)
     outputblock = do_xor(outputblock, block)
     return outputblock, IV
 
@@ -201,7 +214,7 @@ def do_CFB(block, key, IV, *args, decrypt=False):
     '''
         Function which handles CFB encryption/decryption
     '''
-    outputblock = do_des(IV, key)
+    outputblock = do_block(IV, key)
     outputblock = do_xor(outputblock, block)
 
     if decrypt:
@@ -214,7 +227,7 @@ def do_OFB(block, key, IV, *args, decrypt=False):
     '''
         Function which handles OFB encryption/decryption
     '''
-    outputblock = do_des(IV, key)
+    outputblock = do_block(IV, key)
     IV = outputblock
     outputblock = do_xor(outputblock, block)
     return outputblock, IV
@@ -230,7 +243,9 @@ MODES = {
 }
 
 
-def encrypt_des(plaintext, key=None, mode="ECB", IV=None, ransom=False):
+@key_check.checked("des")
+@instrumentation.instrumented("des", "encrypt")
+def encrypt_des(plaintext, key=None, mode="ECB", IV=None, ransom=False, engine=None, key_size=8, progress=None):
     '''
         Function which encrypts a plaintext using the DES algorithm.
 
@@ -238,17 +253,30 @@ def encrypt_des(plaintext, key=None, mode="ECB", IV=None, ransom=False):
             plaintext   (str)    - String which is to be encrypted. Is converted
                                     to unicode
             key         (str)    - 64-bit hexadecimal string used to encrypt the
-                                    plaintext. If none is given, one is generated
+                                    plaintext, or 128/192-bit for 2-key/3-key
+                                    triple DES. If none is given, one is generated
             mode        (str)    - One of three modes (ECB, CBC, CTR). Default is
                                     ECB
             IV          (str)    - 64-bit hexadecimal string that must be given if
                                     mode is CBC or CTR.
+            engine      (str)    - Name of the engine to use (see ENGINES).
+                                    Defaults to ENGINE
+            key_size    (int)    - Length in bytes of a generated key (see
+                                    KEY_SIZES). Default is 8 (single DES)
+            check       (bool)   - Whether the ciphertext carries a key check
+                                    header (see key_check). Default is False
+            progress    (callable) - Optional callback called with the bytes
+                                    done, the bytes in total and the current and
+                                    average MB/s (see progress)
         Returns:
             cipher_hex  (str)    - The ciphertext in a hexadecimal string
             key         (str)    - The key used as a hexadecimal string
             IV          (str)    - The initialisation vector used, as a hexadecimal
                                     string. Is None if no IV given
     '''
+    engine = engines.resolve("des", engine, ENGINE, mode, instrumentation.payload_size(plaintext, False))
+    if engine != "reference":
+        return engine_encrypt(ENGINES[engine], plaintext, key, mode, IV, ransom, key_size, progress)
     # Parse plaintext as unicode bits
     if not ransom:
         plaintext_bytes = bytearray(plaintext, "utf-8")
@@ -267,10 +295,8 @@ def encrypt_des(plaintext, key=None, mode="ECB", IV=None, ransom=False):
 
     # Generate key if needed
     if not key:
-        key = bytearray(secrets.token_bytes(8))     # 64-bits
-        # Reroll key to ensure first byte will never be 0
-        while key[0] == 0:
-            key = bytearray(secrets.token_bytes(8))
+        # 64-bits, or 128/192 for triple DES. First byte will never be 0
+        key = bytearray(nonces.nonzero_bytes(key_size))
     else:
         # Convert hexadecimal key to binary bytes
         key = bytearray.fromhex(key)              
@@ -279,15 +305,14 @@ def encrypt_des(plaintext, key=None, mode="ECB", IV=None, ransom=False):
     # Check if initialisation vector needs to be generated
     if mode != "ECB":
         if not IV:
-            IV = bytearray(secrets.token_bytes(8))     # 64-bits
-            # Reroll IV to ensure first byte will never be 0
-            while IV[0] == 0:
-                IV = bytearray(secrets.token_bytes(8))
+            # 64-bits. First byte will never be 0
+            IV = bytearray(nonces.nonzero_bytes(8))
         else:
             IV = bytearray.fromhex(IV)
         IV = bytearray_to_bitarray(IV)
         initial_IV = IV
     plaintext_bytes = bytearray_to_bitarray(plaintext_bytes)
+    tracker = progress_reports.tracker(progress, len(plaintext_bytes) // 8, 8)
     
     # Encrypt plaintext in 64-bit blocks
     ciphertext = ""
@@ -296,6 +321,8 @@ def encrypt_des(plaintext, key=None, mode="ECB", IV=None, ransom=False):
 
         cipherblock, IV = MODES[mode](plaintext_block, key, IV, i)
         ciphertext += ''.join([str(b) for b in cipherblock])
+        if tracker is not None:
+            tracker.advance(8)
 
     # String together Ciphertext
     binary_string = ''.join([str(b) for b in ciphertext])
@@ -318,7 +345,9 @@ def encrypt_des(plaintext, key=None, mode="ECB", IV=None, ransom=False):
             initial_IV = '0' + initial_IV
     return cipher_hex, key, initial_IV
 
-def decrypt_des(ciphertext, key, mode="ECB", IV=None, ransom=False):
+@key_check.checked("des", decrypt=True)
+@instrumentation.instrumented("des", "decrypt")
+def decrypt_des(ciphertext, key, mode="ECB", IV=None, ransom=False, engine=None, progress=None):
     '''
         Function which decrypts a ciphertext using the DES algorithm.
 
@@ -326,14 +355,25 @@ def decrypt_des(ciphertext, key, mode="ECB", IV=None, ransom=False):
             plaintext   (str)    - String which is to be encrypted. Is converted
                                     to unicode
             key         (str)    - 64-bit hexadecimal string used to encrypt the
-                                    plaintext.
+                                    plaintext, or 128/192-bit for triple DES
             mode        (str)    - One of three modes (ECB, CBC, CTR). Default is
                                     ECB
             IV          (str)    - 64-bit hexadecimal string that must be given if
                                     mode is CBC or CTR.
+            engine      (str)    - Name of the engine to use (see ENGINES).
+                                    Defaults to ENGINE
+            check       (bool)   - Whether the ciphertext carries a key check
+                                    header (see key_check). Default is False
+            progress    (callable) - Optional callback called with the bytes
+                                    done, the bytes in total and the current and
+                                    average MB/s (see progress)
         Returns:
             plaintext   (str)    - The plaintext in unicode
     '''
+    engine = engines.resolve("des", engine, ENGINE, mode, instrumentation.payload_size(ciphertext, not ransom),
+                             decrypt=True)
+    if engine != "reference":
+        return engine_decrypt(ENGINES[engine], ciphertext, key, mode, IV, ransom, progress)
     plaintext = ""
 
     # Unpack input data
@@ -347,11 +387,14 @@ def decrypt_des(ciphertext, key, mode="ECB", IV=None, ransom=False):
     if mode != "ECB":
         IV = bytearray.fromhex(IV)
         IV = bytearray_to_bitarray(IV)
+    tracker = progress_reports.tracker(progress, len(cipher_bytes), 8)
 
     for i in range(len(cipher_bits) // 64):
         cipher_block = cipher_bits[i * 64 : (i + 1) * 64]
         plainblock, IV = MODES[mode](cipher_block, key, IV, i, decrypt=True)
         plaintext += ''.join([str(b) for b in plainblock])
+        if tracker is not None:
+            tracker.advance(8)
 
     # Strip padding
     to_remove = int(plaintext[-8:], 2) * 8
@@ -439,6 +482,30 @@ def feistel(subkey, right):
 
     return output
 
+def do_triple_des(plaintext, key, decrypt=False):
+    '''
+        Function which applies triple DES (EDE) with a 128-bit (K1, K2, K1)
+        or 192-bit (K1, K2, K3) key: encrypt with K1, decrypt with K2 and
+        encrypt with K3, or the inverse when decrypting
+    '''
+    keys = [key[i * 64 : (i + 1) * 64] for i in range(len(key) // 64)]
+    if len(keys) == 2:
+        keys.append(keys[0])
+    if decrypt:
+        keys.reverse()
+    block = do_des(plaintext, keys[0], decrypt=decrypt)
+    block = do_des(block, keys[1], decrypt=not decrypt)
+    return do_des(block, keys[2], decrypt=decrypt)
+
+def do_block(block, key, decrypt=False):
+    '''
+        Function which encrypts or decrypts a block with single DES, or with
+        triple DES for keys longer than 64 bits
+    '''
+    if len(key) > 64:
+        return do_triple_des(block, key, decrypt=decrypt)
+    return do_des(block, key, decrypt=decrypt)
+
 def do_des(plaintext, key, decrypt=False):
     '''
         Function
@@ -478,6 +545,418 @@ def do_des(plaintext, key, decrypt=False):
 
     return ciphertext
 
+# ------------------------------------------------------------------------------
+#   Integer engine
+#
+#   Works on 64-bit integers rather than bit lists: the initial/final
+#   permutations become eight byte-indexed lookups, and the expansion, S-boxes
+#   and P permutation of the Feistel function are folded into eight 64-entry
+#   tables (SP-boxes). Subkeys are computed once per key. verify.py compares it
+#   block by block with do_des and do_triple_des above.
+# ------------------------------------------------------------------------------
+
+def permute_int(value, table, in_bits):
+    '''
+        Function which applies a DES permutation table (1-indexed, MSB first)
+        to an integer of <in_bits> bits
+    '''
+    result = 0
+    for order_bit in table:
+        result = (result << 1) | ((value >> (in_bits - order_bit)) & 1)
+    return result
+
+def permutation_lookup(table):
+    '''
+        Function which builds byte-indexed lookup tables for a 64-bit
+        permutation, so that it can be applied with eight lookups
+    '''
+    lookup = []
+    for position in range(8):
+        shift = 56 - 8 * position
+        lookup.append([permute_int(byte << shift, table, 64) for byte in range(256)])
+    return lookup
+
+def sp_boxes():
+    '''
+        Function which combines each S-box with the P permutation, indexed by
+        the raw 6-bit S-box input
+    '''
+    boxes = []
+    for index, s_box in enumerate(S_BOXES):
+        box = []
+        for chunk in range(64):
+            row = ((chunk >> 4) & 2) | (chunk & 1)
+            col = (chunk >> 1) & 0xf
+            box.append(permute_int(s_box[row][col] << (28 - 4 * index), PERMUTATION, 32))
+        boxes.append(box)
+    return boxes
+
+IP_LOOKUP = permutation_lookup(INITIAL_P)
+FP_LOOKUP = permutation_lookup(INITIAL_P_INV)
+SP_BOXES = sp_boxes()
+
+def create_subkeys_int(key):
+    '''
+        Creates the 16 subkeys for a key given as bytes. Each subkey is
+        returned as a tuple of its eight 6-bit chunks.
+    '''
+    permuted = permute_int(int.from_bytes(key, 'big'), KEY_BIT_ORDER1, 64)
+    left, right = permuted >> 28, permuted & 0xfffffff
+    subkeys = []
+    for shift in KEY_ROTATION:
+        left = ((left << shift) | (left >> (28 - shift))) & 0xfffffff
+        right = ((right << shift) | (right >> (28 - shift))) & 0xfffffff
+        subkey = permute_int((left << 28) | right, KEY_BIT_ORDER2, 56)
+        subkeys.append(tuple((subkey >> (42 - 6 * i)) & 0x3f for i in range(8)))
+    return subkeys
+
+def create_schedule(key):
+    '''
+        Creates the subkeys of a DES key (8 bytes) or a 2-key/3-key triple
+        DES key (16/24 bytes), 16 per stage in the order they are applied:
+        K1 forwards, K2 reversed (decryption) and K3 (or K1 again) forwards.
+        Reversing the whole list gives the decryption schedule.
+    '''
+    if len(key) not in KEY_SIZES:
+        raise ValueError(f"DES keys must be {', '.join(str(size) for size in KEY_SIZES)} bytes, not {len(key)}")
+    if len(key) == 8:
+        return create_subkeys_int(key)
+    keys = [key[i : i + 8] for i in range(0, len(key), 8)]
+    if len(keys) == 2:
+        keys.append(keys[0])
+    return create_subkeys_int(keys[0]) + create_subkeys_int(keys[1])[::-1] + create_subkeys_int(keys[2])
+
+def apply_lookup(lookup, value):
+    '''
+        Function which applies a permutation built by permutation_lookup
+    '''
+    return  lookup[0][value >> 56] | lookup[1][(value >> 48) & 0xff] | \
+            lookup[2][(value >> 40) & 0xff] | lookup[3][(value >> 32) & 0xff] | \
+            lookup[4][(value >> 24) & 0xff] | lookup[5][(value >> 16) & 0xff] | \
+            lookup[6][(value >> 8) & 0xff] | lookup[7][value & 0xff]
+
+def feistel_rounds(block, subkeys):
+    '''
+        Function which runs the 16 Feistel rounds over a permuted 64-bit block
+    '''
+    sp0, sp1, sp2, sp3, sp4, sp5, sp6, sp7 = SP_BOXES
+    left, right = block >> 32, block & 0xffffffff
+    for k0, k1, k2, k3, k4, k5, k6, k7 in subkeys:
+        # Expansion: the eight 6-bit chunks are overlapping windows of right
+        wide = ((right & 1) << 33) | (right << 1) | (right >> 31)
+        left, right = right, left ^ (
+            sp0[((wide >> 28) & 0x3f) ^ k0] ^ sp1[((wide >> 24) & 0x3f) ^ k1] ^
+            sp2[((wide >> 20) & 0x3f) ^ k2] ^ sp3[((wide >> 16) & 0x3f) ^ k3] ^
+            sp4[((wide >> 12) & 0x3f) ^ k4] ^ sp5[((wide >> 8) & 0x3f) ^ k5] ^
+            sp6[((wide >> 4) & 0x3f) ^ k6] ^ sp7[wide & 0x3f ^ k7])
+    return (right << 32) | left
+
+class DESContext:
+    '''
+        Class which holds the DES subkeys of a key and encrypts/decrypts
+        single 64-bit blocks given as integers.
+
+        A 16 or 24-byte key is triple DES (EDE) and holds the three subkey
+        schedules of its stages. The stages are fused: the final permutation
+        of one stage and the initial permutation of the next cancel out, so
+        a block is only permuted on the way in and on the way out.
+    '''
+    def __init__(self, key):
+        self.key = bytes(key)
+        self.subkeys = create_schedule(self.key)
+        self.inverse_subkeys = self.subkeys[::-1]
+        self.stages = [self.subkeys[i : i + 16] for i in range(0, len(self.subkeys), 16)]
+        self.inverse_stages = [self.inverse_subkeys[i : i + 16] for i in range(0, len(self.subkeys), 16)]
+
+    def encrypt_block(self, block):
+        '''
+            Function which encrypts a 64-bit integer block
+        '''
+        block = apply_lookup(IP_LOOKUP, block)
+        for subkeys in self.stages:
+            block = feistel_rounds(block, subkeys)
+        return apply_lookup(FP_LOOKUP, block)
+
+    def decrypt_block(self, block):
+        '''
+            Function which decrypts a 64-bit integer block
+        '''
+        block = apply_lookup(IP_LOOKUP, block)
+        for subkeys in self.inverse_stages:
+            block = feistel_rounds(block, subkeys)
+        return apply_lookup(FP_LOOKUP, block)
+
+    def encrypt_into(self, source, destination, mode="ECB", IV=None):
+        '''
+            Function which encrypts the buffer <source> into the writable
+            buffer <destination> (which may be <source> itself) and returns
+            the number of bytes written. See block_modes.run_mode_into.
+        '''
+        return block_modes.run_mode_into(self, mode, source, destination, IV, 8)
+
+    def decrypt_into(self, source, destination, mode="ECB", IV=None):
+        '''
+            Function which decrypts the buffer <source> into the writable
+            buffer <destination> (which may be <source> itself) and returns
+            the number of bytes written. See block_modes.run_mode_into.
+        '''
+        return block_modes.run_mode_into(self, mode, source, destination, IV, 8, decrypt=True)
+
+SBOX_CIRCUITS = bitslice.des_sbox_circuits(S_BOXES)
+
+@lru_cache(maxsize=64)
+def des_context(key):
+    '''
+        Function which returns the (cached) DESContext for a key given as bytes
+    '''
+    return DESContext(key)
+
+@lru_cache(maxsize=16)
+def des_bitsliced(key):
+    '''
+        Function which returns the (cached) bitsliced cipher for a key given
+        as bytes
+    '''
+    return bitslice.BitslicedDES(des_context(key).subkeys, SBOX_CIRCUITS, INITIAL_P,
+                                 INITIAL_P_INV, EXPANSION_BITS, PERMUTATION)
+
+def bitslice_engine(key, mode, IV, data, decrypt=False):
+    '''
+        Engine which runs the parallelisable modes over <data> using the
+        bitsliced cipher, and the other modes using the integer cipher
+    '''
+    if not block_modes.is_parallel(mode, decrypt):
+        return integer_cipher(key, mode, IV, data, decrypt=decrypt)
+    with instrumentation.timed("des", "key_setup"):
+        cipher = des_bitsliced(bytes(key))
+    with instrumentation.timed("des", "cipher", len(data) // 8):
+        return block_modes.run_parallel(cipher, mode, data, IV, 8, decrypt=decrypt)
+
+def integer_cipher(key, mode, IV, data, decrypt=False):
+    '''
+        Function which runs the given mode over <data> using the integer cipher
+    '''
+    with instrumentation.timed("des", "key_setup"):
+        context = des_context(key)
+    with instrumentation.timed("des", "cipher", len(data) // 8):
+        return block_modes.run_mode(context, mode, data, IV, 8, decrypt=decrypt)
+
+def integer_engine(key, mode, IV, data, decrypt=False):
+    '''
+        Engine which runs the given mode over <data> using the integer cipher
+    '''
+    return integer_cipher(key, mode, IV, data, decrypt=decrypt)
+
+def legacy_hex(data):
+    '''
+        Function which formats bytes as hexadecimal exactly like the bit-list
+        path does (leading zeros dropped, then padded to a multiple of 8)
+    '''
+    digits = data.hex().lstrip('0').rjust(2, '0')
+    if len(digits) % 8 != 0:
+        digits = '0' * (8 - len(digits) % 8) + digits
+    return digits
+
+def generate_bytes(length):
+    '''
+        Function which generates random bytes whose first byte is never 0
+    '''
+    return nonces.nonzero_bytes(length)
+
+def prepare_encrypt(plaintext, key, mode, IV, ransom, key_size=8):
+    '''
+        Function which handles key/IV generation and padding before an
+        engine, mirroring encrypt_des. Returns the padded plaintext, key and
+        IV as bytes, and the IV formatted as encrypt_des returns it.
+    '''
+    with instrumentation.timed("des", "encode", len(plaintext)):
+        plaintext_bytes = bytes(plaintext) if ransom else plaintext.encode('utf-8')
+    key = generate_bytes(key_size) if not key else bytes.fromhex(key)
+    initial_IV = IV
+    IV = None
+    if mode != "ECB":
+        IV = generate_bytes(8) if not initial_IV else bytes.fromhex(initial_IV)
+        initial_IV = f"{int.from_bytes(IV, 'big'):02x}"
+        if len(initial_IV) % 8 != 0:
+            initial_IV = '0' + initial_IV
+    with instrumentation.timed("des", "padding"):
+        plaintext_bytes = block_modes.pad(plaintext_bytes, 8, aligned_pad=64)
+    return plaintext_bytes, key, IV, initial_IV
+
+def finish_decrypt(plaintext, ransom):
+    '''
+        Function which removes the padding of a decrypted message and decodes
+        it, mirroring decrypt_des
+    '''
+    with instrumentation.timed("des", "padding"):
+        plaintext = block_modes.unpad(plaintext)
+    if not ransom:
+        with instrumentation.timed("des", "decode", len(plaintext)):
+            return plaintext.decode('utf-8').rstrip('\x00')
+    return plaintext
+
+def engine_encrypt(engine, plaintext, key, mode, IV, ransom, key_size=8, progress=None):
+    '''
+        Function which handles key/IV generation, padding and output
+        formatting around an engine, mirroring encrypt_des
+    '''
+    plaintext_bytes, key, IV, initial_IV = prepare_encrypt(plaintext, key, mode, IV, ransom, key_size)
+    if progress is None:
+        ciphertext = engine(key, mode, IV, plaintext_bytes)
+    else:
+        ciphertext = progress_reports.transform(engine, key, mode, IV, plaintext_bytes, 8, progress)
+    with instrumentation.timed("des", "encode", len(ciphertext)):
+        ciphertext = legacy_hex(ciphertext)
+    return ciphertext, legacy_hex(key), initial_IV
+
+def engine_decrypt(engine, ciphertext, key, mode, IV, ransom, progress=None):
+    '''
+        Function which handles input parsing and padding removal around an
+        engine, mirroring decrypt_des
+    '''
+    with instrumentation.timed("des", "decode", len(ciphertext)):
+        cipher_bytes = bytes(ciphertext) if ransom else bytes.fromhex(ciphertext)
+    IV = bytes.fromhex(IV) if mode != "ECB" else None
+    if progress is None:
+        plaintext = engine(bytes.fromhex(key), mode, IV, cipher_bytes, decrypt=True)
+    else:
+        plaintext = progress_reports.transform(engine, bytes.fromhex(key), mode, IV, cipher_bytes, 8,
+                                               progress, decrypt=True)
+    return finish_decrypt(plaintext, ransom)
+
+def lane_cipher(engine, key):
+    '''
+        Function which returns the batch cipher used by the named engine to
+        transform many blocks at a time
+    '''
+    with instrumentation.timed("des", "key_setup"):
+        if engine == "bitslice":
+            return des_bitsliced(key)
+        return block_modes.BlockBatch(des_context(key), 8)
+
+def encrypt_chunk(items, key, mode, ransom, engine):
+    '''
+        Function which encrypts a list of (plaintext, IV) items under one key
+        with the named engine, for encrypt_many. Block i of every message is
+        encrypted in the same batch call (see block_modes.run_interleaved).
+    '''
+    results = []
+    if engine == "reference":
+        for plaintext, IV in items:
+            ciphertext, key, IV = encrypt_des(plaintext, key, mode, IV, ransom, engine)
+            results.append((ciphertext, IV))
+        return results
+    prepared = [prepare_encrypt(plaintext, key, mode, IV, ransom) for plaintext, IV in items]
+    cipher = lane_cipher(engine, bytes.fromhex(key))
+    with instrumentation.timed("des", "cipher", sum(len(message) for message, *rest in prepared) // 8):
+        ciphertexts = block_modes.run_interleaved(cipher, mode, [message for message, *rest in prepared],
+                                                  [IV for message, key, IV, initial_IV in prepared], 8)
+    with instrumentation.timed("des", "encode", sum(len(ciphertext) for ciphertext in ciphertexts)):
+        return [(legacy_hex(ciphertext), initial_IV) for ciphertext, (*rest, initial_IV) in zip(ciphertexts, prepared)]
+
+def decrypt_chunk(items, key, mode, ransom, engine):
+    '''
+        Function which decrypts a list of (ciphertext, IV) items under one key
+        with the named engine, for decrypt_many
+    '''
+    if engine == "reference":
+        return [decrypt_des(ciphertext, key, mode, IV, ransom, engine) for ciphertext, IV in items]
+    with instrumentation.timed("des", "decode", sum(len(ciphertext) for ciphertext, IV in items)):
+        messages = [bytes(ciphertext) if ransom else bytes.fromhex(ciphertext) for ciphertext, IV in items]
+    IVs = [bytes.fromhex(IV) if mode != "ECB" else None for ciphertext, IV in items]
+    cipher = lane_cipher(engine, bytes.fromhex(key))
+    with instrumentation.timed("des", "cipher", sum(len(message) for message in messages) // 8):
+        plaintexts = block_modes.run_interleaved(cipher, mode, messages, IVs, 8, decrypt=True)
+    return [finish_decrypt(plaintext, ransom) for plaintext in plaintexts]
+
+def encrypt_many(items, key, mode="ECB", ransom=False, engine=None, executor=None, workers=None):
+    '''
+        Function which encrypts many messages under one key. The engine is
+        picked and the key schedule built once per chunk of messages, and
+        the messages of a chunk are encrypted side by side, so short
+        messages cost microseconds each instead of a full call.
+
+        Inputs:
+            items       (iterable) - (plaintext, IV) pairs, with the IV as a
+                                      hexadecimal string or None to generate one
+            key         (str)      - Hexadecimal key shared by every message
+            mode        (str)      - Mode of operation. Default is ECB
+            ransom      (bool)     - Whether the plaintexts are bytes
+            engine      (str)      - Engine name. Defaults to ENGINE
+            executor    (Executor) - Optional pool to fan the chunks out to
+            workers     (int)      - Optional number of processes to fan out to
+        Returns:
+            results     (list)     - (ciphertext, IV) hexadecimal pairs, in
+                                      order, as encrypt_des returns them
+    '''
+    return batch.cipher_many("des", encrypt_chunk, items, key, mode, ransom, default=ENGINE, mode=mode,
+                             ransom=ransom, engine=engine, executor=executor, workers=workers)
+
+def decrypt_many(items, key, mode="ECB", ransom=False, engine=None, executor=None, workers=None):
+    '''
+        Function which decrypts many messages under one key. Takes
+        (ciphertext, IV) pairs and the same options as encrypt_many, and
+        returns the plaintexts in order. A message with invalid padding
+        fails the whole call, as it would fail decrypt_des.
+    '''
+    return batch.cipher_many("des", decrypt_chunk, items, key, mode, ransom, default=ENGINE, mode=mode,
+                             ransom=ransom, engine=engine, decrypt=True, executor=executor, workers=workers)
+
+def stream_chunk(stream, offset, chunk, final):
+    '''
+        Function which encrypts the chunk of a message starting at <offset>,
+        padding it if it is the final chunk, for stream_encrypt. Like
+        encrypt_des, leading zero bytes of the ciphertext are dropped in
+        groups of 4 (see legacy_hex).
+    '''
+    if final:
+        with instrumentation.timed("des", "padding"):
+            chunk = block_modes.pad(chunk, 8, aligned_pad=64)
+    output = stream.update(offset, chunk)
+    if offset == 0 and output[:1] == b'\x00':
+        output = bytes.fromhex(legacy_hex(output))
+    return output
+
+def stream_encrypt(key=None, mode="ECB", IV=None, engine=None, chunk_size=pipeline.CHUNK_SIZE, key_size=8):
+    '''
+        Function which prepares the encryption of a message in consecutive
+        chunks (see pipeline.run_pipeline), producing the same ciphertext as
+        encrypt_des with ransom=True.
+
+        Returns (transform, key, IV) formatted as encrypt_des returns them,
+        or None if the engine (eg. "reference") cannot work in chunks
+    '''
+    engine = engines.engine_function("des", engine, ENGINE, mode, chunk_size)
+    if engine is None:
+        return None
+    # Key/IV generation and formatting shared with engine_encrypt
+    padding, key, IV, initial_IV = prepare_encrypt(b'', key, mode, IV, True, key_size)
+    stream = block_modes.ModeStream(engine, key, mode, IV, 8)
+    return pipeline.ChunkTransform(stream_chunk, stream, parallel=stream.parallel), legacy_hex(key), initial_IV
+
+def keystream_prefetcher(key, mode, IV, engine=None, depth=prefetch.DEPTH, decrypt=False):
+    '''
+        Function which returns a prefetch.KeystreamPrefetcher generating the
+        CTR or OFB keystream of <key> and <IV> (given as bytes) in the background.
+        Its xor() then encrypts/decrypts unpadded data as it arrives; <decrypt>
+        picks the engine tuned for decryption.
+    '''
+    return prefetch.block_prefetcher("des", engine, ENGINE, key, mode, IV, 8, depth=depth, decrypt=decrypt)
+
+# Engine used when none is given to encrypt_des/decrypt_des. "auto" lets
+# engines.select() pick the fastest engine for the mode and payload size.
+ENGINE = "auto"
+ENGINES = {
+    "integer" : integer_engine,
+    "bitslice" : bitslice_engine
+}
+TRIAL_KEY = secrets.token_bytes(8)
+TRIAL_IV = secrets.token_bytes(8)
+engines.register_cipher("des", ENGINES, engines.block_trial(TRIAL_KEY, TRIAL_IV), MODES)
+instrumentation.register_cache("des key schedule", des_context.cache_info)
+instrumentation.register_cache("des bitsliced key schedule", des_bitsliced.cache_info)
+
+
 if __name__ == "__main__":
 
     # Testing ECB
@@ -534,56 +1013,13 @@ if __name__ == "__main__":
     print(f"Your decrypted text translates to:\n{plaintext}")
     assert plaintext == "This message is coded with OFB | هذه الرسالة مشفرة بواسطة OFB | 此消息使用 OFB 編碼"
 
-    # Stress test reliability ECB:
-    print(f"Testing ECB Reliability: [{100 * ' '}] 0%", end='')
-    for i in range(1000):
-        print(f"\rTesting ECB Reliability: [{(i + 1) // 10 * '>' + (100 - ((i + 1) // 10)) * ' '}] {(i + 1)/10:.2f}%", end='')
-        cipher, key, iv = encrypt_des("我是构建这个狡猾的实现的了不起的家伙。不要像农民一样侮辱我！ :3~~~", mode="ECB")
-        plaintext = decrypt_des(cipher, key, mode="ECB", IV=iv).rstrip()
-        assert plaintext == "我是构建这个狡猾的实现的了不起的家伙。不要像农民一样侮辱我！ :3~~~"
-    print()
-    # Stress test reliability CBC:
-    print(f"Testing CBC Reliability: [{100 * ' '}] 0%", end='')
-    for i in range(1000):
-        print(f"\rTesting CBC Reliability: [{(i + 1) // 10 * '>' + (100 - ((i + 1) // 10)) * ' '}] {(i + 1)/10:.2f}%", end='')
-        cipher, key, iv = encrypt_des("我是构建这个狡猾的实现的了不起的家伙。不要像农民一样侮辱我！ :3~~~", mode="CBC")
-        plaintext = decrypt_des(cipher, key, mode="CBC", IV=iv).rstrip()
-        assert plaintext == "我是构建这个狡猾的实现的了不起的家伙。不要像农民一样侮辱我！ :3~~~"
-    print()
-    # Stress test reliability CTR:
-    print(f"Testing CTR Reliability: [{100 * ' '}] 0%", end='')
-    for i in range(1000):
-        print(f"\rTesting CTR Reliability: [{(i + 1) // 10 * '>' + (100 - ((i + 1) // 10)) * ' '}] {(i + 1)/10:.2f}%", end='')
-        cipher, key, iv = encrypt_des("我是构建这个狡猾的实现的了不起的家伙。不要像农民一样侮辱我！ :3~~~", mode="CTR")
-        plaintext = decrypt_des(cipher, key, mode="CTR", IV=iv).rstrip()
-        assert plaintext == "我是构建这个狡猾的实现的了不起的家伙。不要像农民一样侮辱我！ :3~~~"
-    print()
-    
-    # Stress test reliability PCBC:
-    print(f"Testing PCBC Reliability: [{100 * ' '}] 0%", end='')
-    for i in range(1000):
-        print(f"\rTesting PCBC Reliability: [{(i + 1) // 10 * '>' + (100 - ((i + 1) // 10)) * ' '}] {(i + 1)/10:.2f}%", end='')
-        cipher, key, iv = encrypt_des("我是构建这个狡猾的实现的了不起的家伙。不要像农民一样侮辱我！ :3~~~", mode="PCBC")
-        plaintext = decrypt_des(cipher, key, mode="PCBC", IV=iv).rstrip()
-        assert plaintext == "我是构建这个狡猾的实现的了不起的家伙。不要像农民一样侮辱我！ :3~~~"
-    print()
-
-    # Stress test reliability CFB:
-    print(f"Testing PCBC Reliability: [{100 * ' '}] 0%", end='')
-    for i in range(1000):
-        print(f"\rTesting CFB Reliability: [{(i + 1) // 10 * '>' + (100 - ((i + 1) // 10)) * ' '}] {(i + 1)/10:.2f}%", end='')
-        cipher, key, iv = encrypt_des("我是构建这个狡猾的实现的了不起的家伙。不要像农民一样侮辱我！ :3~~~", mode="CFB")
-        plaintext = decrypt_des(cipher, key, mode="CFB", IV=iv).rstrip()
-        assert plaintext == "我是构建这个狡猾的实现的了不起的家伙。不要像农民一样侮辱我！ :3~~~"
-    print()
-
-    # Stress test reliability OFB:
-    print(f"Testing OFB Reliability: [{100 * ' '}] 0%", end='')
-    for i in range(1000):
-        print(f"\rTesting OFB Reliability: [{(i + 1) // 10 * '>' + (100 - ((i + 1) // 10)) * ' '}] {(i + 1)/10:.2f}%", end='')
-        cipher, key, iv = encrypt_des("我是构建这个狡猾的实现的了不起的家伙。不要像农民一样侮辱我！ :3~~~", mode="OFB")
-        plaintext = decrypt_des(cipher, key, mode="OFB", IV=iv).rstrip()
-        assert plaintext == "我是构建这个狡猾的实现的了不起的家伙。不要像农民一样侮辱我！ :3~~~"
-    print()
+    # Stress test reliability of every mode:
+    for mode in MODES:
+        bar = progress_reports.ProgressBar(f"Testing {mode} Reliability: ")
+        for i in range(1000):
+            cipher, key, iv = encrypt_des("我是构建这个狡猾的实现的了不起的家伙。不要像农民一样侮辱我！ :3~~~", mode=mode)
+            plaintext = decrypt_des(cipher, key, mode=mode, IV=iv).rstrip()
+            assert plaintext == "我是构建这个狡猾的实现的了不起的家伙。不要像农民一样侮辱我！ :3~~~"
+            bar(i + 1, 1000)
 
     print("\nTesting complete! Everything's functional!")
\ No newline at end of file
@@ -0,0 +1,253 @@
+'''
+    Module which selects the fastest engine for each cipher call.
+
+    Every cipher module registers its engines for each of its modes, together
+    with a trial function able to run any of them on random data. When an
+    entry point is called with the "auto" engine, select() looks up the
+    payload's size bucket for that (algo, mode, operation); the first time a
+    bucket is needed, every registered engine is micro-benchmarked on a
+    payload of the bucket's size and the fastest is remembered. This is the
+    only place an engine is chosen by payload size: a named engine always
+    runs its own code, whatever the size, so pinning, tuning and verify.py
+    measure the engine they name. (The batch engines do run the modes that
+    cannot be parallelised, eg. CBC encryption, with their module's block
+    cipher.)
+
+    Tuning is synchronous: the first call in each (algo, mode, operation,
+    bucket) runs every engine TRIAL_RUNS times on a payload of the bucket's
+    size before doing its own work. That costs a few milliseconds for the
+    small buckets and up to about a second for the largest, once per bucket
+    and process unless a tuning file holds it. Pin an engine to avoid it.
+
+    Tuning is kept in memory unless a tuning file is set, so library calls
+    never write files on their own. TUNING_FILE is taken from the
+    ENCRYPTOR_TUNING_FILE environment variable, or can be set to a path
+    (main.py --tuning-file); results are then loaded from and saved to it so
+    later runs start tuned. The file records the machine it was tuned on and
+    is ignored if that changes (eg. NumPy installed, different core count).
+
+    An engine can be pinned with pin(), which takes precedence over tuning.
+    The bit-list reference engine is never tuned, since every other engine
+    produces identical output much faster, but it can be pinned.
+'''
+import json
+import os
+import platform
+import secrets
+import sys
+import time
+from pathlib import Path
+
+import instrumentation
+
+# Payload sizes (in bytes) which are tuned separately; a payload uses the
+# smallest bucket at least as large as it, or the largest bucket
+BUCKETS = [256, 4096, 65536]
+TRIAL_RUNS = 2
+# File the tuning is persisted in, or None to keep it in memory
+TUNING_FILE = os.environ.get("ENCRYPTOR_TUNING_FILE") or None
+
+REGISTRY = {}
+TRIALS = {}
+PINS = {}
+TUNING = {}
+_loaded = False
+
+def register(algo, name, engine, modes=(None,)):
+    '''
+        Function which registers <engine> under <name> for every mode of
+        <algo>. Stream ciphers use the single mode None.
+    '''
+    for mode in modes:
+        REGISTRY.setdefault((algo, mode), {})[name] = engine
+
+def register_trial(algo, trial):
+    '''
+        Function which registers the trial function of <algo>, called as
+        trial(engine, mode, data, decrypt) to run an engine once
+    '''
+    TRIALS[algo] = trial
+
+def register_cipher(algo, cipher_engines, trial, modes=(None,)):
+    '''
+        Function which registers every engine of a cipher module (its ENGINES
+        dictionary) for every mode of <algo>, together with its trial
+    '''
+    for name, engine in cipher_engines.items():
+        register(algo, name, engine, modes)
+    register_trial(algo, trial)
+
+def block_trial(key, IV):
+    '''
+        Function which returns the trial of a block cipher, whose engines are
+        called as engine(key, mode, IV, data, decrypt=decrypt)
+    '''
+    return lambda engine, mode, data, decrypt: engine(key, mode, IV, data, decrypt=decrypt)
+
+def stream_trial(*args, **kwargs):
+    '''
+        Function which returns the trial of a stream cipher, whose engines are
+        called as engine(*args, data, **kwargs) in both directions
+    '''
+    return lambda engine, mode, data, decrypt: engine(*args, data, **kwargs)
+
+def available(algo, mode=None):
+    '''
+        Function which returns the names of the engines registered for
+        (algo, mode)
+    '''
+    return list(REGISTRY.get((algo, mode), {}))
+
+def pin(algo, engine, mode=None):
+    '''
+        Function which pins <engine> for every call of <algo>, or only for
+        <mode> if given. Pinning None removes the pin. Raises ValueError if
+        the engine is neither registered for the algorithm (and mode) nor
+        "reference".
+    '''
+    if engine is None:
+        PINS.pop((algo, mode), None)
+        return
+    modes = [registered for (name, registered) in REGISTRY if name == algo and mode in (None, registered)]
+    if not modes:
+        algos = sorted({name for name, _ in REGISTRY})
+        if algo not in algos:
+            raise ValueError(f"Unknown algorithm '{algo}'. Valid algorithms are {', '.join(algos)}")
+        raise ValueError(f"Unknown mode '{mode}' for {algo}. Valid modes are "
+                         f"{', '.join(sorted(registered for name, registered in REGISTRY if name == algo))}")
+    names = ["reference"] + sorted({name for registered in modes for name in available(algo, registered)})
+    if engine not in names:
+        raise ValueError(f"Unknown engine '{engine}' for {algo}. Valid engines are {', '.join(names)}")
+    PINS[(algo, mode)] = engine
+
+def bucket(size):
+    '''
+        Function which returns the size bucket of a payload of <size> bytes
+    '''
+    for limit in BUCKETS:
+        if size <= limit:
+            return limit
+    return BUCKETS[-1]
+
+def fingerprint():
+    '''
+        Function which describes the machine, so tuning from another machine
+        or environment is not reused
+    '''
+    return {"python" : sys.version.split()[0], "machine" : platform.machine(),
+            "cpus" : os.cpu_count(), "engines" : sorted(f"{algo}/{mode or '-'}/{name}"
+                                                        for (algo, mode), engines in REGISTRY.items()
+                                                        for name in engines)}
+
+def load(path=None):
+    '''
+        Function which loads the tuning file, discarding it if it was made
+        on a different machine or environment. Nothing is loaded if there is
+        no tuning file.
+    '''
+    global _loaded
+    _loaded = True
+    path = path or TUNING_FILE
+    if path is None:
+        return
+    try:
+        with open(path) as tuning_file:
+            saved = json.load(tuning_file)
+    except (OSError, ValueError):
+        return
+    if saved.get("fingerprint") == fingerprint():
+        TUNING.update(saved.get("tuning", {}))
+
+def save(path=None):
+    '''
+        Function which writes the tuning results to the tuning file, if
+        there is one. Failures are ignored, since tuning can always be redone.
+    '''
+    path = path or TUNING_FILE
+    if path is None:
+        return
+    path = Path(path)
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(temporary, 'w') as tuning_file:
+            json.dump({"fingerprint" : fingerprint(), "tuning" : TUNING}, tuning_file, indent=4, sort_keys=True)
+        os.replace(temporary, path)
+    except OSError:
+        pass
+
+def tune(algo, mode, size, decrypt=False):
+    '''
+        Function which benchmarks every engine of (algo, mode) on a payload
+        of the bucket of <size> and returns a dictionary of the best time of
+        each engine, in seconds
+    '''
+    data = secrets.token_bytes(bucket(size))
+    trial = TRIALS[algo]
+    timings = {}
+    enabled = instrumentation.ENABLED
+    instrumentation.ENABLED = False     # Keep the trials out of the statistics
+    try:
+        for name, engine in REGISTRY[(algo, mode)].items():
+            best = None
+            for i in range(TRIAL_RUNS):
+                start = time.perf_counter()
+                trial(engine, mode, data, decrypt)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = best
+    finally:
+        instrumentation.ENABLED = enabled
+    return timings
+
+def select(algo, mode, size, decrypt=False):
+    '''
+        Function which returns the name of the engine to use for a payload of
+        <size> bytes, tuning its bucket first if needed.
+
+        Inputs:
+            algo        (str)    - Name of the cipher (aes, des, chacha, arcfour)
+            mode        (str)    - Mode of operation, or None for stream ciphers
+            size        (int)    - Payload size in bytes
+            decrypt     (bool)   - Whether the call decrypts
+        Returns:
+            engine      (str)    - Engine name, or "reference"
+    '''
+    pinned = PINS.get((algo, mode), PINS.get((algo, None)))
+    if pinned:
+        return pinned
+    engines = available(algo, mode)
+    if len(engines) < 2:
+        return engines[0] if engines else "reference"
+    if not _loaded:
+        load()
+    entry = f"{algo}/{mode or '-'}/{'decrypt' if decrypt else 'encrypt'}/{bucket(size)}"
+    if TUNING.get(entry) not in engines:
+        timings = tune(algo, mode, size, decrypt)
+        TUNING[entry] = min(timings, key=timings.get)
+        save()
+    return TUNING[entry]
+
+def resolve(algo, engine, default, mode, size, decrypt=False):
+    '''
+        Function which returns the name of the engine to run: <engine>, or
+        <default> (the cipher module's ENGINE) if it is None, with "auto"
+        resolved by select() for a payload of <size> bytes
+    '''
+    engine = default if engine is None else engine
+    return select(algo, mode, size, decrypt) if engine == "auto" else engine
+
+def engine_function(algo, engine, default, mode, size, decrypt=False):
+    '''
+        Function which resolves an engine name like resolve() and returns the
+        registered engine, or None for an engine with no registered function
+        (the reference engine, which only works on whole messages)
+    '''
+    return REGISTRY.get((algo, mode), {}).get(resolve(algo, engine, default, mode, size, decrypt))
+
+def report():
+    '''
+        Function which formats the current tuning results as a list of lines
+    '''
+    lines = [f"{entry:<32} -> {engine}" for entry, engine in sorted(TUNING.items())]
+    lines += [f"{algo}/{mode or '*'} pinned -> {engine}" for (algo, mode), engine in sorted(PINS.items(), key=str)]
+    return lines
@@ -0,0 +1,274 @@
+'''
+    Module which handles envelope encryption with per-object data keys.
+
+    Every object (payload) is encrypted with AES under its own random data
+    key. The data key is wrapped under a master key with the AES key wrap
+    of RFC 3394 and stored in the object's header, next to the mode, the IV
+    and an identifier of the master key.
+
+    Rotating the master key only rewraps the headers: the data keys, and so
+    the encrypted payloads, never change and are never decrypted. The
+    wrapped key of a data key has a fixed length, so a stored object is
+    rewrapped by overwriting its header in place and syncing it: the payload
+    is never read or copied, and a rotation costs one small write per
+    object however large the objects are. The header lies within the first
+    disk sector of the file, which storage writes as a whole. rewrap_files()
+    rewraps many stored objects in parallel, skipping those already under
+    the new master key, so an interrupted rotation can simply be run again.
+
+    Layout:
+        magic           (4 bytes, MAGIC)
+        version         (1 byte, VERSION)
+        master key id   (8 bytes, see key_id)
+        mode            (1 byte, index into MODES)
+        IV              (16 bytes)
+        wrapped length  (1 byte)
+        wrapped key     (data key length + 8 bytes)
+        payload         (AES ciphertext)
+'''
+import hashlib
+import os
+import struct
+
+import aes
+import batch
+import nonces
+
+MAGIC = b"3NVL"
+VERSION = 1
+MODES = list(aes.MODES)
+HEADER = struct.Struct(">4sB8sB16sB")
+# Data key lengths in bytes, and the data key size used by default
+KEY_SIZES = [16, 24, 32]
+DATA_KEY_SIZE = 16
+# Initial value of the RFC 3394 key wrap, checked again on unwrapping
+WRAP_IV = 0xa6a6a6a6a6a6a6a6
+HALF_MASK = (1 << 64) - 1
+# Results of rewrapping a stored object
+REWRAPPED = "rewrapped"
+CURRENT = "current"
+# Objects handed to a worker at a time by rewrap_files
+REWRAP_CHUNK = 64
+# Longest header, with the wrapped key of the largest data key
+MAX_HEADER_SIZE = HEADER.size + max(KEY_SIZES) + 8
+
+def master_key_bytes(master_key):
+    '''
+        Function which converts a master key given as a hexadecimal string
+        or bytes to bytes, checking its length
+    '''
+    master_key = bytes.fromhex(master_key) if isinstance(master_key, str) else bytes(master_key)
+    if len(master_key) not in KEY_SIZES:
+        raise ValueError(f"Master keys must be {', '.join(str(size) for size in KEY_SIZES)} bytes, not {len(master_key)}")
+    return master_key
+
+def generate_master_key(key_bits=256):
+    '''
+        Function which generates a master key as a hexadecimal string
+    '''
+    if key_bits // 8 not in KEY_SIZES:
+        raise ValueError(f"Key size must be one of {list(aes.ROUND_KEY_LENGTHS)} bits")
+    return nonces.token_bytes(key_bits // 8).hex()
+
+def key_id(master_key):
+    '''
+        Function which returns the 8-byte identifier of a master key stored in
+        headers, so a header shows which master key wraps it without
+        unwrapping
+    '''
+    return hashlib.sha256(MAGIC + master_key_bytes(master_key)).digest()[:8]
+
+def wrap_key(master_key, key):
+    '''
+        Function which wraps <key> (a multiple of 8 bytes, at least 16) under
+        <master_key> with the AES key wrap of RFC 3394
+    '''
+    context = aes.aes_context(master_key_bytes(master_key))
+    blocks = len(key) // 8
+    if blocks < 2 or len(key) % 8:
+        raise ValueError("Wrapped keys must be a multiple of 8 bytes, at least 16")
+    check = WRAP_IV
+    halves = [int.from_bytes(key[i : i + 8], 'big') for i in range(0, len(key), 8)]
+    for j in range(6):
+        for i in range(blocks):
+            block = context.encrypt_block((check << 64) | halves[i])
+            check = (block >> 64) ^ (blocks * j + i + 1)
+            halves[i] = block & HALF_MASK
+    return check.to_bytes(8, 'big') + b''.join(half.to_bytes(8, 'big') for half in halves)
+
+def unwrap_key(master_key, wrapped):
+    '''
+        Function which unwraps a key wrapped by wrap_key. Raises ValueError if
+        the integrity check fails (wrong master key or corrupted header).
+    '''
+    context = aes.aes_context(master_key_bytes(master_key))
+    blocks = len(wrapped) // 8 - 1
+    if blocks < 2 or len(wrapped) % 8:
+        raise ValueError("Invalid wrapped key length")
+    check = int.from_bytes(wrapped[:8], 'big')
+    halves = [int.from_bytes(wrapped[i : i + 8], 'big') for i in range(8, len(wrapped), 8)]
+    for j in range(5, -1, -1):
+        for i in range(blocks - 1, -1, -1):
+            block = context.decrypt_block(((check ^ (blocks * j + i + 1)) << 64) | halves[i])
+            check = block >> 64
+            halves[i] = block & HALF_MASK
+    if check != WRAP_IV:
+        raise ValueError("The data key could not be unwrapped. Wrong master key or corrupted header")
+    return b''.join(half.to_bytes(8, 'big') for half in halves)
+
+class Header:
+    '''
+        Class which holds the header of an envelope: the master key id, the
+        payload's mode and IV, and the wrapped data key
+    '''
+    def __init__(self, master_id, mode, IV, wrapped_key):
+        self.master_id = master_id
+        self.mode = mode
+        self.IV = IV
+        self.wrapped_key = wrapped_key
+
+    @property
+    def size(self):
+        '''
+            The length of the packed header in bytes
+        '''
+        return HEADER.size + len(self.wrapped_key)
+
+    def pack(self):
+        '''
+            Function which packs the header into bytes
+        '''
+        return HEADER.pack(MAGIC, VERSION, self.master_id, MODES.index(self.mode),
+                           self.IV, len(self.wrapped_key)) + self.wrapped_key
+
+    @classmethod
+    def unpack(cls, data):
+        '''
+            Function which reads a header from the start of <data>. Raises
+            ValueError if it is not a valid envelope header.
+        '''
+        if len(data) < HEADER.size:
+            raise ValueError("Data too short for an envelope header")
+        magic, version, master_id, mode, IV, wrapped_length = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not an envelope")
+        if version != VERSION:
+            raise ValueError(f"Unsupported envelope version {version}")
+        if mode >= len(MODES) or len(data) < HEADER.size + wrapped_length:
+            raise ValueError("Corrupted envelope header")
+        return cls(master_id, MODES[mode], IV, bytes(data[HEADER.size : HEADER.size + wrapped_length]))
+
+    def rewrap(self, old_master_key, new_master_key):
+        '''
+            Function which returns this header with its data key wrapped
+            under <new_master_key> instead of <old_master_key>
+        '''
+        if self.master_id != key_id(old_master_key):
+            raise ValueError("The header is not wrapped under the old master key")
+        data_key = unwrap_key(old_master_key, self.wrapped_key)
+        return Header(key_id(new_master_key), self.mode, self.IV, wrap_key(new_master_key, data_key))
+
+def seal(payload, master_key, mode="CTR", key_size=DATA_KEY_SIZE, engine=None):
+    '''
+        Function which encrypts a payload under a new random data key and
+        wraps the data key under <master_key>.
+
+        Inputs:
+            payload     (bytes)  - The data to encrypt
+            master_key  (str)    - Hexadecimal master key (128, 192 or 256-bit)
+            mode        (str)    - AES mode for the payload. Default is CTR
+            key_size    (int)    - Data key length in bytes
+            engine      (str)    - AES engine, or None for aes.ENGINE
+        Returns:
+            envelope    (bytes)  - Header followed by the encrypted payload
+    '''
+    if mode not in MODES:
+        raise ValueError(f"Invalid mode {mode}. Valid modes are {', '.join(MODES)}")
+    if key_size not in KEY_SIZES:
+        raise ValueError(f"Data keys must be {', '.join(str(size) for size in KEY_SIZES)} bytes")
+    data_key = nonces.token_bytes(key_size)
+    ciphertext, key, IV = aes.aes_encrypt(bytearray(payload), key=data_key.hex(), mode=mode,
+                                          ransom=True, engine=engine)
+    header = Header(key_id(master_key), mode, bytes.fromhex(IV), wrap_key(master_key, data_key))
+    return header.pack() + bytes.fromhex(ciphertext)
+
+def unseal(envelope, master_key, engine=None):
+    '''
+        Function which unwraps the data key of an envelope with <master_key>
+        and returns the decrypted payload
+    '''
+    header = Header.unpack(envelope)
+    if header.master_id != key_id(master_key):
+        raise ValueError("The envelope is not wrapped under this master key")
+    data_key = unwrap_key(master_key, header.wrapped_key)
+    return aes.aes_decrypt(bytearray(envelope[header.size:]), data_key.hex(), mode=header.mode,
+                           IV=header.IV.hex(), ransom=True, engine=engine)
+
+def rewrap(envelope, old_master_key, new_master_key):
+    '''
+        Function which returns <envelope> with its data key rewrapped under
+        <new_master_key>. The payload is copied unchanged.
+    '''
+    header = Header.unpack(envelope)
+    return header.rewrap(old_master_key, new_master_key).pack() + bytes(envelope[header.size:])
+
+def rewrap_file(path, old_master_key, new_master_key):
+    '''
+        Function which rewraps a stored envelope by overwriting its header
+        in place, leaving the payload untouched. Returns CURRENT if it is
+        already under the new master key, otherwise REWRAPPED.
+    '''
+    with open(path, 'r+b') as envelope:
+        header = Header.unpack(envelope.read(MAX_HEADER_SIZE))
+        if header.master_id == key_id(new_master_key):
+            return CURRENT
+        rewrapped = header.rewrap(old_master_key, new_master_key).pack()
+        if len(rewrapped) != header.size:
+            raise ValueError("The rewrapped header does not fit the old one")
+        envelope.seek(0)
+        envelope.write(rewrapped)
+        envelope.flush()
+        os.fsync(envelope.fileno())
+    return REWRAPPED
+
+def rewrap_chunk(paths, old_master_key, new_master_key):
+    '''
+        Function which rewraps a list of stored envelopes for rewrap_files,
+        returning the error message instead of the result for envelopes that
+        fail, so one bad object does not stop the rotation
+    '''
+    results = []
+    for path in paths:
+        try:
+            results.append(rewrap_file(path, old_master_key, new_master_key))
+        except (OSError, ValueError) as error:
+            results.append(f"{type(error).__name__}: {error}")
+    return results
+
+def rewrap_files(paths, old_master_key, new_master_key, executor=None, workers=None):
+    '''
+        Function which rewraps many stored envelopes under a new master key,
+        in parallel if an executor or a number of workers is given.
+
+        Inputs:
+            paths          (iterable) - Paths of the envelopes
+            old_master_key (str)      - Hexadecimal master key they are under
+            new_master_key (str)      - Hexadecimal master key to move them to
+            executor       (Executor) - Optional pool to fan the headers out to
+            workers        (int)      - Optional number of processes to fan out to
+        Returns:
+            results        (list)     - REWRAPPED, CURRENT or an error message
+                                         per path, in order
+    '''
+    # Check the keys once up front rather than failing every object
+    master_key_bytes(old_master_key)
+    master_key_bytes(new_master_key)
+    return batch.run_many(rewrap_chunk, [os.fspath(path) for path in paths], old_master_key,
+                          new_master_key, executor=executor, workers=workers, chunk_size=REWRAP_CHUNK)
+
+if "__main__" == __name__:
+    # RFC 3394 section 4.1: 128-bit key data wrapped with a 128-bit KEK
+    print(wrap_key("000102030405060708090a0b0c0d0e0f", bytes.fromhex("00112233445566778899aabbccddeeff")).hex())
+    master, rotated = generate_master_key(), generate_master_key()
+    envelope = seal(b"Rotate the master key without touching the payload", master)
+    print(unseal(rewrap(envelope, master, rotated), rotated))
@@ -0,0 +1,189 @@
+'''
+    Module which provides lightweight instrumentation hooks for the ciphers.
+
+    The cipher entry points report each operation, and the engines report
+    the phases inside it (key setup, cipher, padding, encode/decode and I/O),
+    to every registered hook. A hook is any callable taking
+    (algo, phase, seconds, amount), where amount is the payload size in bytes
+    for operations and the number of blocks/bytes handled for phases.
+
+    While no hook is registered, timed() hands back a shared no-op timer and
+    instrumented() calls straight through, so the cost is a flag check.
+'''
+import inspect
+import time
+from collections import defaultdict
+from functools import wraps
+
+ENABLED = False
+HOOKS = []
+CACHES = {}
+OPERATIONS = ["encrypt", "decrypt"]
+
+class NullTimer:
+    '''
+        Timer which does nothing, used while instrumentation is disabled
+    '''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+class Timer:
+    '''
+        Timer which reports the time spent inside a with block to the hooks
+    '''
+    def __init__(self, algo, phase, amount):
+        self.algo = algo
+        self.phase = phase
+        self.amount = amount
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        record(self.algo, self.phase, time.perf_counter() - self.start, self.amount)
+        return False
+
+NULL_TIMER = NullTimer()
+
+def timed(algo, phase, amount=0):
+    '''
+        Function which returns a context manager timing a phase of <algo>
+    '''
+    if not ENABLED:
+        return NULL_TIMER
+    return Timer(algo, phase, amount)
+
+def record(algo, phase, seconds, amount=0):
+    '''
+        Function which reports a measurement to every hook
+    '''
+    for hook in HOOKS:
+        hook(algo, phase, seconds, amount)
+
+def add_hook(hook):
+    '''
+        Function which registers a hook and enables instrumentation
+    '''
+    global ENABLED
+    HOOKS.append(hook)
+    ENABLED = True
+
+def remove_hook(hook):
+    '''
+        Function which unregisters a hook. Instrumentation is disabled once
+        no hooks remain.
+    '''
+    global ENABLED
+    HOOKS.remove(hook)
+    ENABLED = bool(HOOKS)
+
+def register_cache(name, cache_info):
+    '''
+        Function which registers a cache whose hit rate should be reported.
+        <cache_info> returns an object with hits and misses attributes, such
+        as the cache_info method of an lru_cache.
+    '''
+    CACHES[name] = cache_info
+
+def payload_size(payload, hex_input):
+    '''
+        Function which returns the size in bytes of a cipher input
+    '''
+    if isinstance(payload, str):
+        return len(payload) // 2 if hex_input else len(payload.encode('utf-8'))
+    return len(payload)
+
+def instrumented(algo, operation=None, hex_decrypt=True):
+    '''
+        Decorator which reports every call of a cipher entry point as an
+        operation of <algo>. If <operation> is None it is taken from the
+        decrypt argument, given by position or keyword. <hex_decrypt>
+        indicates that ciphertext given as text is hexadecimal.
+    '''
+    def decorator(function):
+        signature = inspect.signature(function)
+        payload = next(iter(signature.parameters))
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            try:
+                values = signature.bind(*args, **kwargs).arguments
+            except TypeError:
+                # Let the call itself report the bad arguments
+                return function(*args, **kwargs)
+            name = operation or ("decrypt" if values.get("decrypt") else "encrypt")
+            hex_input = hex_decrypt and name == "decrypt" and not values.get("ransom")
+            size = payload_size(values[payload], hex_input) if payload in values else 0
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(algo, name, time.perf_counter() - start, size)
+        return wrapper
+    return decorator
+
+class SessionStats:
+    '''
+        Hook which accumulates operations, bytes processed and phase timings
+        per algorithm
+    '''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        '''
+            Function which clears all accumulated statistics
+        '''
+        self.operations = defaultdict(int)
+        self.bytes = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.phases = defaultdict(lambda: [0, 0.0, 0])
+
+    def __call__(self, algo, phase, seconds, amount):
+        if phase in OPERATIONS:
+            self.operations[algo] += 1
+            self.bytes[algo] += amount
+            self.seconds[algo] += seconds
+        else:
+            entry = self.phases[(algo, phase)]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += amount
+
+    def report(self):
+        '''
+            Function which formats the statistics as a list of lines
+        '''
+        lines = []
+        for algo in sorted(self.operations):
+            seconds = self.seconds[algo]
+            throughput = self.bytes[algo] / seconds / (1024 * 1024) if seconds else 0
+            lines.append(f"{algo}: {self.operations[algo]} operation(s), {self.bytes[algo]:,} bytes, "
+                         f"{seconds:.4f}s, {throughput:.3f} MB/s")
+            for (phase_algo, phase), (calls, phase_seconds, amount) in sorted(self.phases.items()):
+                if phase_algo != algo:
+                    continue
+                line = f"    {phase:<10}: {calls} call(s), {phase_seconds * 1000:.3f}ms"
+                if phase == "cipher" and amount:
+                    line += f", {amount:,} block(s), {phase_seconds / amount * 1e6:.2f}us/block"
+                elif amount:
+                    line += f", {amount:,} bytes"
+                lines.append(line)
+        return lines
+
+def cache_stats():
+    '''
+        Function which returns (hits, misses, hit rate) for every registered
+        cache, keyed by name
+    '''
+    stats = {}
+    for name, cache_info in CACHES.items():
+        info = cache_info()
+        total = info.hits + info.misses
+        stats[name] = (info.hits, info.misses, info.hits / total if total else 0.0)
+    return stats
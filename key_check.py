@@ -0,0 +1,173 @@
+'''
+    Module which adds an optional key check header to ciphertext, so a wrong
+    key, IV, mode or round count is rejected before the payload is touched.
+
+    Without it, decrypting with the wrong key runs the cipher over the whole
+    ciphertext and only fails on the padding or the UTF-8 decoding at the
+    end. The header holds a check value derived from the key and the other
+    parameters, which the decrypting side recomputes and compares first, at
+    a cost independent of the payload size.
+
+    The check value is a truncated HMAC-SHA256 of the parameters under the
+    key, so it reveals nothing about the key beyond allowing a guess to be
+    tested, which the ciphertext allows anyway. A wrong key passes with a
+    probability of 2^-32.
+
+    Layout (prepended to the ciphertext bytes, or as hexadecimal to
+    hexadecimal ciphertext):
+        magic           (2 bytes, MAGIC)
+        version         (1 byte, VERSION)
+        algorithm       (1 byte, index into ALGORITHMS)
+        rounds          (1 byte, ChaCha round count, otherwise 0)
+        check value     (4 bytes)
+
+    Entry points decorated with checked() accept check=True to write or
+    expect the header. For ciphers with a round count, ciphertext under any
+    round count other than the default always carries the header, so that
+    the round count travels with it: decryption reads the round count from
+    the header whenever one is present, and rejects a different round count
+    given explicitly.
+'''
+import hashlib
+import hmac
+import inspect
+import string
+import struct
+from functools import wraps
+
+MAGIC = b"3K"
+VERSION = 1
+ALGORITHMS = ["aes", "des", "chacha"]
+HEADER = struct.Struct(">2sBBB4s")
+CHECK_SIZE = 4
+
+class WrongKeyError(ValueError):
+    '''
+        Error raised when the key check header does not match the key or
+        parameters given for decryption
+    '''
+
+def normalise(value):
+    '''
+        Function which normalises a hexadecimal key or IV, so that the same
+        value in upper or lower case checks the same. Leading zeros are kept,
+        since the ciphers read 00ab.. and ab.. as different bytes. Raises
+        ValueError if <value> is not a whole number of hexadecimal bytes.
+    '''
+    if not value:
+        return ""
+    value = value.lower()
+    if len(value) % 2 != 0 or value.strip(string.hexdigits):
+        raise ValueError(f"'{value}' is not a hexadecimal string of whole bytes")
+    return value
+
+def check_value(algo, key, mode=None, IV=None, rounds=0):
+    '''
+        Function which computes the check value of a key and its parameters.
+        The IV is ignored in ECB, which does not use it.
+    '''
+    if mode == "ECB":
+        IV = None
+    message = f"{algo}|{mode or ''}|{normalise(IV)}|{rounds}".encode('ascii')
+    return hmac.new(normalise(key).encode('ascii'), MAGIC + message, hashlib.sha256).digest()[:CHECK_SIZE]
+
+def make_header(algo, key, mode=None, IV=None, rounds=0):
+    '''
+        Function which builds the key check header for a key and its
+        parameters
+    '''
+    return HEADER.pack(MAGIC, VERSION, ALGORITHMS.index(algo), rounds,
+                       check_value(algo, key, mode, IV, rounds))
+
+def verify_header(header, algo, key, mode=None, IV=None, rounds=0):
+    '''
+        Function which checks a key check header against the key and
+        parameters given for decryption. Raises ValueError if it is not a
+        valid header and WrongKeyError if it does not match.
+    '''
+    if len(header) < HEADER.size:
+        raise ValueError("Ciphertext too short for a key check header")
+    magic, version, algorithm, stored_rounds, expected = HEADER.unpack_from(header)
+    if magic != MAGIC:
+        raise ValueError("Ciphertext has no key check header")
+    if version != VERSION:
+        raise ValueError(f"Unsupported key check header version {version}")
+    if algorithm >= len(ALGORITHMS) or ALGORITHMS[algorithm] != algo:
+        raise WrongKeyError(f"Ciphertext was not encrypted with {algo}")
+    if stored_rounds != rounds:
+        raise WrongKeyError(f"Ciphertext was encrypted with {stored_rounds} rounds, not {rounds}")
+    if not hmac.compare_digest(expected, check_value(algo, key, mode, IV, rounds)):
+        raise WrongKeyError("Wrong key or IV")
+
+def has_header(ciphertext, algo):
+    '''
+        Function which tells whether hexadecimal or binary ciphertext starts
+        with a key check header for <algo>
+    '''
+    if isinstance(ciphertext, str):
+        try:
+            header = bytes.fromhex(ciphertext[: 2 * HEADER.size])
+        except ValueError:
+            return False
+    else:
+        header = bytes(ciphertext[: HEADER.size])
+    return len(header) == HEADER.size and header[:3] == MAGIC + bytes([VERSION]) and header[3] == ALGORITHMS.index(algo)
+
+def split_header(ciphertext):
+    '''
+        Function which splits hexadecimal or binary ciphertext into its
+        header (as bytes) and its payload (in the same form as given)
+    '''
+    if isinstance(ciphertext, str):
+        try:
+            header = bytes.fromhex(ciphertext[: 2 * HEADER.size])
+        except ValueError:
+            raise ValueError("Ciphertext has no key check header")
+        return header, ciphertext[2 * HEADER.size:]
+    return bytes(ciphertext[: HEADER.size]), bytearray(ciphertext[HEADER.size:])
+
+def checked(algo, decrypt=False, rounds=None):
+    '''
+        Decorator which adds the check keyword argument to a cipher entry
+        point. With check=True, encryption prepends the header to the
+        hexadecimal ciphertext it returns, and decryption verifies and
+        removes the header before decrypting.
+
+        Inputs:
+            algo        (str)      - Name of the cipher (see ALGORITHMS)
+            decrypt     (bool)     - Whether the entry point decrypts. Overridden
+                                      by a decrypt argument of the call
+            rounds      (callable) - Function normalising the rounds argument,
+                                      for ciphers with a round count. It maps
+                                      None to the default round count, and a
+                                      rounds argument of None when decrypting
+                                      takes the round count from the header
+    '''
+    def decorator(function):
+        signature = inspect.signature(function)
+        @wraps(function)
+        def wrapper(*args, check=False, **kwargs):
+            if not check and not rounds:
+                return function(*args, **kwargs)
+            arguments = signature.bind(*args, **kwargs)
+            arguments.apply_defaults()
+            values = arguments.arguments
+            if values.get("decrypt", decrypt):
+                text = next(iter(values))
+                if not check and not has_header(values[text], algo):
+                    return function(*args, **kwargs)
+                header, values[text] = split_header(values[text])
+                if rounds and values["rounds"] is None and len(header) == HEADER.size:
+                    values["rounds"] = HEADER.unpack(header)[3]
+                round_count = rounds(values["rounds"]) if rounds else 0
+                verify_header(header, algo, values["key"], values.get("mode"), values.get("IV"), round_count)
+                return function(*arguments.args, **arguments.kwargs)
+            round_count = rounds(values["rounds"]) if rounds else 0
+            if not check and round_count == rounds(None):
+                return function(*args, **kwargs)
+            result = function(*args, **kwargs)
+            IV = result[2] if len(result) > 2 else None
+            header = make_header(algo, result[1], values.get("mode"), IV, round_count)
+            return (header.hex() + result[0],) + tuple(result[1:])
+        return wrapper
+    return decorator
@@ -1,8 +1,55 @@
 '''
     Main running program
+
+    Usage:
+        python main.py [--profile [FILE]] [--top N] [--engine ALGO[/MODE]=ENGINE ...]
+                       [--tuning-file FILE] [command ...]
+
+    Any commands given are run non-interactively instead of starting the
+    prompt, eg. python main.py aes "key <key>" "aes hello"
+
+    Engines are picked automatically per cipher, mode and payload size (see
+    engines.py); --engine pins one instead, eg. --engine aes=table or
+    --engine des/CBC=reference. Tuning is kept in memory unless
+    --tuning-file (or the ENCRYPTOR_TUNING_FILE environment variable) names
+    a file to keep it in between runs.
 '''
+import argparse
 
+import engines
 from app import App
 
-main = App()
-main.run()
+parser = argparse.ArgumentParser(description="3ncrypt0r")
+parser.add_argument("commands", nargs="*", help="commands to run instead of starting the prompt")
+parser.add_argument("--profile", nargs="?", const="3ncrypt0r.pstats", metavar="FILE",
+                    help="run under cProfile and dump the statistics to FILE (default 3ncrypt0r.pstats)")
+parser.add_argument("--top", type=int, default=10, help="functions per module in the profile summary (default 10)")
+parser.add_argument("--engine", action="append", default=[], metavar="ALGO[/MODE]=ENGINE",
+                    help="pin the engine of a cipher (optionally for one mode only)")
+parser.add_argument("--tuning-file", metavar="FILE", help="file to load and save the engine tuning in")
+args = parser.parse_args()
+
+if args.tuning_file:
+    engines.TUNING_FILE = args.tuning_file
+
+for pin in args.engine:
+    target, _, engine = pin.partition("=")
+    algo, _, mode = target.partition("/")
+    if not engine:
+        parser.error(f"--engine expects ALGO[/MODE]=ENGINE, got '{pin}'")
+    try:
+        engines.pin(algo.lower(), engine, mode.upper() or None)
+    except ValueError as error:
+        parser.error(f"--engine {pin}: {error}")
+
+with App() as main:
+    if args.commands:
+        run = lambda: main.run_commands(args.commands)
+    else:
+        run = main.run
+
+    if args.profile:
+        from profiling import profile_call
+        profile_call(run, args.profile, args.top)
+    else:
+        run()
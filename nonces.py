@@ -0,0 +1,224 @@
+'''
+    Module which hands out keys and nonces (IVs) for the ciphers.
+
+    Random values come from an EntropyPool, which reads OS entropy
+    (os.urandom, the source behind secrets.token_bytes) in batches of
+    BATCH_SIZE bytes and serves keys and IVs from the buffer, so encrypting
+    many short messages costs one system call per few thousand values
+    instead of one or two per message. Every thread has its own buffer, so
+    threads never share bytes and need no lock, and a process forked from
+    one with filled buffers discards them, so parent and child never hand
+    out the same bytes.
+
+    CounterNonces hands out nonces which are unique per key by construction,
+    but predictable. That is all CTR and the stream ciphers need, but CBC,
+    PCBC and CFB need IVs nobody can guess in advance, so counter nonces are
+    only handed out for the modes of NONCE_MODES and the other modes keep
+    using random IVs. A nonce is a message counter in the leading bytes,
+    with the trailing bytes left zero for the mode's block counter (CTR XORs
+    the block counter into the low bytes of the IV, and ChaCha keeps its
+    block counter outside the nonce). The next counter value of every key is
+    persisted as a high-water mark, RESERVE values ahead of use, so after a
+    restart (or a crash) counting resumes past every nonce that may already
+    have been used. Keys are identified in the file by a hash, never stored.
+
+    A CounterNonces file belongs to a single process. Its counters are
+    shared by the threads of that process: handing out a nonce and
+    persisting the high-water mark happen together under a lock.
+'''
+import hashlib
+import io
+import json
+import os
+import threading
+
+BATCH_SIZE = 64 * 1024
+# Nonce size, counter bytes (leading) and first counter per algorithm. The
+# remaining bytes are left for the block counter of CTR: 2^64 blocks per AES
+# message and 2^32 per DES message. DES IVs are returned without their
+# leading zero bytes, so DES counters start with a non-zero first byte.
+LAYOUTS = {
+    "aes" : (16, 8, 1),
+    "des" : (8, 4, 1 << 24),
+    "chacha" : (12, 12, 1)
+}
+# Modes counter nonces may be used with per algorithm (None for the stream
+# cipher). Modes needing unpredictable IVs are left out.
+NONCE_MODES = {
+    "aes" : ["CTR"],
+    "des" : ["CTR"],
+    "chacha" : [None]
+}
+# Counter values reserved (persisted ahead of use) at a time
+RESERVE = 4096
+
+class EntropyPool:
+    '''
+        Class which serves random bytes from per-thread buffers of OS entropy
+        refilled BATCH_SIZE bytes at a time
+    '''
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.refills = 0
+
+    def reset(self):
+        '''
+            Function which discards the buffered entropy of every thread
+        '''
+        self._local = threading.local()
+
+    def token_bytes(self, length):
+        '''
+            Function which returns <length> random bytes. Requests larger
+            than the batch size are read directly.
+        '''
+        if length > self.batch_size:
+            return os.urandom(length)
+        # The short read at the end of a buffer is discarded
+        local = self._local
+        value = local.buffer.read(length) if hasattr(local, "buffer") else b''
+        if len(value) < length:
+            local.buffer = io.BytesIO(os.urandom(self.batch_size))
+            with self._lock:
+                self.refills += 1
+            value = local.buffer.read(length)
+        return value
+
+    def nonzero_bytes(self, length):
+        '''
+            Function which returns <length> random bytes whose first byte is
+            never 0 (as the DES key and IV formatting needs)
+        '''
+        value = self.token_bytes(length)
+        while value[0] == 0:
+            value = self.token_bytes(length)
+        return value
+
+POOL = EntropyPool()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=POOL.reset)
+
+def token_bytes(length):
+    '''
+        Function which returns <length> random bytes from the shared pool
+    '''
+    return POOL.token_bytes(length)
+
+def nonzero_bytes(length):
+    '''
+        Function which returns <length> random bytes from the shared pool,
+        the first of which is never 0
+    '''
+    return POOL.nonzero_bytes(length)
+
+def key_id(key):
+    '''
+        Function which returns the identifier a key is stored under in a
+        CounterNonces file
+    '''
+    key = bytes.fromhex(key) if isinstance(key, str) else bytes(key)
+    return hashlib.sha256(b"3NONCE" + key).hexdigest()[:32]
+
+class CounterNonces:
+    '''
+        Class which hands out counter-based nonces that never repeat under a
+        key, persisting the high-water mark of every key in <path>. The
+        nonces are predictable, so only the modes of NONCE_MODES take them.
+
+        Inputs:
+            path        (str)    - JSON file holding the high-water marks
+                                    (created if missing)
+            algo        (str)    - Algorithm whose nonce layout to use (see
+                                    LAYOUTS)
+            mode        (str)    - Mode the nonces are for. Default is the
+                                    algorithm's first mode in NONCE_MODES
+            reserve     (int)    - Counter values persisted ahead of use
+    '''
+    def __init__(self, path, algo="aes", mode=None, reserve=RESERVE):
+        if algo not in LAYOUTS:
+            raise ValueError(f"Unknown algorithm '{algo}'. Valid algorithms are {', '.join(LAYOUTS)}")
+        self.algo = algo
+        self.mode = NONCE_MODES[algo][0] if mode is None else mode
+        self.check_mode(self.mode)
+        self.path = os.fspath(path)
+        self.size, self.counter_size, self.first = LAYOUTS[algo]
+        self.reserve = reserve
+        self._lock = threading.Lock()
+        # Next counter and end of the persisted reservation, per key id
+        self._next = {}
+        self._limit = {}
+        self._marks = {}
+        if os.path.exists(self.path):
+            with open(self.path) as file:
+                self._marks = {key : int(mark) for key, mark in json.load(file).items()}
+
+    def check_mode(self, mode):
+        '''
+            Function which raises ValueError if counter nonces of this
+            algorithm must not be used with <mode>
+        '''
+        if mode not in NONCE_MODES[self.algo]:
+            valid = ', '.join(str(valid) for valid in NONCE_MODES[self.algo])
+            raise ValueError(f"Counter nonces are predictable and cannot be used as {self.algo} {mode} IVs. "
+                             f"Valid modes are {valid}; use random IVs for the others")
+
+    def _save(self, marks):
+        # Write to a temporary file and rename it over the old one, so the
+        # marks on disk are always complete
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w') as file:
+            json.dump(marks, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+
+    def next(self, key, count=1, mode=None):
+        '''
+            Function which returns <count> consecutive unique nonces for
+            <key> (bytes or a hexadecimal string) as bytes. Raises ValueError
+            if <mode> is given and may not use counter nonces, and
+            OverflowError once the key's counter space is exhausted.
+        '''
+        if mode is not None:
+            self.check_mode(mode)
+        identifier = key_id(key)
+        with self._lock:
+            counter = self._next.get(identifier, self._marks.get(identifier, self.first))
+            if counter + count > 1 << (8 * self.counter_size):
+                raise OverflowError("Every nonce of this key has been used. Change the key")
+            if counter + count > self._limit.get(identifier, 0):
+                # Only hand the nonces out once their reservation is on disk
+                marks = dict(self._marks)
+                marks[identifier] = counter + count + self.reserve
+                self._save(marks)
+                self._marks, self._limit[identifier] = marks, marks[identifier]
+            self._next[identifier] = counter + count
+        padding = bytes(self.size - self.counter_size)
+        return [(counter + i).to_bytes(self.counter_size, 'big') + padding for i in range(count)]
+
+    def next_hex(self, key, count=1, mode=None):
+        '''
+            Function which returns <count> nonces for <key> as hexadecimal
+            strings, as the cipher entry points take them
+        '''
+        return [nonce.hex() for nonce in self.next(key, count, mode)]
+
+if "__main__" == __name__:
+    import tempfile
+    import time
+    import secrets
+    start = time.perf_counter()
+    for i in range(100000):
+        secrets.token_bytes(16)
+    print(f"secrets.token_bytes: {(time.perf_counter() - start) * 10:.2f}us per IV")
+    start = time.perf_counter()
+    for i in range(100000):
+        token_bytes(16)
+    print(f"EntropyPool: {(time.perf_counter() - start) * 10:.2f}us per IV")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "nonces.json")
+        key = token_bytes(16)
+        first = CounterNonces(path).next_hex(key, 3)
+        print(first, CounterNonces(path).next_hex(key))
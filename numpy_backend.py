@@ -0,0 +1,114 @@
+'''
+    Module which provides an optional NumPy backend for AES and ChaCha.
+
+    AES states are held as an (n_blocks, 16) uint8 array, so every step of a
+    round (S-box lookups, ShiftRows, MixColumns and the round key XOR) is a
+    single array operation over the whole message instead of a Python loop
+    per block. Table lookups use np.take, which is several times faster than
+    fancy indexing on uint8 arrays.
+
+    NumPy is not a requirement of 3ncrypt0r. If it cannot be imported,
+    AVAILABLE is False and the cipher modules keep to their pure Python
+    engines.
+'''
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+AVAILABLE = np is not None
+
+# ShiftRows as a permutation of the column-major byte positions
+SHIFT_ROWS = [r + 4 * ((c + r) % 4) for c in range(4) for r in range(4)]
+INV_SHIFT_ROWS = [SHIFT_ROWS.index(j) for j in range(16)]
+# Row r + 1 of every column, for the a[r] ^ a[r + 1] terms of MixColumns
+NEXT_ROW = [1, 2, 3, 0]
+
+def require_numpy():
+    '''
+        Function which raises ImportError if NumPy is not installed
+    '''
+    if not AVAILABLE:
+        raise ImportError("The numpy engine requires NumPy to be installed")
+
+class NumpyAES:
+    '''
+        Class which encrypts/decrypts batches of AES blocks with NumPy, given
+        the round key words produced by aes.expand_key and the flat S-boxes
+    '''
+    def __init__(self, round_keys, sbox, inv_sbox):
+        require_numpy()
+        key_bytes = b''.join(word.to_bytes(4, 'big') for word in round_keys)
+        self.round_keys = np.frombuffer(key_bytes, dtype=np.uint8).reshape(-1, 16)
+        self.rounds = len(self.round_keys) - 1
+        self.sbox = np.array(sbox, dtype=np.uint8)
+        self.inv_sbox = np.array(inv_sbox, dtype=np.uint8)
+        doubled = [(byte << 1) ^ 0x11b if byte & 0x80 else byte << 1 for byte in range(256)]
+        self.xtime = np.array(doubled, dtype=np.uint8)
+        self.xtime4 = self.xtime[self.xtime]
+        self.shift_rows = np.array(SHIFT_ROWS)
+        self.inv_shift_rows = np.array(INV_SHIFT_ROWS)
+
+    def mix_columns(self, state):
+        '''
+            Function which applies MixColumns to an (n_blocks, 16) state
+        '''
+        columns = state.reshape(-1, 4, 4)
+        total = columns[:, :, 0] ^ columns[:, :, 1] ^ columns[:, :, 2] ^ columns[:, :, 3]
+        mixed = columns ^ total[:, :, None] ^ np.take(self.xtime, columns ^ columns[:, :, NEXT_ROW])
+        return mixed.reshape(-1, 16)
+
+    def inv_mix_columns(self, state):
+        '''
+            Function which applies InvMixColumns to an (n_blocks, 16) state,
+            as MixColumns after multiplying by (04 x^2 + 05)
+        '''
+        columns = state.reshape(-1, 4, 4).copy()
+        u = np.take(self.xtime4, columns[:, :, 0] ^ columns[:, :, 2])
+        v = np.take(self.xtime4, columns[:, :, 1] ^ columns[:, :, 3])
+        columns[:, :, 0] ^= u
+        columns[:, :, 2] ^= u
+        columns[:, :, 1] ^= v
+        columns[:, :, 3] ^= v
+        return self.mix_columns(columns.reshape(-1, 16))
+
+    def encrypt_bytes(self, data):
+        '''
+            Function which encrypts every 16-byte block of <data> (ECB)
+        '''
+        state = np.frombuffer(bytes(data), dtype=np.uint8).reshape(-1, 16) ^ self.round_keys[0]
+        for r in range(1, self.rounds + 1):
+            state = np.take(self.sbox, state[:, self.shift_rows])
+            if r != self.rounds:
+                state = self.mix_columns(state)
+            state ^= self.round_keys[r]
+        return state.tobytes()
+
+    def decrypt_bytes(self, data):
+        '''
+            Function which decrypts every 16-byte block of <data> (ECB)
+        '''
+        state = np.frombuffer(bytes(data), dtype=np.uint8).reshape(-1, 16) ^ self.round_keys[self.rounds]
+        for r in range(self.rounds - 1, -1, -1):
+            state = np.take(self.inv_sbox, state[:, self.inv_shift_rows])
+            state ^= self.round_keys[r]
+            if r:
+                state = self.inv_mix_columns(state)
+        return state.tobytes()
+
+def xor_repeated(data, keystream):
+    '''
+        Function which XORs <data> with <keystream> repeated to its length
+    '''
+    require_numpy()
+    data = np.frombuffer(bytes(data), dtype=np.uint8)
+    keystream = np.resize(np.frombuffer(keystream, dtype=np.uint8), len(data))
+    return (data ^ keystream).tobytes()
+
+def byte_counts(data):
+    '''
+        Function which returns the number of occurrences of every byte value
+        in <data> as a list of 256 integers
+    '''
+    require_numpy()
+    return np.bincount(np.frombuffer(bytes(data), dtype=np.uint8), minlength=256).tolist()
@@ -5,6 +5,7 @@ length of num, which function,
 '''
 import secrets
 import math
+import instrumentation
 
 ENCRYPTION = {
     0 : lambda x: x**2 + 7*x - 18,
@@ -40,6 +41,7 @@ def decrypt_char(d_function, char, offset):
     decrypted_char = DECRYPTION[d_function](int(char) - offset)
     return chr(int(decrypted_char))
 
+@instrumentation.instrumented("piecewise", "encrypt", hex_decrypt=False)
 def piecewise_encrypt(plaintext, offset):
     ciphertext = ""
 
@@ -64,6 +66,7 @@ def read_digits(ciphertext, index):
         digits += char
     return int(digits), buffer
 
+@instrumentation.instrumented("piecewise", "decrypt", hex_decrypt=False)
 def piecewise_decrypt(ciphertext, offset):
     plaintext = ""
     d_function = 0
@@ -0,0 +1,245 @@
+'''
+    Module which encrypts a file into another through a three-stage pipeline.
+
+    A reader thread reads the source in chunks, the cipher stage transforms
+    them (in this thread or on a process pool) and a writer thread writes
+    them out, with the stages connected by bounded queues. Disk I/O releases
+    the GIL, so reading and writing overlap with the cipher work, while the
+    bounded queues keep at most a few chunks in memory.
+
+    Chunks are written in order. A transform is any callable taking
+    (offset, chunk, final), where <offset> is the chunk's position in the
+    source and <final> marks the last chunk (for padding). Only transforms
+    whose chunks are independent may run on a pool (see ChunkTransform).
+
+    Every stage records its busy and waiting time, so run_pipeline reports
+    which stage bounds the throughput. An optional progress callback (see
+    progress) is called by the writer as chunks are written.
+'''
+import queue
+import threading
+import time
+
+import progress as progress_reports
+
+# Bytes per chunk; a multiple of every cipher's block (or keystream period)
+CHUNK_SIZE = 128 * 1024
+# Chunks held in each queue between two stages
+DEPTH = 4
+STAGES = ["read", "cipher", "write"]
+
+class ChunkTransform:
+    '''
+        Class which binds a module-level chunk function to its leading
+        arguments, so it can be called as transform(offset, chunk, final) and
+        pickled to a worker process. <parallel> marks transforms whose chunks
+        are independent of each other.
+    '''
+    def __init__(self, function, *args, parallel=False):
+        self.function = function
+        self.args = args
+        self.parallel = parallel
+
+    def __call__(self, offset, chunk, final):
+        return self.function(*self.args, offset, chunk, final)
+
+class StageStats:
+    '''
+        Class which accumulates the time a stage spent working and waiting
+        on its neighbours, and the bytes it handled
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.busy = 0.0
+        self.waiting = 0.0
+        self.bytes = 0
+        self.chunks = 0
+
+    @property
+    def throughput(self):
+        '''
+            Bytes per second while the stage was busy
+        '''
+        return self.bytes / self.busy if self.busy else 0
+
+class PipelineStats:
+    '''
+        Class which holds the statistics of a pipeline run
+    '''
+    def __init__(self):
+        self.stages = {name : StageStats(name) for name in STAGES}
+        self.seconds = 0.0
+
+    @property
+    def bottleneck(self):
+        '''
+            Name of the stage which spent the most time busy
+        '''
+        return max(self.stages.values(), key=lambda stage: stage.busy).name
+
+    def report(self):
+        '''
+            Function which formats the statistics as a list of lines
+        '''
+        written = self.stages["write"].bytes
+        throughput = written / self.seconds / (1024 * 1024) if self.seconds else 0
+        lines = [f"pipeline: {written:,} bytes in {self.seconds:.4f}s, {throughput:.3f} MB/s "
+                 f"(bottleneck: {self.bottleneck})"]
+        for stage in self.stages.values():
+            lines.append(f"    {stage.name:<10}: {stage.chunks} chunk(s), busy {stage.busy * 1000:.3f}ms, "
+                         f"waiting {stage.waiting * 1000:.3f}ms, {stage.throughput / (1024 * 1024):.3f} MB/s")
+        return lines
+
+def timed_call(transform, offset, chunk, final):
+    '''
+        Function which runs a transform and returns (output, seconds), so the
+        cipher time of pool workers can be reported
+    '''
+    start = time.perf_counter()
+    output = transform(offset, chunk, final)
+    return output, time.perf_counter() - start
+
+def put(channel, item, stop, stats):
+    '''
+        Function which puts <item> on a bounded queue, giving up once <stop>
+        is set. Time spent blocked counts as waiting.
+    '''
+    start = time.perf_counter()
+    try:
+        while not stop.is_set():
+            try:
+                channel.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    finally:
+        stats.waiting += time.perf_counter() - start
+
+def get(channel, stop, stats):
+    '''
+        Function which takes the next item from a queue, returning None once
+        <stop> is set. Time spent blocked counts as waiting.
+    '''
+    start = time.perf_counter()
+    try:
+        while not stop.is_set():
+            try:
+                return channel.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+    finally:
+        stats.waiting += time.perf_counter() - start
+
+def run_pipeline(source, destination, transform, chunk_size=CHUNK_SIZE, depth=DEPTH, executor=None,
+                 progress=None, total=None):
+    '''
+        Function which reads <source>, transforms it chunk by chunk and
+        writes the result to <destination>, overlapping the three stages.
+
+        Inputs:
+            source      (file)      - Binary file object to read from
+            destination (file)      - Binary file object to write to
+            transform   (callable)  - Called as transform(offset, chunk, final)
+            chunk_size  (int)       - Bytes per chunk, a multiple of 256
+            depth       (int)       - Chunks held in each queue
+            executor    (Executor)  - Optional pool to run the transform on;
+                                       requires a transform whose chunks are
+                                       independent
+            progress    (callable)  - Optional callback called with the bytes
+                                       written (see progress) after every chunk
+            total       (int)       - Expected size of the output, for progress
+        Returns:
+            stats       (PipelineStats) - Busy/waiting time of every stage
+    '''
+    if chunk_size <= 0 or chunk_size % 256 != 0:
+        raise ValueError("The chunk size must be a positive multiple of 256 bytes")
+    if executor is not None and not getattr(transform, "parallel", False):
+        raise ValueError("Only transforms with independent chunks can run on a pool")
+    stats = PipelineStats()
+    read_stats, cipher_stats, write_stats = (stats.stages[name] for name in STAGES)
+    to_cipher = queue.Queue(maxsize=depth)
+    to_writer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    errors = []
+    tracker = None if progress is None else progress_reports.Progress(progress, total, chunk_size)
+
+    def read_chunk():
+        start = time.perf_counter()
+        chunk = source.read(chunk_size)
+        read_stats.busy += time.perf_counter() - start
+        read_stats.bytes += len(chunk)
+        read_stats.chunks += 1
+        return chunk
+
+    def reader():
+        try:
+            offset, chunk = 0, read_chunk()
+            while True:
+                # Read one chunk ahead, so the last chunk is known to be final
+                following = read_chunk() if len(chunk) == chunk_size else b''
+                if not put(to_cipher, (offset, chunk, not following), stop, read_stats) or not following:
+                    break
+                offset, chunk = offset + len(chunk), following
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+
+    def writer():
+        try:
+            while True:
+                item = get(to_writer, stop, write_stats)
+                if item is None:
+                    break
+                if executor is not None:
+                    start = time.perf_counter()
+                    item = item.result()
+                    write_stats.waiting += time.perf_counter() - start
+                output, seconds = item
+                if executor is not None:
+                    cipher_stats.busy += seconds
+                    cipher_stats.bytes += len(output)
+                    cipher_stats.chunks += 1
+                start = time.perf_counter()
+                destination.write(output)
+                write_stats.busy += time.perf_counter() - start
+                write_stats.bytes += len(output)
+                write_stats.chunks += 1
+                if tracker is not None:
+                    tracker.advance(len(output))
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+
+    threads = [threading.Thread(target=reader, daemon=True), threading.Thread(target=writer, daemon=True)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            item = get(to_cipher, stop, cipher_stats)
+            if item is None:
+                break
+            offset, chunk, final = item
+            if executor is not None:
+                result = executor.submit(timed_call, transform, offset, chunk, final)
+            else:
+                result = timed_call(transform, offset, chunk, final)
+                cipher_stats.busy += result[1]
+                cipher_stats.bytes += len(result[0])
+                cipher_stats.chunks += 1
+            if not put(to_writer, result, stop, cipher_stats) or final:
+                break
+        put(to_writer, None, stop, cipher_stats)
+    except BaseException as error:
+        errors.append(error)
+        stop.set()
+    for thread in threads:
+        thread.join()
+    stats.seconds = time.perf_counter() - started
+    if errors:
+        raise errors[0]
+    if tracker is not None:
+        tracker.finish()
+    return stats
@@ -0,0 +1,196 @@
+'''
+    Module which generates keystream ahead of the data it will encrypt.
+
+    In OFB and CTR, and for ChaCha and ArcFour, the keystream does not depend
+    on the plaintext. A KeystreamPrefetcher runs the keystream generator in a
+    background thread, keeping a bounded buffer of segments ready, so that
+    while a streaming caller waits on input the next keystream is already
+    being produced, and arriving data only costs an XOR.
+
+    The prefetcher works on raw bytes with no padding: xor() can be called
+    with pieces of any length and consumes the keystream byte by byte, so the
+    pieces together give the same output as one call on their concatenation.
+
+    Statistics count the segments that were ready when needed (hits) and
+    those the caller had to wait for (stalls).
+'''
+import queue
+import threading
+import time
+
+import block_modes
+import engines
+
+# Keystream bytes generated per segment (a multiple of every block size and
+# keystream period) and the number of segments buffered ahead
+SEGMENT_SIZE = 4096
+DEPTH = 8
+# Modes of operation whose keystream does not depend on the data
+MODES = ["CTR", "OFB"]
+
+class PrefetchStats:
+    '''
+        Class which counts the keystream segments that were ready when
+        needed (hits) and the ones the caller waited for (stalls)
+    '''
+    def __init__(self):
+        self.hits = 0
+        self.stalls = 0
+        self.stall_seconds = 0.0
+        self.bytes = 0
+
+    @property
+    def hit_rate(self):
+        '''
+            Fraction of segments which were ready when needed
+        '''
+        total = self.hits + self.stalls
+        return self.hits / total if total else 0
+
+    def report(self):
+        '''
+            Function which formats the statistics as a list of lines
+        '''
+        return [f"prefetch: {self.bytes:,} bytes, {self.hits} hit(s), {self.stalls} stall(s) "
+                f"({self.hit_rate * 100:.1f}% hits), {self.stall_seconds * 1000:.3f}ms stalled"]
+
+class KeystreamPrefetcher:
+    '''
+        Class which generates keystream in a background thread and XORs it
+        into data as it arrives.
+
+        <generate>(offset, length) must return <length> keystream bytes
+        starting <offset> bytes into the keystream; it is called with
+        consecutive offsets, and lengths of <segment_size>.
+    '''
+    def __init__(self, generate, segment_size=SEGMENT_SIZE, depth=DEPTH):
+        if segment_size <= 0 or segment_size % 256 != 0:
+            raise ValueError("The segment size must be a positive multiple of 256 bytes")
+        self.generate = generate
+        self.segment_size = segment_size
+        self.stats = PrefetchStats()
+        self._segments = queue.Queue(maxsize=depth)
+        self._segment = b''
+        self._position = 0
+        self._error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+    def _put(self, segment):
+        # Wait for room in the buffer, giving up once the prefetcher is closed
+        while not self._stop.is_set():
+            try:
+                self._segments.put(segment, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _fill(self):
+        offset = 0
+        try:
+            while not self._stop.is_set():
+                segment = self.generate(offset, self.segment_size)
+                offset += len(segment)
+                self._put(segment)
+        except BaseException as error:
+            self._error = error
+            self._put(None)
+
+    def _next_segment(self):
+        try:
+            segment = self._segments.get_nowait()
+            self.stats.hits += 1
+        except queue.Empty:
+            start = time.perf_counter()
+            segment = self._segments.get()
+            self.stats.stalls += 1
+            self.stats.stall_seconds += time.perf_counter() - start
+        if segment is None:
+            raise self._error
+        return segment
+
+    def keystream(self, length):
+        '''
+            Function which returns the next <length> keystream bytes
+        '''
+        if self._stop.is_set():
+            raise ValueError("The prefetcher is closed")
+        pieces = []
+        needed = length
+        while needed:
+            if self._position == len(self._segment):
+                self._segment, self._position = self._next_segment(), 0
+            piece = self._segment[self._position : self._position + needed]
+            self._position += len(piece)
+            needed -= len(piece)
+            pieces.append(piece)
+        self.stats.bytes += length
+        return b''.join(pieces)
+
+    def xor(self, data):
+        '''
+            Function which encrypts/decrypts <data> with the next len(data)
+            keystream bytes
+        '''
+        length = len(data)
+        keystream = self.keystream(length)
+        return (int.from_bytes(data, 'big') ^ int.from_bytes(keystream, 'big')).to_bytes(length, 'big')
+
+    def close(self):
+        '''
+            Function which stops the background thread
+        '''
+        self._stop.set()
+        self._thread.join()
+
+def block_keystream(stream):
+    '''
+        Function which returns a generate(offset, length) function producing
+        the keystream of a block_modes.ModeStream in CTR or OFB mode, which is
+        the output of the mode over zero bytes
+    '''
+    if stream.mode not in MODES:
+        raise ValueError(f"{stream.mode} mode has no data-independent keystream. Use one of {', '.join(MODES)}")
+    return lambda offset, length: stream.update(offset, bytes(length))
+
+def keystream_engine(algo, engine, default, mode=None, decrypt=False):
+    '''
+        Function which returns the registered engine of <algo> to generate
+        keystream with, resolving "auto" for the segment size and direction
+        (<decrypt>). Raises ValueError for an engine with no registered
+        function (eg. "reference").
+    '''
+    function = engines.engine_function(algo, engine, default, mode, SEGMENT_SIZE, decrypt)
+    if function is None:
+        raise ValueError(f"The {engine} engine cannot generate keystream ahead")
+    return function
+
+def block_prefetcher(algo, engine, default, key, mode, IV, block_size, depth=DEPTH, decrypt=False):
+    '''
+        Function which returns a KeystreamPrefetcher generating the CTR or OFB
+        keystream of a block cipher engine under <key> and <IV> (given as
+        bytes). <default> is the cipher module's ENGINE, and <decrypt> whether
+        the keystream will decrypt. The keystream is the same either way; only
+        the engine "auto" picks may differ.
+    '''
+    function = keystream_engine(algo, engine, default, mode, decrypt)
+    stream = block_modes.ModeStream(function, key, mode, IV, block_size)
+    return KeystreamPrefetcher(block_keystream(stream), depth=depth)
+
+def stream_prefetcher(algo, engine, default, *args, depth=DEPTH, decrypt=False, **kwargs):
+    '''
+        Function which returns a KeystreamPrefetcher generating the keystream
+        of a stream cipher engine, called as engine(*args, data, **kwargs).
+        The keystream is the engine's output over zero bytes. <decrypt> is as
+        for block_prefetcher.
+    '''
+    function = keystream_engine(algo, engine, default, decrypt=decrypt)
+    return KeystreamPrefetcher(lambda offset, length: function(*args, bytes(length), **kwargs), depth=depth)
@@ -0,0 +1,79 @@
+'''
+    Module which runs operations under cProfile and summarises the hot spots
+    by cipher module
+
+    cProfile only sees the thread that enabled it. Work done elsewhere is
+    not in the profile: the reader and writer threads of pipeline.py, the
+    keystream threads of prefetch.py, and the worker processes of ransom
+    mode, batch.run_many and server.py. With 'workers' set to 1 the cipher
+    stage of ransom mode runs in the profiled thread, so only the file reads
+    and writes are missing.
+'''
+import cProfile
+import pstats
+from pathlib import Path
+
+# Source files of each cipher module, and of the engine machinery shared by
+# the ciphers. Anything else is reported as 'other'
+MODULE_GROUPS = {
+    "aes.py" : "aes",
+    "xts.py" : "aes",
+    "des.py" : "des",
+    "chacha.py" : "chacha",
+    "arcfour.py" : "arcfour",
+    "caesar_encryptor.py" : "caesar",
+    "piecewise_encryptor.py" : "piecewise",
+    "envelope.py" : "envelope",
+    "bitslice.py" : "engines",
+    "block_modes.py" : "engines",
+    "numpy_backend.py" : "engines",
+    "engines.py" : "engines",
+    "batch.py" : "engines",
+    "prefetch.py" : "engines",
+    "progress.py" : "engines"
+}
+
+def profile_call(function, output, top=10):
+    '''
+        Function which runs <function> under cProfile, dumps the raw
+        statistics to <output> (a .pstats file) and prints a summary of the
+        <top> functions of each cipher module. Returns the result of
+        <function>. Only the calling thread is profiled.
+    '''
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return function()
+    finally:
+        profiler.disable()
+        profiler.dump_stats(output)
+        print(f"Profile written to {output}")
+        for line in summarise(pstats.Stats(profiler), top):
+            print(line)
+
+def group_stats(stats):
+    '''
+        Function which groups the functions in a pstats.Stats by cipher module.
+        Returns {group: [(own time, cumulative time, calls, function label)]}
+    '''
+    groups = {}
+    for (filename, line, name), (primitive, calls, own, cumulative, callers) in stats.stats.items():
+        group = MODULE_GROUPS.get(Path(filename).name, "other")
+        label = f"{name} ({Path(filename).name}:{line})" if line else name
+        groups.setdefault(group, []).append((own, cumulative, calls, label))
+    return groups
+
+def summarise(stats, top=10):
+    '''
+        Function which formats the <top> functions by own time of each cipher
+        module, with modules ordered by their total own time
+    '''
+    groups = group_stats(stats)
+    totals = {group: sum(entry[0] for entry in entries) for group, entries in groups.items()}
+    lines = ["===== Profile: hot spots by module ====="]
+    for group in sorted(groups, key=lambda group: (group == "other", -totals[group])):
+        lines.append(f"{group}: {totals[group]:.4f}s own time")
+        for own, cumulative, calls, label in sorted(groups[group], reverse=True)[:top]:
+            lines.append(f"    {own:>9.4f}s own {cumulative:>9.4f}s cumulative {calls:>10} calls  {label}")
+    lines.append("========================================")
+    return lines
@@ -0,0 +1,178 @@
+'''
+    Module which reports the progress of long cipher operations.
+
+    The cipher entry points (aes_encrypt, aes_decrypt, encrypt_des,
+    decrypt_des, chacha_encrypt, chacha_decrypt, arcfour_encrypt,
+    arcfour_decrypt) and pipeline.run_pipeline accept a progress callback,
+    called as callback(done, total, rate, average) with the bytes done and
+    the bytes in total, and the throughput in MB/s since the previous call
+    (rate) and since the start (average). It is called every EVERY blocks
+    and once more when the operation completes.
+
+    Without a callback nothing changes: the engines still transform the
+    whole message in one call. With one, the message is fed to the engine
+    in chunks of EVERY blocks through block_modes.ModeStream, which chains
+    the chunks into exactly the ciphertext of a single call. The stream
+    ciphers repeat their keystream (every 64 bytes for ChaCha, 256 bytes for
+    ArcFour), so chunks starting at multiples of that period are independent
+    and chunked() simply runs the engine on each.
+
+    ProgressBar is a callback drawing a single-line bar with the throughput
+    and the estimated time left.
+'''
+import sys
+import time
+
+import block_modes
+
+# Blocks between two calls of the callback
+EVERY = 4096
+MEGABYTE = 1024 * 1024
+
+class Progress:
+    '''
+        Class which counts the bytes done by an operation and calls
+        <callback> every <every> bytes and on completion
+    '''
+    def __init__(self, callback, total, every):
+        self.callback = callback
+        self.total = total
+        self.every = every
+        self.done = 0
+        self.started = self._last_time = time.perf_counter()
+        self._last_done = 0
+        self._next = every
+
+    def advance(self, count):
+        '''
+            Function which adds <count> bytes done, calling the callback if
+            a report is due
+        '''
+        self.done += count
+        if self.total and self.done > self.total:
+            # Padding made the output longer than announced
+            self.total = self.done
+        if self.done >= self._next or (self.total and self.done >= self.total):
+            self.report()
+
+    def finish(self):
+        '''
+            Function which reports the end of the operation, taking the bytes
+            done as the total (eg. when unpadding made the output shorter),
+            unless the completion was already reported
+        '''
+        if self._last_done == self.done and self.total == self.done:
+            return
+        self.total = self.done
+        self.report()
+
+    def report(self):
+        '''
+            Function which calls the callback with the current progress
+        '''
+        now = time.perf_counter()
+        interval, elapsed = now - self._last_time, now - self.started
+        rate = (self.done - self._last_done) / interval / MEGABYTE if interval > 0 else 0.0
+        average = self.done / elapsed / MEGABYTE if elapsed > 0 else 0.0
+        self._last_time, self._last_done = now, self.done
+        self._next = self.done + self.every
+        self.callback(self.done, self.total, rate, average)
+
+def tracker(callback, total, block_size, every=EVERY):
+    '''
+        Function which returns a Progress reporting every <every> blocks, or
+        None if there is no callback
+    '''
+    if callback is None:
+        return None
+    return Progress(callback, total, every * block_size)
+
+def transform(engine, key, mode, IV, data, block_size, callback, decrypt=False, every=EVERY):
+    '''
+        Function which runs an engine (see aes.ENGINES) over <data> in chunks
+        of <every> blocks, calling <callback> as it goes. The output is the
+        same as engine(key, mode, IV, data, decrypt=decrypt).
+    '''
+    stream = block_modes.ModeStream(engine, key, mode, IV, block_size, decrypt=decrypt)
+    progress = Progress(callback, len(data), every * block_size)
+    chunk_size = every * block_size
+    output = []
+    view = memoryview(data)
+    for offset in range(0, len(data), chunk_size):
+        output.append(stream.update(offset, view[offset : offset + chunk_size]))
+        progress.advance(len(output[-1]))
+    return b''.join(output)
+
+def chunked(function, data, block_size, callback, every=EVERY):
+    '''
+        Function which runs <function> over <data> in chunks of <every>
+        blocks of <block_size> bytes, calling <callback> as it goes. Chunks
+        must be independent once aligned to <block_size>, so the output is
+        the same as function(data).
+    '''
+    progress = Progress(callback, len(data), every * block_size)
+    chunk_size = every * block_size
+    output = []
+    view = memoryview(data)
+    for offset in range(0, len(data), chunk_size):
+        output.append(function(view[offset : offset + chunk_size]))
+        progress.advance(len(output[-1]))
+    return b''.join(output)
+
+def format_seconds(seconds):
+    '''
+        Function which formats a duration as m:ss or h:mm:ss
+    '''
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes}:{seconds:02}"
+
+class ProgressBar:
+    '''
+        Class which draws progress as a single line, redrawn in place at most
+        every <interval> seconds and ended with a newline on completion. It
+        can be used as a progress callback, or called with a count of items
+        and no rates.
+
+        Inputs:
+            label       (str)    - Text shown before the bar
+            width       (int)    - Width of the bar in characters
+            stream      (file)   - Where to draw. Default is sys.stdout
+            interval    (float)  - Minimum seconds between redraws
+    '''
+    def __init__(self, label="", width=40, stream=None, interval=0.1):
+        self.label = label
+        self.width = width
+        self.stream = stream
+        self.interval = interval
+        self._drawn = None
+        self._length = 0
+
+    def __call__(self, done, total, rate=None, average=None):
+        finished = total and done >= total
+        now = time.perf_counter()
+        if not finished and self._drawn is not None and now - self._drawn < self.interval:
+            return
+        self._drawn = now
+        fraction = min(done / total, 1.0) if total else 0.0
+        filled = int(fraction * self.width)
+        line = f"{self.label}[{'>' * filled}{' ' * (self.width - filled)}] {fraction * 100:6.2f}%"
+        if rate is None:
+            line += f" {done}/{total}"
+        else:
+            size = f"{done / MEGABYTE:.1f}/{total / MEGABYTE:.1f}" if total else f"{done / MEGABYTE:.1f}"
+            line += f" {size} MB {rate:.2f} MB/s (avg {average:.2f})"
+            if total and not finished and average:
+                line += f" ETA {format_seconds((total - done) / MEGABYTE / average)}"
+        stream = self.stream or sys.stdout
+        stream.write(f"\r{line.ljust(self._length)}")
+        self._length = len(line)
+        if finished:
+            stream.write("\n")
+            self._drawn, self._length = None, 0
+        stream.flush()
+
+if "__main__" == __name__:
+    import aes
+    data = bytearray(8 * MEGABYTE)
+    aes.aes_encrypt(data, mode="CBC", ransom=True, progress=ProgressBar("AES-CBC "))
@@ -0,0 +1,332 @@
+'''
+    Module which serves encryption to other local processes.
+
+    The server listens with asyncio on a Unix domain socket or a localhost TCP
+    port and hands every request to a pool of worker processes, so concurrent
+    callers share warm interpreters and their cached key schedules instead of
+    starting a new interpreter per call.
+
+    Requests are queued in a bounded queue before reaching the pool. Once the
+    queue is full, connections stop being read until a worker frees a slot,
+    which pushes back on clients instead of buffering without limit.
+
+    Protocol (both directions):
+        header length   (4 bytes, big-endian)
+        payload length  (4 bytes, big-endian)
+        header          (UTF-8 JSON object)
+        payload         (raw bytes)
+
+    Request header:  {"algo": "aes", "op": "encrypt", "mode": "CBC",
+                      "key": <hex or null>, "IV": <hex or null>,
+                      "engine": <name or null>,
+                      "rounds": <ChaCha round count or tier, optional>}
+    Response header: {"ok": true, "key": <hex>, "IV": <hex or null>} or
+                     {"ok": false, "error": <message>}
+
+    Requests are not authenticated, so the server only listens on loopback
+    addresses unless remote hosts are explicitly allowed (--allow-remote),
+    and only replaces an existing Unix socket path if it is a socket.
+
+    Usage:
+        python server.py [--unix PATH | --host HOST --port PORT [--allow-remote]]
+                         [--workers N] [--queue N]
+'''
+import argparse
+import asyncio
+import ipaddress
+import json
+import os
+import socket
+import stat
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+from aes import aes_encrypt, aes_decrypt
+from arcfour import arcfour_encrypt, arcfour_decrypt
+from chacha import chacha_encrypt, chacha_decrypt
+from des import encrypt_des, decrypt_des
+
+ALGORITHMS = {
+    "aes" : (aes_encrypt, aes_decrypt),
+    "des" : (encrypt_des, decrypt_des),
+    "chacha" : (chacha_encrypt, chacha_decrypt),
+    "arcfour" : (arcfour_encrypt, arcfour_decrypt)
+}
+FRAME_HEADER = struct.Struct(">II")
+MAX_HEADER = 64 * 1024
+MAX_PAYLOAD = 256 * 1024 * 1024
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7337
+
+def encode_frame(header, payload=b''):
+    '''
+        Function which packs a header dictionary and a payload into a frame
+    '''
+    header_bytes = json.dumps(header).encode('utf-8')
+    return FRAME_HEADER.pack(len(header_bytes), len(payload)) + header_bytes + bytes(payload)
+
+def check_lengths(header_length, payload_length):
+    '''
+        Function which rejects frames larger than the protocol allows
+    '''
+    if header_length > MAX_HEADER or payload_length > MAX_PAYLOAD:
+        raise ValueError(f"Frame too large ({header_length} byte header, {payload_length} byte payload)")
+
+async def read_frame(reader):
+    '''
+        Function which reads a frame from an asyncio stream. Returns
+        (header, payload), or None if the connection closed between frames.
+    '''
+    try:
+        prefix = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError as error:
+        if error.partial:
+            raise
+        return None
+    header_length, payload_length = FRAME_HEADER.unpack(prefix)
+    check_lengths(header_length, payload_length)
+    header = json.loads(await reader.readexactly(header_length))
+    payload = await reader.readexactly(payload_length)
+    return header, payload
+
+def receive_exactly(sock, length):
+    '''
+        Function which reads exactly <length> bytes from a blocking socket
+    '''
+    data = bytearray()
+    while len(data) < length:
+        chunk = sock.recv(min(length - len(data), 1024 * 1024))
+        if not chunk:
+            raise ConnectionError("Connection closed by the server")
+        data += chunk
+    return bytes(data)
+
+def run_request(header, payload):
+    '''
+        Function which performs one request inside a worker process.
+
+        Inputs:
+            header      (dict)   - The request header (see module docstring)
+            payload     (bytes)  - The data to encrypt/decrypt
+        Returns:
+            header      (dict)   - The response header
+            payload     (bytes)  - The transformed data (empty on error)
+    '''
+    try:
+        if header.get("algo") not in ALGORITHMS:
+            raise ValueError(f"Unknown algorithm '{header.get('algo')}'")
+        encrypt, decrypt = ALGORITHMS[header["algo"]]
+        options = {"mode" : header.get("mode") or "ECB", "IV" : header.get("IV"),
+                   "ransom" : True, "engine" : header.get("engine")}
+        if header["algo"] == "chacha" and header.get("rounds"):
+            options["rounds"] = header["rounds"]
+        if header.get("op") == "encrypt":
+            ciphertext, key, IV = encrypt(bytearray(payload), key=header.get("key"), **options)
+            return {"ok" : True, "key" : key, "IV" : IV}, bytes.fromhex(ciphertext)
+        if header.get("op") == "decrypt":
+            if not header.get("key"):
+                raise ValueError("A key is required to decrypt")
+            plaintext = decrypt(bytearray(payload), header["key"], **options)
+            return {"ok" : True, "key" : header["key"], "IV" : header.get("IV")}, bytes(plaintext)
+        raise ValueError(f"Unknown operation '{header.get('op')}'")
+    except Exception as error:
+        return {"ok" : False, "error" : f"{type(error).__name__}: {error}"}, b''
+
+def is_loopback(host):
+    '''
+        Function which checks that <host> (an address or a name) only
+        resolves to loopback addresses
+    '''
+    if not host:
+        return False
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except (socket.gaierror, UnicodeError):
+        return False
+    return all(ipaddress.ip_address(address.split("%")[0]).is_loopback for address in addresses)
+
+class EncryptionServer:
+    '''
+        Class which serves cipher requests over a local socket using a
+        bounded queue in front of a process pool
+    '''
+    def __init__(self, workers=None, queue_size=64):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self._server = None
+        self._executor = None
+        self._queue = None
+        self._dispatchers = []
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None, allow_remote=False):
+        '''
+            Function which starts the pool and begins listening on the Unix
+            socket <path> if given, otherwise on <host>:<port>. Raises
+            ValueError for a host which is not a loopback address unless
+            <allow_remote>, and FileExistsError if <path> exists and is not a
+            socket.
+        '''
+        if path:
+            if os.path.lexists(path):
+                if not stat.S_ISSOCK(os.lstat(path).st_mode):
+                    raise FileExistsError(f"'{path}' exists and is not a socket")
+                os.unlink(path)
+        elif not allow_remote and not is_loopback(host):
+            raise ValueError(f"'{host}' is not a loopback address. Allow remote clients explicitly to listen on it")
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for i in range(self.workers)]
+        if path:
+            self._server = await asyncio.start_unix_server(self._handle_client, path=path)
+        else:
+            self._server = await asyncio.start_server(self._handle_client, host=host, port=port)
+        return self
+
+    @property
+    def address(self):
+        '''
+            The address the server is listening on
+        '''
+        return self._server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        '''
+            Function which stops listening, cancels the dispatchers and shuts
+            the pool down
+        '''
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        for dispatcher in self._dispatchers:
+            dispatcher.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        if self._executor:
+            self._executor.shutdown(wait=True)
+
+    async def _dispatch(self):
+        # Each dispatcher keeps one worker busy, so at most <workers> requests
+        # are in the pool while the rest wait in the bounded queue
+        loop = asyncio.get_running_loop()
+        while True:
+            header, payload, future = await self._queue.get()
+            try:
+                result = await loop.run_in_executor(self._executor, run_request, header, payload)
+            except Exception as error:
+                result = {"ok" : False, "error" : f"{type(error).__name__}: {error}"}, b''
+            if not future.done():
+                future.set_result(result)
+            self._queue.task_done()
+
+    async def _handle_client(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    frame = await read_frame(reader)
+                except (ValueError, asyncio.IncompleteReadError) as error:
+                    writer.write(encode_frame({"ok" : False, "error" : f"Bad frame: {error}"}))
+                    await writer.drain()
+                    break
+                if frame is None:
+                    break
+                future = loop.create_future()
+                await self._queue.put((frame[0], frame[1], future))
+                header, payload = await future
+                writer.write(encode_frame(header, payload))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+class EncryptionClient:
+    '''
+        Class which sends blocking requests to an EncryptionServer. One
+        client holds one connection and handles one request at a time.
+    '''
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None, timeout=None):
+        if path:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.settimeout(timeout)
+            self._socket.connect(path)
+        else:
+            self._socket = socket.create_connection((host, port), timeout=timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+    def close(self):
+        self._socket.close()
+
+    def request(self, header, payload=b''):
+        '''
+            Function which sends a request and returns (header, payload).
+            Raises ValueError if the server reports an error.
+        '''
+        self._socket.sendall(encode_frame(header, payload))
+        header_length, payload_length = FRAME_HEADER.unpack(receive_exactly(self._socket, FRAME_HEADER.size))
+        check_lengths(header_length, payload_length)
+        response = json.loads(receive_exactly(self._socket, header_length))
+        payload = receive_exactly(self._socket, payload_length)
+        if not response.get("ok"):
+            raise ValueError(response.get("error"))
+        return response, payload
+
+    def encrypt(self, algo, payload, key=None, mode="ECB", IV=None, engine=None, rounds=None):
+        '''
+            Function which encrypts <payload> on the server. Returns
+            (ciphertext, key, IV) with the ciphertext as bytes and the key and
+            IV as hexadecimal strings.
+        '''
+        response, ciphertext = self.request({"algo" : algo, "op" : "encrypt", "mode" : mode, "key" : key,
+                                             "IV" : IV, "engine" : engine, "rounds" : rounds}, payload)
+        return ciphertext, response["key"], response["IV"]
+
+    def decrypt(self, algo, payload, key, mode="ECB", IV=None, engine=None, rounds=None):
+        '''
+            Function which decrypts <payload> on the server and returns the
+            plaintext as bytes
+        '''
+        return self.request({"algo" : algo, "op" : "decrypt", "mode" : mode, "key" : key,
+                             "IV" : IV, "engine" : engine, "rounds" : rounds}, payload)[1]
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, path=None, workers=None, queue_size=64, allow_remote=False):
+    '''
+        Function which runs an EncryptionServer until cancelled
+    '''
+    server = await EncryptionServer(workers, queue_size).start(host, port, path, allow_remote)
+    print(f"3ncrypt0r server listening on {path or server.address} with {server.workers} worker(s)")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve 3ncrypt0r ciphers to local processes")
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix domain socket instead of TCP")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"TCP host (default {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"TCP port (default {DEFAULT_PORT})")
+    parser.add_argument("--allow-remote", action="store_true",
+                        help="allow a --host which is not a loopback address (requests are not authenticated)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--queue", type=int, default=64, help="maximum queued requests (default 64)")
+    args = parser.parse_args(argv)
+    if not args.unix and not args.allow_remote and not is_loopback(args.host):
+        parser.error(f"--host {args.host} is not a loopback address; pass --allow-remote to listen on it")
+    if args.unix and os.path.lexists(args.unix) and not stat.S_ISSOCK(os.lstat(args.unix).st_mode):
+        parser.error(f"--unix {args.unix} exists and is not a socket")
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.queue, args.allow_remote))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+'''
+    The modules live at the top level of the repository (test/ and test1/
+    hold the sample files of ransom mode), so the tests import them from the
+    parent directory.
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep engine tuning in memory even if the environment names a tuning file
+os.environ["ENCRYPTOR_TUNING_FILE"] = ""
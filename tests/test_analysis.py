@@ -0,0 +1,50 @@
+import io
+import random
+
+import pytest
+
+import aes
+import arcfour
+from analysis import CiphertextStats, analyse
+
+def test_chi_squared_known_input():
+    assert analyse(bytes(range(256)) * 4).chi_squared == 0.0
+    # One value 256 times: (256 - 1)^2 / 1 for it and 1 for each of the 255 others
+    assert analyse(bytes(256)).chi_squared == pytest.approx(255 ** 2 + 255)
+    # Two values 128 times each over 256 bytes
+    assert analyse(b"ab" * 128).chi_squared == pytest.approx(2 * 127 ** 2 + 254)
+
+def test_entropy_known_input():
+    assert analyse(bytes(range(256)) * 4).entropy == pytest.approx(8.0)
+    assert analyse(bytes(1000)).entropy == 0.0
+    assert analyse(b"ab" * 500).entropy == pytest.approx(1.0)
+
+def test_random_data_looks_random():
+    stats = analyse(random.Random(6).randbytes(1 << 18))
+    assert 150 < stats.chi_squared < 380
+    assert stats.entropy > 7.99
+    assert stats.repeated == {16 : 0, 8 : 0}
+    assert stats.coincidence_rate == pytest.approx(1 / 256, rel=0.2)
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100, 4096])
+def test_chunking_does_not_change_statistics(chunk_size):
+    data = random.Random(7).randbytes(3000) + bytes(64) * 10 + b"tail"
+    whole = analyse(data, chunk_size=len(data))
+    chunked = analyse(io.BytesIO(data), chunk_size=chunk_size)
+    assert chunked.histogram == whole.histogram
+    assert (chunked.blocks, chunked.repeated) == (whole.blocks, whole.repeated)
+    assert chunked.coincidences == whole.coincidences
+    assert chunked.chi_squared == pytest.approx(whole.chi_squared)
+
+def test_detects_ecb_repeats():
+    ciphertext, key, IV = aes.aes_encrypt(bytearray(b"sixteen byte blk" * 64), mode="ECB", ransom=True)
+    assert analyse(bytes.fromhex(ciphertext)).repeated[16] == 63
+
+def test_detects_arcfour_period():
+    ciphertext = arcfour.arcfour_encrypt(bytearray(4096), ransom=True)[0]
+    assert analyse(bytes.fromhex(ciphertext)).coincidence_rate > 0.9
+
+def test_saturation_is_reported():
+    stats = analyse(random.Random(8).randbytes(16 * 100), max_tracked=10)
+    assert stats.saturated == [16, 8]
+    assert any("tracked" in line for line in stats.report())
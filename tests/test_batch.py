@@ -0,0 +1,88 @@
+import io
+import random
+
+import pytest
+
+import aes
+import arcfour
+import chacha
+import des
+import pipeline
+
+MESSAGES = ["a", "hello world", "x" * 100, "Ünïcode ✓" * 7]
+
+@pytest.mark.parametrize("engine", [None, "reference", "table", "bitslice"])
+@pytest.mark.parametrize("mode", ["ECB", "CBC", "CTR"])
+def test_aes_many(engine, mode):
+    key = "000102030405060708090a0b0c0d0e0f"
+    results = aes.encrypt_many([(message, None) for message in MESSAGES], key, mode, engine=engine)
+    assert [aes.aes_decrypt(ciphertext, key, mode, IV) for ciphertext, IV in results] == MESSAGES
+    assert aes.decrypt_many(results, key, mode, engine=engine) == MESSAGES
+
+@pytest.mark.parametrize("engine", [None, "reference", "integer"])
+@pytest.mark.parametrize("key", ["133457799bbcdff1", "0123456789abcdef23456789abcdef01"])
+def test_des_many(engine, key):
+    results = des.encrypt_many([(message, None) for message in MESSAGES], key, "CBC", engine=engine)
+    assert [des.decrypt_des(ciphertext, key, "CBC", IV) for ciphertext, IV in results] == MESSAGES
+    assert des.decrypt_many(results, key, "CBC", engine=engine) == MESSAGES
+
+@pytest.mark.parametrize("engine", [None, "reference", "word"])
+def test_chacha_many(engine):
+    key = "11" * 32
+    results = chacha.encrypt_many([(message, None) for message in MESSAGES], key, engine=engine, rounds=12)
+    assert [chacha.chacha_decrypt(ciphertext, key, IV, rounds=12) for ciphertext, IV in results] == MESSAGES
+    assert chacha.decrypt_many(results, key, engine=engine, rounds=12) == MESSAGES
+
+@pytest.mark.parametrize("engine", [None, "reference", "bulk"])
+def test_arcfour_many(engine):
+    key = "6b6579"
+    with pytest.raises(ValueError):
+        arcfour.encrypt_many(MESSAGES, key, engine=engine)
+    results = arcfour.encrypt_many(MESSAGES, key, engine=engine, reuse_keystream=True)
+    assert results == [arcfour.arcfour_encrypt(message, key)[0] for message in MESSAGES]
+    assert arcfour.decrypt_many(results, key, engine=engine) == MESSAGES
+
+def test_encrypt_many_needs_key():
+    with pytest.raises(ValueError):
+        aes.encrypt_many([("a", None)], None)
+
+def run_stream(transform, data):
+    destination = io.BytesIO()
+    pipeline.run_pipeline(io.BytesIO(data), destination, transform, chunk_size=4096)
+    return destination.getvalue()
+
+@pytest.mark.parametrize("mode", ["CBC", "CTR"])
+def test_block_stream_encrypt(mode):
+    data = random.Random(1).randbytes(10000)
+    transform, key, IV = aes.stream_encrypt(mode=mode, engine="table")
+    assert aes.aes_decrypt(bytearray(run_stream(transform, data)), key, mode, IV, ransom=True) == data
+    transform, key, IV = des.stream_encrypt(mode=mode, engine="integer")
+    assert des.decrypt_des(bytearray(run_stream(transform, data)), key, mode, IV, ransom=True) == data
+
+def test_stream_cipher_stream_encrypt():
+    data = random.Random(2).randbytes(10000)
+    transform, key, IV = chacha.stream_encrypt(engine="word")
+    assert chacha.chacha_decrypt(bytearray(run_stream(transform, data)), key, IV, ransom=True) == data
+    transform, key, IV = arcfour.stream_encrypt(engine="bulk")
+    assert arcfour.arcfour_decrypt(bytearray(run_stream(transform, data)), key, ransom=True) == data
+
+def test_reference_engine_does_not_stream():
+    assert aes.stream_encrypt(engine="reference") is None
+    assert arcfour.stream_encrypt(engine="reference") is None
+
+def test_prefetchers_match_engines():
+    data = random.Random(3).randbytes(4992)
+    key, IV = bytes(range(16)), bytes(16)
+    with aes.keystream_prefetcher(key, "CTR", IV, engine="table") as prefetcher:
+        output = prefetcher.xor(data[:1000]) + prefetcher.xor(data[1000:])
+    assert output == aes.ENGINES["table"](key, "CTR", IV, data)
+    with des.keystream_prefetcher(key[:8], "OFB", IV[:8]) as prefetcher:
+        assert prefetcher.xor(data) == des.ENGINES["integer"](key[:8], "OFB", IV[:8], data)
+    with chacha.keystream_prefetcher(bytes(32), bytes(12), rounds=8) as prefetcher:
+        assert prefetcher.xor(data[:4096]) == chacha.word_engine(bytes(32), bytes(12), data[:4096], 8)
+    with arcfour.keystream_prefetcher(key) as prefetcher:
+        assert prefetcher.xor(data) == arcfour.bulk_engine(key, data)
+    with pytest.raises(ValueError):
+        aes.keystream_prefetcher(key, "CTR", IV, engine="reference")
+    with pytest.raises(ValueError):
+        aes.keystream_prefetcher(key, "CBC", IV, engine="table")
@@ -0,0 +1,18 @@
+import tracemalloc
+
+import benchmark
+
+def churn():
+    for i in range(100):
+        buffer = bytearray(10000)
+        del buffer
+
+def test_measure_memory_counts_freed_allocations():
+    tracemalloc.start()
+    try:
+        peak, allocated, blocks = benchmark.measure_memory(lambda: churn)
+    finally:
+        tracemalloc.stop()
+    assert allocated >= 100 * 10000
+    assert blocks >= 100
+    assert peak < 5 * 10000
@@ -0,0 +1,38 @@
+import random
+
+import pytest
+
+import aes
+import block_modes
+import des
+
+# (context, block size) per cipher; DES key bytes must not start with 0
+CIPHERS = {
+    "aes" : (lambda: aes.aes_context(bytes(range(1, 17))), 16),
+    "des" : (lambda: des.des_context(bytes(range(1, 9))), 8)
+}
+
+@pytest.mark.parametrize("mode", list(block_modes.MODES))
+@pytest.mark.parametrize("algo", list(CIPHERS))
+def test_in_place_matches_run_mode(algo, mode):
+    context, block_size = CIPHERS[algo]
+    cipher = context()
+    rng = random.Random(37)
+    data = bytes(rng.getrandbits(8) for _ in range(block_size * 9))
+    IV = None if mode == "ECB" else bytes(rng.getrandbits(8) for _ in range(block_size))
+    expected = block_modes.run_mode(cipher, mode, data, IV, block_size)
+    buffer = bytearray(data)
+    assert cipher.encrypt_into(buffer, buffer, mode, IV) == len(data)
+    assert bytes(buffer) == expected
+    assert cipher.decrypt_into(buffer, buffer, mode, IV) == len(data)
+    assert bytes(buffer) == data
+
+@pytest.mark.parametrize("algo", list(CIPHERS))
+def test_into_leaves_the_rest_of_the_destination(algo):
+    context, block_size = CIPHERS[algo]
+    cipher = context()
+    data = bytes(range(block_size * 2))
+    destination = bytearray(b"\xff" * (block_size * 3))
+    cipher.encrypt_into(data, destination, "CBC", bytes(block_size))
+    assert bytes(destination[:len(data)]) == block_modes.run_mode(cipher, "CBC", data, bytes(block_size), block_size)
+    assert destination[len(data):] == b"\xff" * block_size
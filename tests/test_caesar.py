@@ -0,0 +1,45 @@
+import pytest
+
+from caesar_encryptor import caesar_encrypt, caesar_crack
+
+TEXT = ("the quick brown fox jumps over the lazy dog while the farmer sits on "
+        "the porch and watches the sun go down behind the hills")
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+@pytest.mark.parametrize("whitespace", [False, True])
+def test_alphabet_with_space(whitespace):
+    alphabet = LETTERS + " "
+    ciphertext = caesar_encrypt(TEXT, 9, alphabet, whitespace=whitespace)
+    shift, _, plaintext = caesar_crack(ciphertext, alphabet, whitespace=whitespace)[0]
+    assert shift == 9
+    assert plaintext == TEXT
+
+def test_alphabet_with_digits():
+    alphabet = LETTERS + "0123456789"
+    ciphertext = caesar_encrypt(TEXT + " 1984", 30, alphabet)
+    shift, _, plaintext = caesar_crack(ciphertext, alphabet)[0]
+    assert shift == 30
+    assert plaintext == TEXT + " 1984"
+
+def test_shuffled_alphabet():
+    alphabet = "qwertyuiopasdfghjklzxcvbnm"
+    ciphertext = caesar_encrypt(TEXT, 5, alphabet)
+    assert caesar_crack(ciphertext, alphabet)[0][0] == 5
+
+def test_keep_case():
+    ciphertext = caesar_encrypt("Hello my name is Andre mwhahahaha", 7, LETTERS, keep_case=True)
+    shift, _, plaintext = caesar_crack(ciphertext, LETTERS, keep_case=True)[0]
+    assert (shift, plaintext) == (7, "Hello my name is Andre mwhahahaha")
+
+def test_candidates_are_ranked():
+    results = caesar_crack(caesar_encrypt(TEXT, 3, LETTERS), LETTERS, candidates=4)
+    assert len(results) == 4
+    assert [score for _, score, _ in results] == sorted(score for _, score, _ in results)
+
+def test_errors():
+    with pytest.raises(ValueError):
+        caesar_crack("abc", "")
+    with pytest.raises(ValueError):
+        caesar_crack("123", LETTERS)
+    with pytest.raises(ValueError):
+        caesar_crack("123", "0123456789")
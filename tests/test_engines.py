@@ -0,0 +1,98 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import aes
+import block_modes
+import chacha
+import des
+import engines
+
+@pytest.fixture(autouse=True)
+def restore_engines(monkeypatch):
+    monkeypatch.setattr(engines, "PINS", {})
+    monkeypatch.setattr(engines, "TUNING", {})
+
+def test_pin_accepts_registered_engines():
+    engines.pin("aes", "table")
+    engines.pin("des", "reference", "CBC")
+    assert engines.select("aes", "CTR", 100) == "table"
+    assert engines.select("des", "CBC", 100) == "reference"
+    engines.pin("aes", None)
+    assert ("aes", None) not in engines.PINS
+
+@pytest.mark.parametrize("algo, engine, mode", [("aes", "tabel", None), ("des", "integer", "XYZ"),
+                                                ("rot13", "table", None), ("aes", "integer", "CBC")])
+def test_pin_rejects_unknown_names(algo, engine, mode):
+    with pytest.raises(ValueError):
+        engines.pin(algo, engine, mode)
+    assert not engines.PINS
+
+def test_tuning_file_disabled(monkeypatch, tmp_path):
+    monkeypatch.setattr(engines, "TUNING_FILE", None)
+    monkeypatch.setattr(engines, "_loaded", False)
+    monkeypatch.chdir(tmp_path)
+    engines.select("aes", "ECB", 256)
+    assert engines.TUNING
+    assert not list(tmp_path.iterdir())
+
+def test_tuning_file_round_trip(monkeypatch, tmp_path):
+    path = tmp_path / "tuning.json"
+    monkeypatch.setattr(engines, "TUNING_FILE", path)
+    monkeypatch.setattr(engines, "_loaded", False)
+    chosen = engines.select("des", "ECB", 256)
+    assert path.exists()
+    engines.TUNING.clear()
+    engines.load()
+    assert engines.TUNING["des/ECB/encrypt/256"] == chosen
+
+def fail(*args, **kwargs):
+    raise AssertionError("a named engine ran another engine's cipher")
+
+def test_named_engines_ignore_payload_size(monkeypatch):
+    monkeypatch.setattr(aes, "aes_bitsliced", fail)
+    monkeypatch.setattr(aes, "aes_numpy", fail)
+    monkeypatch.setattr(des, "des_bitsliced", fail)
+    key, IV, data = bytes(range(16)), bytes(16), bytes(16 * 4096)
+    for mode in ["ECB", "CTR"]:
+        ciphertext = aes.table_engine(key, mode, IV, data)
+        assert aes.table_engine(key, mode, IV, ciphertext, decrypt=True) == data
+        ciphertext = des.integer_engine(key[:8], mode, IV[:8], data)
+        assert des.integer_engine(key[:8], mode, IV[:8], ciphertext, decrypt=True) == data
+    assert isinstance(aes.lane_cipher("table", key), block_modes.BlockBatch)
+    assert isinstance(des.lane_cipher("integer", key[:8]), block_modes.BlockBatch)
+
+def test_word_engine_ignores_payload_size(monkeypatch):
+    monkeypatch.setattr(chacha.numpy_backend, "xor_repeated", fail)
+    data = bytes(1 << 17)
+    assert chacha.word_engine(bytes(32), bytes(12), chacha.word_engine(bytes(32), bytes(12), data)) == data
+
+def test_engine_function_resolves_by_direction(monkeypatch):
+    monkeypatch.setattr(engines, "_loaded", True)
+    engines.TUNING.update({"aes/CBC/encrypt/4096" : "table", "aes/CBC/decrypt/4096" : "bitslice"})
+    assert engines.engine_function("aes", "auto", aes.ENGINE, "CBC", 4096) is aes.table_engine
+    assert engines.engine_function("aes", "auto", aes.ENGINE, "CBC", 4096, decrypt=True) is aes.bitslice_engine
+
+def test_prefetcher_resolves_by_direction(monkeypatch):
+    monkeypatch.setattr(engines, "_loaded", True)
+    chosen = []
+    monkeypatch.setattr(engines, "select", lambda algo, mode, size, decrypt=False:
+                        chosen.append(decrypt) or engines.available(algo, mode)[0])
+    key, IV = bytes(16), bytes(16)
+    with aes.keystream_prefetcher(key, "CTR", IV, engine="auto", decrypt=True) as prefetcher:
+        prefetcher.xor(bytes(16))
+    with chacha.keystream_prefetcher(bytes(32), bytes(12), engine="auto") as prefetcher:
+        pass
+    assert chosen == [True, False]
+
+def test_tuning_file_is_opt_in(tmp_path):
+    environment = {key : value for key, value in os.environ.items() if key != "ENCRYPTOR_TUNING_FILE"}
+    environment["HOME"] = str(tmp_path)
+    script = "import aes, engines; aes.aes_encrypt('hello', mode='CBC'); print(engines.TUNING_FILE)"
+    environment["PYTHONPATH"] = os.path.dirname(os.path.abspath(aes.__file__))
+    result = subprocess.run([sys.executable, "-c", script], cwd=tmp_path, env=environment, check=True,
+                            capture_output=True, text=True)
+    assert result.stdout.strip() == "None"
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+import envelope
+from app import App
+
+KEK_128 = "000102030405060708090a0b0c0d0e0f"
+KEK_192 = "000102030405060708090a0b0c0d0e0f1011121314151617"
+KEK_256 = "000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f"
+KEY_128 = "00112233445566778899aabbccddeeff"
+KEY_192 = KEY_128 + "0001020304050607"
+KEY_256 = KEY_128 + "000102030405060708090a0b0c0d0e0f"
+
+# RFC 3394 section 4
+@pytest.mark.parametrize("master_key, key, wrapped", [
+    (KEK_128, KEY_128, "1fa68b0a8112b447aef34bd8fb5a7b829d3e862371d2cfe5"),
+    (KEK_192, KEY_128, "96778b25ae6ca435f92b5b97c050aed2468ab8a17ad84e5d"),
+    (KEK_256, KEY_128, "64e8c3f9ce0f5ba263e9777905818a2a93c8191e7d6e8ae7"),
+    (KEK_192, KEY_192, "031d33264e15d33268f24ec260743edce1c6c7ddee725a936ba814915c6762d2"),
+    (KEK_256, KEY_192, "a8f9bc1612c68b3ff6e6f4fbe30e71e4769c8b80a32cb8958cd5d17d6b254da1"),
+    (KEK_256, KEY_256, "28c9f404c4b810f4cbccb35cfb87f8263f5786e2d80ed326cbc7f0e71a99f43bfb988b9b7a02dd21"),
+])
+def test_rfc3394_vectors(master_key, key, wrapped):
+    assert envelope.wrap_key(master_key, bytes.fromhex(key)).hex() == wrapped
+    assert envelope.unwrap_key(master_key, bytes.fromhex(wrapped)).hex() == key
+
+def test_unwrap_with_wrong_key():
+    wrapped = envelope.wrap_key(KEK_128, bytes.fromhex(KEY_128))
+    with pytest.raises(ValueError):
+        envelope.unwrap_key(KEK_256, wrapped)
+
+def test_rewrap_file(tmp_path):
+    old, new = envelope.generate_master_key(), envelope.generate_master_key()
+    path = tmp_path / "object.env"
+    path.write_bytes(envelope.seal(b"payload " * 1000, old))
+    os.chmod(path, 0o600)
+    before = os.stat(path)
+    assert envelope.rewrap_file(path, old, new) == envelope.REWRAPPED
+    assert os.stat(path).st_ino == before.st_ino and os.stat(path).st_size == before.st_size
+    assert envelope.rewrap_file(path, old, new) == envelope.CURRENT
+    assert envelope.unseal(path.read_bytes(), new) == b"payload " * 1000
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    assert [entry.name for entry in tmp_path.iterdir()] == ["object.env"]
+
+def test_failed_rewrap_leaves_file(tmp_path):
+    old, other, new = (envelope.generate_master_key() for i in range(3))
+    path = tmp_path / "object.env"
+    sealed = envelope.seal(b"payload", other)
+    path.write_bytes(sealed)
+    results = envelope.rewrap_files([path], old, new)
+    assert results[0].startswith("ValueError")
+    assert path.read_bytes() == sealed
+    assert [entry.name for entry in tmp_path.iterdir()] == ["object.env"]
+
+def test_app_keeps_key_when_rewrap_fails(tmp_path, capsys):
+    old, other, new = (envelope.generate_master_key() for i in range(3))
+    (tmp_path / "good.env").write_bytes(envelope.seal(b"good", old))
+    (tmp_path / "bad.env").write_bytes(envelope.seal(b"bad", other))
+    with App() as app:
+        app.run_commands([f"key {old}", f"rewrap {tmp_path} {new}"])
+    assert app._options['key'] == old
+    assert "Master key is now" not in capsys.readouterr().out
+    assert envelope.unseal((tmp_path / "good.env").read_bytes(), new) == b"good"
+
+def test_app_rewrap(tmp_path, capsys):
+    old, new = envelope.generate_master_key(), envelope.generate_master_key()
+    (tmp_path / "good.env").write_bytes(envelope.seal(b"good", old))
+    with App() as app:
+        app.run_commands([f"key {old}", f"rewrap {tmp_path} {new}"])
+    assert app._options['key'] == new
+    assert "Master key is now" in capsys.readouterr().out
+
+class HeaderOnlyFile:
+    '''
+        File wrapper recording how many bytes are read from the envelope
+    '''
+    def __init__(self, file):
+        self.file = file
+        self.read_bytes = 0
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.read_bytes += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+def test_rewrap_file_reads_only_the_header(tmp_path, monkeypatch):
+    old, new = envelope.generate_master_key(), envelope.generate_master_key()
+    path = tmp_path / "object.env"
+    path.write_bytes(envelope.seal(bytes(1 << 20), old, key_size=32))
+    opened = []
+    monkeypatch.setattr(envelope, "open", lambda *args: opened.append(HeaderOnlyFile(open(*args))) or opened[-1],
+                        raising=False)
+    assert envelope.rewrap_file(path, old, new) == envelope.REWRAPPED
+    assert opened[0].read_bytes <= envelope.MAX_HEADER_SIZE
+    monkeypatch.undo()
+    assert envelope.unseal(path.read_bytes(), new) == bytes(1 << 20)
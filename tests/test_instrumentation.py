@@ -0,0 +1,27 @@
+import chacha
+import instrumentation
+from app import App
+
+def test_positional_decrypt_counted_as_decrypt():
+    calls = []
+    hook = lambda algo, phase, seconds, amount: calls.append((algo, phase, amount))
+    key = "11" * 32
+    ciphertext, key, IV = chacha.chacha_encrypt("hello", key, engine="reference")
+    instrumentation.add_hook(hook)
+    try:
+        assert chacha.chacha_parse(ciphertext, key, IV, True, False, "reference") == "hello"
+        assert chacha.decrypt_many([(ciphertext, IV)], key, engine="reference") == ["hello"]
+    finally:
+        instrumentation.remove_hook(hook)
+    operations = [(algo, phase, amount) for algo, phase, amount in calls if phase in instrumentation.OPERATIONS]
+    assert operations == [("chacha", "decrypt", 8), ("chacha", "decrypt", 8)]
+
+def test_apps_release_their_hook():
+    hooks = list(instrumentation.HOOKS)
+    for i in range(3):
+        with App() as app:
+            assert len(instrumentation.HOOKS) == len(hooks) + 1
+    app = App()
+    app.run_commands(["quit"])
+    assert instrumentation.HOOKS == hooks
+    assert instrumentation.ENABLED == bool(hooks)
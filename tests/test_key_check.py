@@ -0,0 +1,79 @@
+import pytest
+
+import aes
+import chacha
+import des
+from key_check import WrongKeyError, make_header, verify_header, HEADER
+
+AES_KEY = "000102030405060708090a0b0c0d0e0f"
+
+def test_round_trip_with_check():
+    ciphertext, key, IV = aes.aes_encrypt("hello", AES_KEY, "CBC", check=True)
+    assert len(ciphertext) == 2 * HEADER.size + 32
+    assert aes.aes_decrypt(ciphertext, key, "CBC", IV, check=True) == "hello"
+    ciphertext, key, IV = des.encrypt_des("hello", mode="CTR", check=True)
+    assert des.decrypt_des(ciphertext, key, "CTR", IV, check=True) == "hello"
+
+@pytest.mark.parametrize("change", ["key", "IV", "mode"])
+def test_wrong_parameters_rejected(change):
+    ciphertext, key, IV = aes.aes_encrypt("hello", AES_KEY, "CBC", check=True)
+    arguments = {"key" : key, "mode" : "CBC", "IV" : IV}
+    arguments[change] = {"key" : "ff" * 16, "IV" : "ee" * 16, "mode" : "CFB"}[change]
+    with pytest.raises(WrongKeyError):
+        aes.aes_decrypt(ciphertext, arguments["key"], arguments["mode"], arguments["IV"], check=True)
+
+def test_wrong_rounds_rejected():
+    ciphertext, key, IV = chacha.chacha_encrypt("hello", rounds=8, check=True)
+    assert chacha.chacha_decrypt(ciphertext, key, IV, rounds=8, check=True) == "hello"
+    with pytest.raises(WrongKeyError):
+        chacha.chacha_decrypt(ciphertext, key, IV, rounds=20, check=True)
+
+def test_key_formatting_ignored():
+    header = make_header("aes", "0a" * 16, "ECB", "11" * 16)
+    verify_header(header, "aes", "0A" * 16, "ECB", None)
+
+def test_leading_zeros_kept():
+    header = make_header("aes", AES_KEY, "CBC", "00ab" + "11" * 14)
+    with pytest.raises(WrongKeyError):
+        verify_header(header, "aes", AES_KEY, "CBC", "ab" + "11" * 14)
+    with pytest.raises(WrongKeyError):
+        verify_header(make_header("aes", "00" + "ab" * 15, "ECB"), "aes", "ab" * 15, "ECB")
+
+@pytest.mark.parametrize("value", ["abc", "xy" * 16])
+def test_malformed_values_rejected(value):
+    with pytest.raises(ValueError):
+        make_header("aes", AES_KEY, "CBC", value)
+
+def test_missing_header():
+    ciphertext, key, IV = aes.aes_encrypt("hello", AES_KEY, "CBC")
+    with pytest.raises(ValueError):
+        aes.aes_decrypt(ciphertext, key, "CBC", IV, check=True)
+    with pytest.raises(WrongKeyError):
+        verify_header(make_header("des", AES_KEY), "aes", AES_KEY)
+
+@pytest.mark.parametrize("rounds", ["chacha8", "chacha12", 4, 6])
+@pytest.mark.parametrize("ransom", [False, True])
+def test_reduced_rounds_recorded_without_check(rounds, ransom):
+    text = b"reduced rounds" if ransom else "reduced rounds"
+    ciphertext, key, IV = chacha.chacha_encrypt(bytearray(text) if ransom else text, rounds=rounds, ransom=ransom)
+    assert ciphertext.startswith(make_header("chacha", key, None, IV, chacha.check_rounds(rounds)).hex())
+    ciphertext = bytearray.fromhex(ciphertext) if ransom else ciphertext
+    assert chacha.chacha_decrypt(ciphertext, key, IV, ransom=ransom) == text
+    assert chacha.chacha_decrypt(ciphertext, key, IV, ransom=ransom, rounds=rounds) == text
+    with pytest.raises(WrongKeyError):
+        chacha.chacha_decrypt(ciphertext, key, IV, ransom=ransom, rounds="chacha20")
+
+def test_default_rounds_unchanged():
+    ciphertext, key, IV = chacha.chacha_encrypt("default rounds")
+    assert len(ciphertext) == 2 * 16
+    assert chacha.chacha_decrypt(ciphertext, key, IV) == "default rounds"
+    with pytest.raises(ValueError):
+        chacha.chacha_decrypt(ciphertext, key, IV, rounds=8, check=True)
+
+def test_reduced_rounds_batches_and_streams():
+    key = "11" * 32
+    encrypted = chacha.encrypt_many([("first", None), ("second", None)], key, rounds=8)
+    assert chacha.decrypt_many(encrypted, key) == ["first", "second"]
+    transform, key, IV = chacha.stream_encrypt(key, "22" * 12, rounds=8)
+    assert transform(0, b"streamed", True).hex() == chacha.chacha_encrypt(bytearray(b"streamed"), key, IV,
+                                                                            ransom=True, rounds=8)[0]
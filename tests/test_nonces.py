@@ -0,0 +1,90 @@
+import os
+import threading
+
+import pytest
+
+import nonces
+
+def test_pool_serves_distinct_bytes():
+    pool = nonces.EntropyPool(batch_size=64)
+    values = [pool.token_bytes(16) for i in range(100)]
+    assert len(set(values)) == len(values)
+    assert pool.refills >= 25
+    assert len(pool.token_bytes(100)) == 100
+
+def test_pool_threads_get_distinct_bytes():
+    pool = nonces.EntropyPool(batch_size=1024)
+    values = []
+    def draw():
+        drawn = [pool.token_bytes(16) for i in range(500)]
+        values.extend(drawn)
+    threads = [threading.Thread(target=draw) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(values)) == 2000
+
+def test_nonzero_bytes():
+    assert all(nonces.nonzero_bytes(8)[0] for i in range(1000))
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_pool_reset_after_fork():
+    nonces.token_bytes(16)      # Fill this thread's buffer before forking
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        os.write(write_end, nonces.token_bytes(32))
+        os._exit(0)
+    os.close(write_end)
+    child = os.read(read_end, 32)
+    os.close(read_end)
+    os.waitpid(pid, 0)
+    assert len(child) == 32
+    assert child != nonces.token_bytes(32)
+
+def test_counter_nonces_persist_across_instances(tmp_path):
+    path = tmp_path / "nonces.json"
+    key = nonces.token_bytes(16)
+    first = nonces.CounterNonces(path, reserve=10).next(key, 3)
+    assert [int.from_bytes(nonce[:8], 'big') for nonce in first] == [1, 2, 3]
+    assert all(nonce[8:] == bytes(8) for nonce in first)
+    second = nonces.CounterNonces(path, reserve=10).next(key)[0]
+    assert int.from_bytes(second[:8], 'big') > 3
+    assert key.hex() not in path.read_text()
+
+def test_counter_nonces_per_key(tmp_path):
+    counters = nonces.CounterNonces(tmp_path / "nonces.json", "des")
+    assert counters.next_hex("00" * 8) == counters.next_hex("11" * 8) == ["01000000" + "00" * 4]
+
+def test_counter_nonces_threads(tmp_path):
+    counters = nonces.CounterNonces(tmp_path / "nonces.json", "chacha", reserve=7)
+    key = bytes(32)
+    values = []
+    def draw():
+        drawn = [counters.next(key)[0] for i in range(300)]
+        values.extend(drawn)
+    threads = [threading.Thread(target=draw) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(values)) == 1200
+    assert nonces.CounterNonces(tmp_path / "nonces.json", "chacha").next(key)[0] not in values
+
+@pytest.mark.parametrize("algo, mode", [("aes", "CBC"), ("aes", "CFB"), ("aes", "PCBC"), ("des", "CBC"),
+                                        ("chacha", "CTR")])
+def test_counter_nonces_reject_modes(tmp_path, algo, mode):
+    with pytest.raises(ValueError):
+        nonces.CounterNonces(tmp_path / "nonces.json", algo, mode)
+    counters = nonces.CounterNonces(tmp_path / "nonces.json", algo)
+    with pytest.raises(ValueError):
+        counters.next(bytes(16), mode=mode)
+
+def test_counter_nonces_exhausted(tmp_path):
+    counters = nonces.CounterNonces(tmp_path / "nonces.json", "des")
+    counters._next[nonces.key_id(bytes(8))] = (1 << 32) - 1
+    counters.next(bytes(8))
+    with pytest.raises(OverflowError):
+        counters.next(bytes(8))
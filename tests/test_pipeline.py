@@ -0,0 +1,52 @@
+import io
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import aes
+import chacha
+import pipeline
+
+CHUNK_SIZE = 1024
+DATA = random.Random(38).randbytes(10 * CHUNK_SIZE + 37)
+AES_KEY = "000102030405060708090a0b0c0d0e0f"
+AES_IV = "f0e0d0c0b0a090807060504030201000"
+CHACHA_KEY = "ab" * 32
+CHACHA_IV = "cd" * 12
+
+@pytest.fixture(scope="module")
+def pool():
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        yield executor
+
+def run(transform, executor=None):
+    destination = io.BytesIO()
+    stats = pipeline.run_pipeline(io.BytesIO(DATA), destination, transform, chunk_size=CHUNK_SIZE,
+                                  executor=executor)
+    assert stats.stages["cipher"].chunks == math.ceil(len(DATA) / CHUNK_SIZE)
+    return destination.getvalue()
+
+@pytest.mark.parametrize("mode", ["ECB", "CTR"])
+def test_parallel_aes_matches_one_shot(pool, mode):
+    transform, key, IV = aes.stream_encrypt(AES_KEY, mode, AES_IV, engine="table", chunk_size=CHUNK_SIZE)
+    assert transform.parallel
+    expected = aes.aes_encrypt(DATA, key, mode, IV, ransom=True, engine="table")[0]
+    assert run(transform, pool).hex() == expected
+
+def test_sequential_aes_matches_one_shot(pool):
+    transform, key, IV = aes.stream_encrypt(AES_KEY, "CBC", AES_IV, engine="table", chunk_size=CHUNK_SIZE)
+    assert not transform.parallel
+    with pytest.raises(ValueError):
+        run(transform, pool)
+    expected = aes.aes_encrypt(DATA, key, "CBC", IV, ransom=True, engine="table")[0]
+    assert run(transform).hex() == expected
+
+@pytest.mark.parametrize("rounds", [chacha.DEFAULT_ROUNDS, 8])
+def test_parallel_chacha_matches_one_shot(pool, rounds):
+    transform, key, IV = chacha.stream_encrypt(CHACHA_KEY, CHACHA_IV, engine="word", chunk_size=CHUNK_SIZE,
+                                               rounds=rounds)
+    assert transform.parallel
+    expected = chacha.chacha_encrypt(bytearray(DATA), key, IV, ransom=True, engine="word", rounds=rounds)[0]
+    assert run(transform, pool).hex() == expected
@@ -0,0 +1,109 @@
+import io
+import math
+import random
+
+import pytest
+
+import aes
+import arcfour
+import chacha
+import des
+import pipeline
+import progress
+
+class Recorder:
+    '''
+        Progress callback which records its calls
+    '''
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, done, total, rate=None, average=None):
+        self.calls.append((done, total))
+
+    def check(self, total, reports):
+        assert len(self.calls) == reports
+        assert [done for done, _ in self.calls] == sorted(done for done, _ in self.calls)
+        assert self.calls[-1] == (total, total)
+        assert [done for done, _ in self.calls].count(total) == 1
+
+def test_transform_reports_every_chunk():
+    data = random.Random(9).randbytes(16 * 100)
+    key, IV = bytes(16), bytes(16)
+    recorder = Recorder()
+    output = progress.transform(aes.ENGINES["table"], key, "CBC", IV, data, 16, recorder, every=8)
+    assert output == aes.ENGINES["table"](key, "CBC", IV, data)
+    recorder.check(len(data), math.ceil(100 / 8))
+    assert [done for done, _ in recorder.calls[:3]] == [128, 256, 384]
+
+def test_tracker_without_callback():
+    assert progress.tracker(None, 100, 16) is None
+
+@pytest.mark.parametrize("mode", ["CBC", "CTR"])
+def test_aes_entry_points(mode):
+    data = bytearray(random.Random(10).randbytes(3 * progress.EVERY * 16 + 100))
+    recorder = Recorder()
+    ciphertext, key, IV = aes.aes_encrypt(data, mode=mode, ransom=True, engine="table", progress=recorder)
+    # 3 full chunks, then the rest with its padding
+    recorder.check(len(ciphertext) // 2, 4)
+    assert aes.aes_encrypt(data, key, mode, IV, ransom=True, engine="table")[0] == ciphertext
+    recorder = Recorder()
+    assert aes.aes_decrypt(bytearray.fromhex(ciphertext), key, mode, IV, ransom=True, engine="table",
+                           progress=recorder) == data
+    recorder.check(len(ciphertext) // 2, 4)
+
+def test_reference_engine_reports():
+    recorder = Recorder()
+    ciphertext, key, IV = des.encrypt_des("x" * 40, mode="CBC", engine="reference", progress=recorder)
+    recorder.check(len(ciphertext) // 2, 1)
+    recorder = Recorder()
+    assert des.decrypt_des(ciphertext, key, "CBC", IV, engine="reference", progress=recorder) == "x" * 40
+    assert recorder.calls[-1][0] == recorder.calls[-1][1]
+
+@pytest.mark.parametrize("engine", ["word", "reference"])
+def test_chacha_entry_points(engine):
+    # The reference engine is slow, so it only gets a short message
+    length = 3 * progress.EVERY * 64 + 10 if engine == "word" else 300
+    data = bytearray(random.Random(12).randbytes(length))
+    recorder = Recorder()
+    # The reference engine pads the caller's buffer in place, so it gets copies
+    ciphertext, key, IV = chacha.chacha_encrypt(bytearray(data), ransom=True, engine=engine, progress=recorder)
+    recorder.check(len(ciphertext) // 2, 4 if engine == "word" else 1)
+    assert chacha.chacha_encrypt(bytearray(data), key, IV, ransom=True, engine=engine)[0] == ciphertext
+    recorder = Recorder()
+    assert chacha.chacha_decrypt(bytearray.fromhex(ciphertext), key, IV, ransom=True, engine=engine,
+                                 progress=recorder) == data
+    recorder.check(len(ciphertext) // 2, 4 if engine == "word" else 1)
+
+@pytest.mark.parametrize("engine", ["bulk", "reference"])
+def test_arcfour_entry_points(engine):
+    length = 3 * progress.EVERY * 256 + 10 if engine == "bulk" else 300
+    data = bytearray(random.Random(13).randbytes(length))
+    recorder = Recorder()
+    ciphertext, key, _ = arcfour.arcfour_encrypt(data, ransom=True, engine=engine, progress=recorder)
+    recorder.check(len(data), 4 if engine == "bulk" else 1)
+    assert arcfour.arcfour_encrypt(data, key, ransom=True, engine=engine)[0] == ciphertext
+    recorder = Recorder()
+    assert arcfour.arcfour_decrypt(bytearray.fromhex(ciphertext), key, ransom=True, engine=engine,
+                                   progress=recorder) == data
+    recorder.check(len(data), 4 if engine == "bulk" else 1)
+
+def test_pipeline_reports():
+    data = random.Random(11).randbytes(10 * 1000 + 7)
+    transform, key, IV = aes.stream_encrypt(mode="CTR", engine="table")
+    recorder = Recorder()
+    destination = io.BytesIO()
+    pipeline.run_pipeline(io.BytesIO(data), destination, transform, chunk_size=1024,
+                          progress=recorder, total=len(data))
+    output = len(destination.getvalue())
+    recorder.check(output, len(recorder.calls))
+    assert len(recorder.calls) >= 10
+
+def test_progress_bar_output():
+    stream = io.StringIO()
+    bar = progress.ProgressBar("test ", width=10, stream=stream, interval=0)
+    bar(50, 100, 1.0, 1.0)
+    bar(100, 100, 1.0, 1.0)
+    lines = stream.getvalue().split("\r")
+    assert "[>>>>>     ]  50.00%" in lines[1]
+    assert lines[-1].endswith("\n") and "100.00%" in lines[-1]
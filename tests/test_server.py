@@ -0,0 +1,45 @@
+import asyncio
+import socket
+
+import pytest
+
+import server
+
+@pytest.mark.parametrize("host, loopback", [("127.0.0.1", True), ("localhost", True), ("::1", True),
+                                            ("0.0.0.0", False), ("", False), ("192.0.2.1", False)])
+def test_is_loopback(host, loopback):
+    assert server.is_loopback(host) == loopback
+
+def test_refuses_remote_host():
+    with pytest.raises(ValueError):
+        asyncio.run(server.EncryptionServer(1).start(host="0.0.0.0", port=0))
+
+def test_refuses_to_replace_a_file(tmp_path):
+    path = tmp_path / "server.sock"
+    path.write_text("not a socket")
+    with pytest.raises(FileExistsError):
+        asyncio.run(server.EncryptionServer(1).start(path=str(path)))
+    assert path.read_text() == "not a socket"
+
+def test_replaces_stale_socket(tmp_path):
+    path = str(tmp_path / "server.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+
+    async def round_trip():
+        encryption_server = await server.EncryptionServer(1).start(path=path)
+        try:
+            def call():
+                with server.EncryptionClient(path=path, timeout=30) as client:
+                    ciphertext, key, IV = client.encrypt("aes", b"hello", mode="CBC")
+                    return client.decrypt("aes", ciphertext, key, mode="CBC", IV=IV)
+            return await asyncio.get_running_loop().run_in_executor(None, call)
+        finally:
+            await encryption_server.close()
+
+    assert asyncio.run(round_trip()) == b"hello"
+
+def test_main_rejects_remote_host():
+    with pytest.raises(SystemExit):
+        server.main(["--host", "0.0.0.0"])
@@ -0,0 +1,44 @@
+import base64
+import random
+
+import pytest
+
+import text_encoding
+from text_encoding import CHUNK_SIZE
+
+# One-shot encoders the chunked ones must match
+REFERENCE = {
+    "hex" : lambda data: data.hex(),
+    "base64" : lambda data: base64.b64encode(data).decode('ascii'),
+    "base85" : lambda data: base64.b85encode(data).decode('ascii')
+}
+
+@pytest.mark.parametrize("length", [0, 1, 2, 3, 4, 5, CHUNK_SIZE - 1, CHUNK_SIZE, CHUNK_SIZE + 1,
+                                    2 * CHUNK_SIZE + 3])
+@pytest.mark.parametrize("encoding", text_encoding.ENCODINGS)
+def test_round_trip(encoding, length):
+    data = random.Random(length).randbytes(length)
+    text = text_encoding.encode(data, encoding)
+    assert text == REFERENCE[encoding](data)
+    assert text_encoding.is_valid(text, encoding)
+    assert text_encoding.decode(text, encoding) == data
+
+@pytest.mark.parametrize("encoding, text", [
+    ("hex", "abc"),
+    ("hex", "0g"),
+    ("base64", "QQ="),
+    ("base64", "Q==="),
+    ("base64", "QQ=A"),
+    ("base64", "QUJD*A=="),
+    ("base85", "0"),
+    ("base85", "012345"),
+    ("base85", "0123\""),
+])
+def test_invalid_text_rejected(encoding, text):
+    assert not text_encoding.is_valid(text, encoding)
+    with pytest.raises(ValueError):
+        text_encoding.decode(text, encoding)
+
+def test_unknown_encoding():
+    with pytest.raises(ValueError):
+        text_encoding.encode(b"data", "base32")
@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+import aes
+import xts
+
+STEALING_KEY = "fffefdfcfbfaf9f8f7f6f5f4f3f2f1f0bfbebdbcbbbab9b8b7b6b5b4b3b2b1b0"
+
+# IEEE 1619-2007 annex B: (vector, key, data unit number, plaintext, ciphertext)
+VECTORS = [
+    (1, "00" * 32, 0, "00" * 32,
+     "917cf69ebd68b2ec9b9fe9a3eadda692cd43d2f59598ed858c02c2652fbf922e"),
+    (2, "11" * 16 + "22" * 16, 0x3333333333, "44" * 32,
+     "c454185e6a16936e39334038acef838bfb186fff7480adc4289382ecd6d394f0"),
+    (3, "fffefdfcfbfaf9f8f7f6f5f4f3f2f1f0" + "22" * 16, 0x3333333333, "44" * 32,
+     "af85336b597afc1a900b2eb21ec949d292df4c047e0b21532186a5971a227a89"),
+    # Ciphertext stealing: 17 to 20 byte data units
+    (15, STEALING_KEY, 0x123456789a, "000102030405060708090a0b0c0d0e0f10",
+     "6c1625db4671522d3d7599601de7ca09ed"),
+    (16, STEALING_KEY, 0x123456789a, "000102030405060708090a0b0c0d0e0f1011",
+     "d069444b7a7e0cab09e24447d24deb1fedbf"),
+    (17, STEALING_KEY, 0x123456789a, "000102030405060708090a0b0c0d0e0f101112",
+     "e5df1351c0544ba1350b3363cd8ef4beedbf9d"),
+    (18, STEALING_KEY, 0x123456789a, "000102030405060708090a0b0c0d0e0f10111213",
+     "9d84c813f719aa2c7be3f66171c7c5c2edbf9dac"),
+]
+
+@pytest.mark.parametrize("engine", list(aes.ENGINES))
+@pytest.mark.parametrize("vector, key, sector, plaintext, ciphertext", VECTORS)
+def test_ieee1619_vectors(engine, vector, key, sector, plaintext, ciphertext):
+    cipher = xts.XTSCipher(key, sector_size=32, engine=engine)
+    assert cipher.encrypt(bytes.fromhex(plaintext), sector).hex() == ciphertext
+    assert cipher.decrypt(bytes.fromhex(ciphertext), sector).hex() == plaintext
+
+def test_short_sector_rejected():
+    with pytest.raises(ValueError):
+        xts.XTSCipher("00" * 32, sector_size=32).encrypt(bytes(15))
+
+def test_sectors_are_independent():
+    cipher = xts.XTSCipher(xts.generate_key(256), sector_size=64)
+    data = random.Random(4).randbytes(64 * 10 + 23)
+    whole = cipher.encrypt(data, 7)
+    assert len(whole) == len(data)
+    assert cipher.encrypt(data[128:256], 9) == whole[128:256]
+    assert cipher.decrypt(whole, 7) == data
+
+def test_file_patches(tmp_path):
+    key = xts.generate_key()
+    rng = random.Random(5)
+    plaintext = bytearray(rng.randbytes(3000))
+    with xts.XTSFile(tmp_path / "disk.img", key, sector_size=512) as disk:
+        disk.write(0, plaintext)
+        for i in range(10):
+            offset, data = rng.randrange(3200), rng.randbytes(rng.randrange(1, 700))
+            disk.write(offset, data)
+            if offset > len(plaintext):
+                plaintext += bytes(offset - len(plaintext))
+            plaintext[offset : offset + len(data)] = data
+        assert disk.read(0, len(plaintext) + 100) == plaintext
+        assert disk.read(1000, 33) == plaintext[1000:1033]
+    stored = (tmp_path / "disk.img").read_bytes()
+    assert xts.XTSCipher(key, 512).decrypt(stored) == plaintext
@@ -0,0 +1,97 @@
+'''
+    Module which encodes ciphertext as text for the App's text mode.
+
+    Ciphertext can be shown as hexadecimal (the default), base64 or base85.
+    Base64 is 25% and base85 37.5% shorter than hexadecimal. Text is checked
+    syntactically before it is decoded, by deleting every character of the
+    encoding's alphabet with str.translate and checking the length, so
+    malformed input is rejected without being converted.
+
+    Encoding and decoding work in chunks of CHUNK_SIZE bytes, which are whole
+    base64 and base85 groups, so the chunks can be joined directly.
+'''
+import base64
+import binascii
+
+ENCODINGS = ["hex", "base64", "base85"]
+# Bytes per encoded chunk, a multiple of the 3-byte base64 and 4-byte base85
+# groups, and the matching number of characters per decoded chunk
+CHUNK_SIZE = 48 * 1024
+TEXT_CHUNKS = {
+    "base64" : CHUNK_SIZE // 3 * 4,
+    "base85" : CHUNK_SIZE // 4 * 5
+}
+ALPHABETS = {
+    "hex" : "0123456789abcdefABCDEF",
+    "base64" : "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/",
+    "base85" : "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz!#$%&()*+-;<=>?@^_`{|}~"
+}
+# Tables deleting every character of each alphabet
+DELETE_TABLES = {encoding : str.maketrans('', '', alphabet) for encoding, alphabet in ALPHABETS.items()}
+
+def check_encoding(encoding):
+    '''
+        Function which rejects unknown encoding names
+    '''
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}'. Valid encodings are {', '.join(ENCODINGS)}")
+    return encoding
+
+def is_valid(text, encoding="hex"):
+    '''
+        Function which checks that <text> is syntactically valid in
+        <encoding> (alphabet, length and padding) without decoding it
+    '''
+    check_encoding(encoding)
+    if encoding == "base64":
+        # Up to two '=' padding characters, only at the end
+        body = text.rstrip('=')
+        if len(text) % 4 or len(text) - len(body) > 2:
+            return False
+        text = body
+    elif encoding == "hex" and len(text) % 2:
+        return False
+    elif encoding == "base85" and len(text) % 5 == 1:
+        return False
+    return not text.translate(DELETE_TABLES[encoding])
+
+def encode(data, encoding="hex"):
+    '''
+        Function which encodes bytes as text in <encoding>
+    '''
+    check_encoding(encoding)
+    data = memoryview(bytes(data))
+    if encoding == "hex":
+        return binascii.b2a_hex(data).decode('ascii')
+    if encoding == "base64":
+        chunks = (binascii.b2a_base64(data[i : i + CHUNK_SIZE], newline=False)
+                  for i in range(0, len(data), CHUNK_SIZE))
+    else:
+        chunks = (base64.b85encode(data[i : i + CHUNK_SIZE]) for i in range(0, len(data), CHUNK_SIZE))
+    return b''.join(chunks).decode('ascii')
+
+def decode(text, encoding="hex"):
+    '''
+        Function which decodes text in <encoding> to bytes. Raises ValueError
+        if the text is not valid in the encoding.
+    '''
+    text = text.strip()
+    if not is_valid(text, encoding):
+        raise ValueError(f"Text is not valid {encoding}")
+    if encoding == "hex":
+        return binascii.a2b_hex(text)
+    size = TEXT_CHUNKS[encoding]
+    if encoding == "base64":
+        chunks = (binascii.a2b_base64(text[i : i + size]) for i in range(0, len(text), size))
+    else:
+        chunks = (base64.b85decode(text[i : i + size]) for i in range(0, len(text), size))
+    try:
+        return b''.join(chunks)
+    except (binascii.Error, ValueError) as error:
+        raise ValueError(f"Text is not valid {encoding}: {error}")
+
+if "__main__" == __name__:
+    data = bytes(range(256))
+    for encoding in ENCODINGS:
+        text = encode(data, encoding)
+        print(f"{encoding}: {len(text)} characters, round trip {decode(text, encoding) == data}")
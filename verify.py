@@ -0,0 +1,454 @@
+'''
+    Module which verifies the optimised cipher engines against the bit-list
+    reference implementations.
+
+    The bit-list functions in aes.py, des.py, chacha.py and arcfour.py are the
+    frozen reference. Every engine listed in a module's ENGINES table is run
+    over randomised keys, IVs, modes and lengths (including the padding edge
+    cases) and its output must match the reference bit for bit, including
+    which inputs raise errors. Published known-answer vectors are checked on
+    top of that, and the bitsliced ciphers are checked block by block against
+    the reference block functions over batches spanning several lanes.
+    AES-XTS is checked against the IEEE 1619 vectors and its batched sectors
+    against a block-by-block computation.
+
+    Usage:
+        python verify.py [trials] [seed]
+'''
+import io
+import random
+import sys
+
+import aes
+import arcfour
+import bitslice
+import block_modes
+import chacha
+import des
+import xts
+
+# FIPS-197 Appendix C: (key, plaintext, ciphertext)
+AES_VECTORS = [
+    ("000102030405060708090a0b0c0d0e0f",
+     "00112233445566778899aabbccddeeff", "69c4e0d86a7b0430d8cdb78070b4c55a"),
+    ("000102030405060708090a0b0c0d0e0f1011121314151617",
+     "00112233445566778899aabbccddeeff", "dda97ca4864cdfe06eaf70a0ec0d7191"),
+    ("000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f",
+     "00112233445566778899aabbccddeeff", "8ea2b7ca516745bfeafc49904b496089")
+]
+
+# Classic DES worked example, a weak-key vector and the first block of the
+# SP 800-67 3-key triple DES example: (key, plaintext, ciphertext)
+DES_VECTORS = [
+    ("133457799bbcdff1", "0123456789abcdef", "85e813540f0ab405"),
+    ("0e329232ea6d0d73", "8787878787878787", "0000000000000000"),
+    ("0123456789abcdef23456789abcdef01456789abcdef0123", "5468652071756663", "a826fd8ce53b855f")
+]
+
+# RC4 test vectors: (key, plaintext, ciphertext)
+ARCFOUR_VECTORS = [
+    ("Key", "Plaintext", "bbf316e8d940af0ad3"),
+    ("Wiki", "pedia", "1021bf0420"),
+    ("Secret", "Attack at dawn", "45a01f645fc35b383552544b9bf5")
+]
+
+# IEEE 1619 vectors 1, 2 and 15 (ciphertext stealing):
+# (key, sector, plaintext, ciphertext)
+XTS_VECTORS = [
+    ("00" * 32, 0, "00" * 32,
+     "917cf69ebd68b2ec9b9fe9a3eadda692cd43d2f59598ed858c02c2652fbf922e"),
+    ("11" * 16 + "22" * 16, 0x3333333333, "44" * 32,
+     "c454185e6a16936e39334038acef838bfb186fff7480adc4289382ecd6d394f0"),
+    ("fffefdfcfbfaf9f8f7f6f5f4f3f2f1f0bfbebdbcbbbab9b8b7b6b5b4b3b2b1b0", 0x123456789a,
+     "000102030405060708090a0b0c0d0e0f10", "6c1625db4671522d3d7599601de7ca09ed")
+]
+
+# chacha.py's round structure differs from RFC 8439, so there are no published
+# vectors for it. These were captured from the reference implementation and
+# guard against regressions: (key, IV, plaintext, ciphertext)
+CHACHA_VECTORS = [
+    ("000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f",
+     "000000090000004a00000000", "Ladies and Gentlemen of the class of 99",
+     "2fd00467c5d3b632c322453360506447d51a060905de2ee5df09fa9fb1c8368cbb93fd5d913c9150")
+]
+
+# Characters used to build random text inputs (multi-byte UTF-8 included)
+TEXT_CHARS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 .,!?这是一条编码的消息هذه رسالة"
+ERROR = "<error>"
+# Minimum number of blocks in the payloads the parallel modes are checked on
+PARALLEL_BLOCKS = 128
+
+def outcome(function, *args, **kwargs):
+    '''
+        Function which calls <function> and returns its result, or ERROR if
+        it raised
+    '''
+    try:
+        return function(*args, **kwargs)
+    except Exception:
+        return ERROR
+
+def random_text(rng, length):
+    '''
+        Function which generates a random string of <length> characters
+    '''
+    return ''.join(rng.choice(TEXT_CHARS) for i in range(length))
+
+def edge_lengths(rng, block_size):
+    '''
+        Function which returns the payload lengths to test for a block size:
+        the padding edge cases plus a random length
+    '''
+    return [0, 1, block_size - 1, block_size, block_size + 1, 2 * block_size,
+            rng.randrange(4 * block_size)]
+
+def check_known_answers():
+    '''
+        Function which checks the reference and every engine against the
+        known-answer vectors. Returns a list of failure messages.
+    '''
+    failures = []
+
+    for key, plaintext, expected in AES_VECTORS:
+        result = aes.do_aes(aes.bytearray_to_bitarray(bytes.fromhex(plaintext)),
+                            aes.bytearray_to_bitarray(bytes.fromhex(key)))
+        if result != expected:
+            failures.append(f"AES [reference] known answer failed for key {key}")
+        for name, engine in aes.ENGINES.items():
+            result = engine(bytes.fromhex(key), "ECB", None, bytes.fromhex(plaintext))
+            if result.hex() != expected:
+                failures.append(f"AES [{name}] known answer failed for key {key}")
+            result = engine(bytes.fromhex(key), "ECB", None, bytes.fromhex(expected), decrypt=True)
+            if result.hex() != plaintext:
+                failures.append(f"AES [{name}] known answer decryption failed for key {key}")
+
+    for key, plaintext, expected in DES_VECTORS:
+        result = des.do_block(des.bytearray_to_bitarray(bytes.fromhex(plaintext)),
+                              des.bytearray_to_bitarray(bytes.fromhex(key)))
+        if f"{int(''.join(str(b) for b in result), 2):016x}" != expected:
+            failures.append(f"DES [reference] known answer failed for key {key}")
+        for name, engine in des.ENGINES.items():
+            result = engine(bytes.fromhex(key), "ECB", None, bytes.fromhex(plaintext))
+            if result.hex() != expected:
+                failures.append(f"DES [{name}] known answer failed for key {key}")
+            result = engine(bytes.fromhex(key), "ECB", None, bytes.fromhex(expected), decrypt=True)
+            if result.hex() != plaintext:
+                failures.append(f"DES [{name}] known answer decryption failed for key {key}")
+
+    for key, plaintext, expected in ARCFOUR_VECTORS:
+        for name in ["reference"] + list(arcfour.ENGINES):
+            result = arcfour.arcfour_parse(plaintext, key=key.encode('utf-8').hex(), engine=name)
+            if result[0] != expected:
+                failures.append(f"ArcFour [{name}] known answer failed for key {key!r}")
+
+    for key, IV, plaintext, expected in CHACHA_VECTORS:
+        for name in ["reference"] + list(chacha.ENGINES):
+            result = chacha.chacha_parse(plaintext, key=key, IV=IV, engine=name)
+            if result[0] != expected:
+                failures.append(f"ChaCha [{name}] regression vector failed for key {key}")
+
+    for key, sector, plaintext, expected in XTS_VECTORS:
+        for name in aes.ENGINES:
+            cipher = xts.XTSCipher(key, sector_size=32, engine=name)
+            if cipher.encrypt(bytes.fromhex(plaintext), sector).hex() != expected:
+                failures.append(f"XTS [{name}] known answer failed for key {key}")
+            if cipher.decrypt(bytes.fromhex(expected), sector).hex() != plaintext:
+                failures.append(f"XTS [{name}] known answer decryption failed for key {key}")
+    return failures
+
+def compare(failures, label, reference, optimised):
+    '''
+        Function which records a failure if two outcomes differ
+    '''
+    if reference != optimised:
+        failures.append(f"{label}: expected {reference!r}, got {optimised!r}")
+
+def check_block_cipher(name, encrypt, decrypt, engines, modes, key_sizes, block_size, rng, trials):
+    '''
+        Function which differentially checks every engine of a block cipher
+        against its reference. Returns a list of failure messages and the
+        number of comparisons made.
+    '''
+    failures = []
+    comparisons = 0
+    for engine in engines:
+        for mode in modes:
+            for trial in range(trials):
+                for length in edge_lengths(rng, block_size):
+                    key = rng.randbytes(rng.choice(key_sizes)).hex()
+                    wrong_key = rng.randbytes(len(key) // 2).hex()
+                    IV = rng.randbytes(block_size).hex()
+                    label = f"{name} [{engine}] {mode} length={length} key={key} IV={IV}"
+
+                    # Binary (ransom) payloads
+                    data = rng.randbytes(length)
+                    expected = outcome(encrypt, bytearray(data), key=key, mode=mode, IV=IV, ransom=True, engine="reference")
+                    compare(failures, label, expected,
+                            outcome(encrypt, bytearray(data), key=key, mode=mode, IV=IV, ransom=True, engine=engine))
+                    if expected != ERROR:
+                        cipher_bytes = bytearray.fromhex(expected[0])
+                        for decrypt_key in (key, wrong_key):
+                            compare(failures, f"{label} decrypt key={decrypt_key}",
+                                    outcome(decrypt, bytearray(cipher_bytes), decrypt_key, mode=mode, IV=IV, ransom=True, engine="reference"),
+                                    outcome(decrypt, bytearray(cipher_bytes), decrypt_key, mode=mode, IV=IV, ransom=True, engine=engine))
+                            comparisons += 1
+
+                    # Text payloads
+                    text = random_text(rng, length)
+                    expected = outcome(encrypt, text, key=key, mode=mode, IV=IV, engine="reference")
+                    compare(failures, f"{label} text", expected,
+                            outcome(encrypt, text, key=key, mode=mode, IV=IV, engine=engine))
+                    if expected != ERROR:
+                        compare(failures, f"{label} text decrypt",
+                                outcome(decrypt, expected[0], key, mode=mode, IV=IV, engine="reference"),
+                                outcome(decrypt, expected[0], key, mode=mode, IV=IV, engine=engine))
+                        comparisons += 1
+                    comparisons += 2
+    return failures, comparisons
+
+def check_chacha(rng, trials):
+    '''
+        Function which differentially checks every ChaCha engine against the
+        reference. Returns a list of failure messages and the number of
+        comparisons made.
+    '''
+    failures = []
+    comparisons = 0
+    for engine in chacha.ENGINES:
+        for trial in range(trials):
+            for length in edge_lengths(rng, 64) + [3, 5]:
+                key = rng.randbytes(rng.choice([16, 32])).hex()
+                IV = rng.randbytes(12).hex()
+                rounds = rng.choice(list(chacha.ROUND_TIERS.values()))
+                label = f"ChaCha [{engine}] length={length} rounds={rounds} key={key} IV={IV}"
+
+                data = rng.randbytes(length)
+                expected = outcome(chacha.chacha_parse, bytearray(data), key=key, IV=IV, ransom=True, engine="reference", rounds=rounds)
+                compare(failures, label, expected,
+                        outcome(chacha.chacha_parse, bytearray(data), key=key, IV=IV, ransom=True, engine=engine, rounds=rounds))
+                if expected != ERROR:
+                    compare(failures, f"{label} decrypt",
+                            outcome(chacha.chacha_parse, bytearray.fromhex(expected[0]), key=key, IV=IV, decrypt=True, ransom=True, engine="reference", rounds=rounds),
+                            outcome(chacha.chacha_parse, bytearray.fromhex(expected[0]), key=key, IV=IV, decrypt=True, ransom=True, engine=engine, rounds=rounds))
+                    comparisons += 1
+
+                text = random_text(rng, length)
+                expected = outcome(chacha.chacha_parse, text, key=key, IV=IV, engine="reference", rounds=rounds)
+                compare(failures, f"{label} text", expected,
+                        outcome(chacha.chacha_parse, text, key=key, IV=IV, engine=engine, rounds=rounds))
+                if expected != ERROR:
+                    compare(failures, f"{label} text decrypt",
+                            outcome(chacha.chacha_parse, expected[0], key=key, IV=IV, decrypt=True, engine="reference", rounds=rounds),
+                            outcome(chacha.chacha_parse, expected[0], key=key, IV=IV, decrypt=True, engine=engine, rounds=rounds))
+                    comparisons += 1
+                comparisons += 2
+    return failures, comparisons
+
+def check_arcfour(rng, trials):
+    '''
+        Function which differentially checks every ArcFour engine against the
+        reference. Returns a list of failure messages and the number of
+        comparisons made.
+    '''
+    failures = []
+    comparisons = 0
+    for engine in arcfour.ENGINES:
+        for trial in range(trials):
+            for length in edge_lengths(rng, 256):
+                key = rng.randbytes(rng.randrange(5, 33)).hex()
+                label = f"ArcFour [{engine}] length={length} key={key}"
+
+                data = rng.randbytes(length)
+                expected = outcome(arcfour.arcfour_parse, bytearray(data), key=key, ransom=True, engine="reference")
+                compare(failures, label, expected,
+                        outcome(arcfour.arcfour_parse, bytearray(data), key=key, ransom=True, engine=engine))
+                if expected != ERROR:
+                    compare(failures, f"{label} decrypt",
+                            outcome(arcfour.arcfour_parse, bytearray.fromhex(expected[0]), key=key, decrypt=True, ransom=True, engine="reference"),
+                            outcome(arcfour.arcfour_parse, bytearray.fromhex(expected[0]), key=key, decrypt=True, ransom=True, engine=engine))
+                    comparisons += 1
+
+                text = random_text(rng, length)
+                expected = outcome(arcfour.arcfour_parse, text, key=key, engine="reference")
+                compare(failures, f"{label} text", expected,
+                        outcome(arcfour.arcfour_parse, text, key=key, engine=engine))
+                if expected != ERROR:
+                    compare(failures, f"{label} text decrypt",
+                            outcome(arcfour.arcfour_parse, expected[0], key=key, decrypt=True, engine="reference"),
+                            outcome(arcfour.arcfour_parse, expected[0], key=key, decrypt=True, engine=engine))
+                    comparisons += 1
+                comparisons += 2
+    return failures, comparisons
+
+def check_bitsliced(rng, trials):
+    '''
+        Function which checks the bitsliced ciphers against the reference
+        block functions (do_aes, undo_aes and do_des), and their parallel modes against the per-block modes
+        on payloads of PARALLEL_BLOCKS blocks or more. Returns a list of failure
+        messages and the number of comparisons made.
+    '''
+    failures = []
+    comparisons = 0
+    for trial in range(trials):
+        for key_size in [16, 24, 32]:
+            key = rng.randbytes(key_size)
+            cipher = bitslice.BitslicedAES(aes.expand_key(key))
+            data = rng.randbytes(16 * rng.randrange(1, 20))
+            key_bits = aes.bytearray_to_bitarray(bytearray(key))
+            encrypted = cipher.encrypt_bytes(data)
+            decrypted = cipher.decrypt_bytes(data)
+            for i in range(0, len(data), 16):
+                block = aes.bytearray_to_bitarray(bytearray(data[i : i + 16]))
+                label = f"AES [bitsliced] key={key.hex()} block={data[i : i + 16].hex()}"
+                compare(failures, label, aes.do_aes(block, key_bits), encrypted[i : i + 16].hex())
+                compare(failures, f"{label} decrypt", aes.undo_aes(block, key_bits), decrypted[i : i + 16].hex())
+                comparisons += 2
+
+            data = rng.randbytes(16 * rng.randrange(PARALLEL_BLOCKS, 3 * PARALLEL_BLOCKS))
+            IV = rng.randbytes(16)
+            for mode, decrypt in sorted(block_modes.PARALLEL_MODES):
+                compare(failures, f"AES [bitsliced] {mode} decrypt={decrypt} key={key.hex()} IV={IV.hex()}",
+                        block_modes.run_mode(aes.aes_context(key), mode, data, IV, 16, decrypt=decrypt),
+                        block_modes.run_parallel(cipher, mode, data, IV, 16, decrypt=decrypt))
+                comparisons += 1
+
+        key = rng.randbytes(rng.choice(des.KEY_SIZES))
+        cipher = des.des_bitsliced(key)
+        data = rng.randbytes(8 * rng.randrange(1, 20))
+        key_bits = des.bytearray_to_bitarray(bytearray(key))
+        encrypted = cipher.encrypt_bytes(data)
+        decrypted = cipher.decrypt_bytes(data)
+        for i in range(0, len(data), 8):
+            block = des.bytearray_to_bitarray(bytearray(data[i : i + 8]))
+            label = f"DES [bitsliced] key={key.hex()} block={data[i : i + 8].hex()}"
+            for result, decrypt in ((encrypted, False), (decrypted, True)):
+                expected = int(''.join(str(b) for b in des.do_block(block, key_bits, decrypt=decrypt)), 2)
+                compare(failures, f"{label} decrypt={decrypt}", f"{expected:016x}", result[i : i + 8].hex())
+                comparisons += 1
+
+        data = rng.randbytes(8 * rng.randrange(PARALLEL_BLOCKS, 3 * PARALLEL_BLOCKS))
+        IV = rng.randbytes(8)
+        for mode, decrypt in sorted(block_modes.PARALLEL_MODES):
+            compare(failures, f"DES [bitsliced] {mode} decrypt={decrypt} key={key.hex()} IV={IV.hex()}",
+                    block_modes.run_mode(des.des_context(key), mode, data, IV, 8, decrypt=decrypt),
+                    block_modes.run_parallel(cipher, mode, data, IV, 8, decrypt=decrypt))
+            comparisons += 1
+    return failures, comparisons
+
+def xts_blocks(cipher, data, first_sector, decrypt=False):
+    '''
+        Function which runs AES-XTS one block at a time, sector by sector,
+        as the oracle for the batched XTSCipher
+    '''
+    context = aes.aes_context(cipher.data_key)
+    tweak_context = aes.aes_context(cipher.tweak_key)
+    output = b''
+    for i in range(0, len(data), cipher.sector_size):
+        sector = data[i : i + cipher.sector_size]
+        number = int.from_bytes((first_sector + i // cipher.sector_size).to_bytes(16, 'little'), 'big')
+        tweak = int.from_bytes(tweak_context.encrypt_block(number).to_bytes(16, 'big'), 'little')
+        blocks = len(sector) // 16 - (1 if len(sector) % 16 else 0)
+        for j in range(blocks):
+            output += cipher.block(context, sector[16 * j : 16 * j + 16], tweak, decrypt)
+            tweak = xts.multiply_alpha(tweak)
+        if len(sector) % 16:
+            output += cipher.steal(sector[16 * blocks:], tweak, xts.multiply_alpha(tweak), decrypt)
+    return output
+
+def check_xts(rng, trials):
+    '''
+        Function which checks batched AES-XTS against the block-by-block
+        computation for every engine, and random patches through XTSFile
+        against encrypting the whole patched plaintext. Returns a list of
+        failure messages and the number of comparisons made.
+    '''
+    failures = []
+    comparisons = 0
+    for engine in aes.ENGINES:
+        for trial in range(trials):
+            key = rng.randbytes(rng.choice(xts.KEY_SIZES))
+            sector_size = rng.choice([16, 48, 512])
+            cipher = xts.XTSCipher(key, sector_size, engine)
+            for length in [16, 17, sector_size, sector_size + 16, rng.randrange(16, 6 * sector_size)]:
+                if 0 < length % sector_size < 16:
+                    length -= length % sector_size
+                data = rng.randbytes(length)
+                first = rng.randrange(2**40)
+                label = f"XTS [{engine}] length={length} sector_size={sector_size} first={first} key={key.hex()}"
+                compare(failures, label, xts_blocks(cipher, data, first), cipher.encrypt(data, first))
+                compare(failures, f"{label} decrypt", xts_blocks(cipher, data, first, True), cipher.decrypt(data, first))
+                compare(failures, f"{label} round trip", data, cipher.decrypt(cipher.encrypt(data, first), first))
+                comparisons += 3
+
+            plaintext = bytearray()
+            with xts.XTSFile(io.BytesIO(), key, sector_size, engine) as volume:
+                for patch in range(8):
+                    offset = rng.randrange(len(plaintext) + sector_size)
+                    data = rng.randbytes(rng.randrange(1, 3 * sector_size))
+                    size = max(len(plaintext), offset + len(data))
+                    try:
+                        volume.write(offset, data)
+                    except ValueError:
+                        if not 0 < size % sector_size < 16:
+                            failures.append(f"XTS [{engine}] file write of {len(data)} bytes at {offset} failed")
+                        continue
+                    plaintext += bytes(max(0, offset - len(plaintext)))
+                    plaintext[offset : offset + len(data)] = data
+                    start = rng.randrange(len(plaintext))
+                    compare(failures, f"XTS [{engine}] file read at {start}",
+                            bytes(plaintext[start : start + 100]), volume.read(start, 100))
+                    comparisons += 1
+                volume.file.seek(0)
+                compare(failures, f"XTS [{engine}] file contents sector_size={sector_size} key={key.hex()}",
+                        cipher.encrypt(plaintext).hex(), volume.file.read().hex())
+                comparisons += 1
+    return failures, comparisons
+
+def verify(trials=2, seed=None, verbose=True):
+    '''
+        Function which runs the known-answer and differential checks.
+
+        Inputs:
+            trials      (int)    - Number of random rounds per engine/mode
+            seed        (int)    - Seed for the random inputs, so a failure
+                                    can be reproduced. Random if None
+            verbose     (bool)   - Whether to print a summary per cipher
+        Returns:
+            failures    (list)   - Failure messages (empty if all passed)
+    '''
+    seed = random.randrange(2**32) if seed is None else seed
+    rng = random.Random(seed)
+    if verbose:
+        print(f"Verifying engines with seed {seed}")
+
+    failures = check_known_answers()
+    if verbose:
+        print(f"Known-answer vectors: {'OK' if not failures else f'{len(failures)} failure(s)'}")
+
+    checks = [
+        ("AES", lambda: check_block_cipher("AES", aes.aes_encrypt, aes.aes_decrypt, aes.ENGINES,
+                                           aes.MODES, [16, 24, 32], 16, rng, trials)),
+        ("DES", lambda: check_block_cipher("DES", des.encrypt_des, des.decrypt_des, des.ENGINES,
+                                           des.MODES, des.KEY_SIZES, 8, rng, trials)),
+        ("Bitsliced", lambda: check_bitsliced(rng, trials)),
+        ("ChaCha", lambda: check_chacha(rng, trials)),
+        ("ArcFour", lambda: check_arcfour(rng, trials)),
+        ("XTS", lambda: check_xts(rng, trials))
+    ]
+    for name, check in checks:
+        cipher_failures, comparisons = check()
+        failures += cipher_failures
+        if verbose:
+            print(f"{name}: {comparisons} comparisons, {len(cipher_failures)} mismatch(es)")
+    return failures
+
+if __name__ == "__main__":
+    trials = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    failures = verify(trials, seed)
+    for failure in failures:
+        print(failure)
+    if failures:
+        print(f"\n{len(failures)} mismatch(es) found!")
+        sys.exit(1)
+    print("\nAll engines match the reference implementations!")
@@ -0,0 +1,329 @@
+'''
+    Module which handles AES in XTS mode (IEEE 1619) for sector-addressable
+    storage such as disk images.
+
+    XTS encrypts each data unit (sector) independently under a tweak derived
+    from its sector number, so any sector can be read or rewritten without
+    touching its neighbours. The key is two AES keys of equal length: the
+    first encrypts the data and the second encrypts the sector number into
+    the sector's initial tweak, which is multiplied by alpha in GF(2^128)
+    for every following block.
+
+    Sectors are a multiple of the block size, but the final sector of a file
+    may be shorter. If it does not end on a block boundary, the last two
+    blocks use ciphertext stealing, so the ciphertext is exactly as long as
+    the plaintext. A sector shorter than one block cannot be encrypted.
+
+    Within a call, every full block of every sector is independent, so they
+    are XORed with their tweaks and handed to one batch cipher call (the
+    table, NumPy or bitsliced cipher picked by the engine), leaving only the
+    stolen blocks of a ragged tail to the single-block cipher.
+
+    XTSFile reads and writes byte or sector ranges of an encrypted file,
+    decrypting and re-encrypting only the sectors a call touches.
+'''
+import os
+
+import aes
+import engines
+import instrumentation
+import nonces
+
+BLOCK_SIZE = 16
+SECTOR_SIZE = 512
+# Lengths of the combined data and tweak keys, in bytes
+KEY_SIZES = [32, 48, 64]
+# Reduction of x^128 in GF(2^128), for the little-endian tweak multiplication
+FEEDBACK = 0x87
+MASK = (1 << 128) - 1
+
+def generate_key(key_bits=128):
+    '''
+        Function which generates an XTS key (two AES keys of <key_bits>
+        bits) as a hexadecimal string
+    '''
+    if key_bits not in aes.ROUND_KEY_LENGTHS:
+        raise ValueError(f"Key size must be one of {list(aes.ROUND_KEY_LENGTHS)} bits")
+    return nonces.token_bytes(key_bits // 4).hex()
+
+def split_key(key):
+    '''
+        Function which splits an XTS key, given as bytes or a hexadecimal
+        string, into its data key and tweak key
+    '''
+    key = bytes.fromhex(key) if isinstance(key, str) else bytes(key)
+    if len(key) not in KEY_SIZES:
+        raise ValueError(f"XTS key must be {', '.join(str(size) for size in KEY_SIZES)} bytes, not {len(key)}")
+    half = len(key) // 2
+    return key[:half], key[half:]
+
+def check_sector_size(sector_size):
+    '''
+        Function which rejects sector sizes which are not a positive multiple
+        of the block size
+    '''
+    if sector_size < BLOCK_SIZE or sector_size % BLOCK_SIZE:
+        raise ValueError(f"Sector size must be a positive multiple of {BLOCK_SIZE} bytes")
+    return sector_size
+
+def multiply_alpha(tweak):
+    '''
+        Function which multiplies a tweak (the little-endian integer of its
+        16 bytes) by alpha in GF(2^128)
+    '''
+    tweak <<= 1
+    if tweak >> 128:
+        tweak = (tweak & MASK) ^ FEEDBACK
+    return tweak
+
+def tweak_sequence(tweak, count):
+    '''
+        Function which returns the tweaks of <count> consecutive blocks as a
+        list of integers, starting from <tweak>
+    '''
+    tweaks = []
+    for i in range(count):
+        tweaks.append(tweak)
+        tweak = multiply_alpha(tweak)
+    return tweaks
+
+def xor_bytes(data, mask):
+    '''
+        Function which XORs two byte strings of equal length
+    '''
+    return (int.from_bytes(data, 'big') ^ int.from_bytes(mask, 'big')).to_bytes(len(data), 'big')
+
+class XTSCipher:
+    '''
+        Class which encrypts/decrypts runs of consecutive sectors with AES-XTS.
+
+        Inputs:
+            key         (bytes)  - Data key followed by tweak key (32, 48 or
+                                    64 bytes, or the same as a hex string)
+            sector_size (int)    - Data unit size in bytes
+            engine      (str)    - AES engine for the bulk of the blocks
+                                    ("table", "numpy", "bitslice"), or None
+                                    for the module's ENGINE
+    '''
+    def __init__(self, key, sector_size=SECTOR_SIZE, engine=None):
+        self.data_key, self.tweak_key = split_key(key)
+        self.sector_size = check_sector_size(sector_size)
+        self.engine = engine
+
+    def batch_cipher(self, key, blocks, decrypt=False):
+        '''
+            Function which returns the batch cipher for <blocks> blocks under
+            <key>. The reference engine has no batch cipher, so it uses the
+            table engine, which gives identical output.
+        '''
+        engine = engines.resolve("aes", self.engine, ENGINE, "ECB", blocks * BLOCK_SIZE, decrypt)
+        if engine == "reference":
+            engine = "table"
+        return aes.lane_cipher(engine, key)
+
+    def sector_tweaks(self, first_sector, count):
+        '''
+            Function which returns the initial tweaks of <count> sectors from
+            <first_sector>, as little-endian integers
+        '''
+        numbers = b''.join((first_sector + i).to_bytes(BLOCK_SIZE, 'little') for i in range(count))
+        encrypted = self.batch_cipher(self.tweak_key, count).encrypt_bytes(numbers)
+        return [int.from_bytes(encrypted[i : i + BLOCK_SIZE], 'little') for i in range(0, len(encrypted), BLOCK_SIZE)]
+
+    def transform(self, data, first_sector=0, decrypt=False):
+        '''
+            Function which encrypts/decrypts consecutive sectors.
+
+            Inputs:
+                data         (bytes) - Whole sectors, the last of which may
+                                        be short (but at least one block)
+                first_sector (int)   - Sector number of the first sector
+                decrypt      (bool)  - Whether to decrypt
+            Returns:
+                output       (bytes) - Data of the same length
+        '''
+        data = bytes(data)
+        if not data:
+            return b''
+        if first_sector < 0:
+            raise ValueError("Sector numbers cannot be negative")
+        count = -(-len(data) // self.sector_size)
+        tail = len(data) - (count - 1) * self.sector_size
+        if tail < BLOCK_SIZE:
+            raise ValueError(f"The last sector is {tail} bytes; XTS needs at least {BLOCK_SIZE}")
+        ragged = tail % BLOCK_SIZE
+
+        # Every block is batched except the two blocks of a ragged tail,
+        # whose tweaks are kept for the ciphertext stealing
+        tweaks = []
+        for i, tweak in enumerate(self.sector_tweaks(first_sector, count)):
+            length = self.sector_size if i < count - 1 else tail
+            tweaks += tweak_sequence(tweak, -(-length // BLOCK_SIZE))
+        if ragged:
+            *tweaks, stolen, following = tweaks
+        body_length = len(tweaks) * BLOCK_SIZE
+        output = b''
+        if tweaks:
+            mask = b''.join(tweak.to_bytes(BLOCK_SIZE, 'little') for tweak in tweaks)
+            cipher = self.batch_cipher(self.data_key, len(tweaks), decrypt)
+            with instrumentation.timed("aes", "cipher", len(tweaks)):
+                mixed = xor_bytes(data[:body_length], mask)
+                mixed = cipher.decrypt_bytes(mixed) if decrypt else cipher.encrypt_bytes(mixed)
+                output = xor_bytes(mixed, mask)
+        if ragged:
+            output += self.steal(data[body_length:], stolen, following, decrypt)
+        return output
+
+    def steal(self, tail, tweak, following, decrypt=False):
+        '''
+            Function which encrypts/decrypts the last full block and the
+            partial block of a ragged sector with ciphertext stealing.
+            <tweak> and <following> are the tweaks of the two blocks.
+        '''
+        context = aes.aes_context(self.data_key)
+        partial = len(tail) - BLOCK_SIZE
+        if decrypt:
+            tweak, following = following, tweak
+        whole = self.block(context, tail[:BLOCK_SIZE], tweak, decrypt)
+        last = self.block(context, tail[BLOCK_SIZE:] + whole[partial:], following, decrypt)
+        return last + whole[:partial]
+
+    def block(self, context, block, tweak, decrypt=False):
+        '''
+            Function which encrypts/decrypts a single block under its tweak
+        '''
+        tweak = int.from_bytes(tweak.to_bytes(BLOCK_SIZE, 'little'), 'big')
+        block = int.from_bytes(block, 'big') ^ tweak
+        block = context.decrypt_block(block) if decrypt else context.encrypt_block(block)
+        return (block ^ tweak).to_bytes(BLOCK_SIZE, 'big')
+
+    def encrypt(self, data, first_sector=0):
+        '''
+            Function which encrypts consecutive sectors starting at sector
+            <first_sector>
+        '''
+        return self.transform(data, first_sector)
+
+    def decrypt(self, data, first_sector=0):
+        '''
+            Function which decrypts consecutive sectors starting at sector
+            <first_sector>
+        '''
+        return self.transform(data, first_sector, decrypt=True)
+
+class XTSFile:
+    '''
+        Class which reads and patches an XTS-encrypted file by byte or sector
+        range. Only the sectors a call touches are read, decrypted,
+        re-encrypted and written.
+
+        Inputs:
+            file        (str/file) - Path of the file (created if missing),
+                                      or a binary file object opened for
+                                      reading and writing
+            key         (bytes)    - XTS key (see XTSCipher)
+            sector_size (int)      - Data unit size in bytes
+            engine      (str)      - AES engine, or None for the module's ENGINE
+    '''
+    def __init__(self, file, key, sector_size=SECTOR_SIZE, engine=None):
+        self.cipher = XTSCipher(key, sector_size, engine)
+        self.sector_size = sector_size
+        self._owned = not hasattr(file, "read")
+        if self._owned:
+            self.file = open(file, 'r+b' if os.path.exists(file) else 'w+b')
+        else:
+            self.file = file
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+    def close(self):
+        '''
+            Function which flushes the file, closing it if it was opened here
+        '''
+        self.file.flush()
+        if self._owned:
+            self.file.close()
+
+    @property
+    def size(self):
+        '''
+            The length of the file in bytes
+        '''
+        return self.file.seek(0, os.SEEK_END)
+
+    @property
+    def sectors(self):
+        '''
+            The number of sectors in the file, counting a short last sector
+        '''
+        return -(-self.size // self.sector_size)
+
+    def read_sectors(self, first_sector, count=1):
+        '''
+            Function which reads and decrypts <count> sectors from
+            <first_sector>, stopping at the end of the file
+        '''
+        self.file.seek(first_sector * self.sector_size)
+        return self.cipher.decrypt(self.file.read(count * self.sector_size), first_sector)
+
+    def write_sectors(self, first_sector, data):
+        '''
+            Function which encrypts and writes whole sectors from
+            <first_sector>. The data may end with a short sector only if it
+            reaches the end of the file, and may not start past the end.
+        '''
+        offset = first_sector * self.sector_size
+        size = self.size
+        if offset > size:
+            raise ValueError(f"Sector {first_sector} starts past the end of the file")
+        if len(data) % self.sector_size and offset + len(data) < size:
+            raise ValueError("Only the last sector of the file can be short")
+        self.file.seek(offset)
+        self.file.write(self.cipher.encrypt(data, first_sector))
+
+    def read(self, offset, length):
+        '''
+            Function which returns <length> plaintext bytes from <offset>,
+            decrypting only the sectors that hold them
+        '''
+        length = max(0, min(length, self.size - offset))
+        if not length:
+            return b''
+        first = offset // self.sector_size
+        last = (offset + length - 1) // self.sector_size
+        start = offset - first * self.sector_size
+        return self.read_sectors(first, last - first + 1)[start : start + length]
+
+    def write(self, offset, data):
+        '''
+            Function which writes plaintext <data> at <offset>, re-encrypting
+            only the sectors it touches. Writing past the end of the file
+            fills the gap with zeros.
+        '''
+        size = self.size
+        if offset > size:
+            data = bytes(offset - size) + bytes(data)
+            offset = size
+        if not data:
+            return
+        first = offset // self.sector_size
+        last = (offset + len(data) - 1) // self.sector_size
+        start = offset - first * self.sector_size
+        # The partly overwritten sectors at either end keep their other bytes
+        sectors = bytearray(self.read_sectors(first, last - first + 1))
+        sectors[start : start + len(data)] = data
+        self.write_sectors(first, sectors)
+
+ENGINE = "auto"
+
+if "__main__" == __name__:
+    # IEEE 1619 vector 1: all-zero keys and data in sector 0
+    cipher = XTSCipher(bytes(32), sector_size=32)
+    ciphertext = cipher.encrypt(bytes(32))
+    print(ciphertext.hex())
+    print(cipher.decrypt(ciphertext) == bytes(32))